@@ -0,0 +1,255 @@
+"""
+Vectorized calibration analytics — columnar NumPy core.
+
+Loads calibration history into flat arrays (datetime64[D] dates, int tool ids,
+categorical tool_type codes, boolean failure flags) and computes consecutive
+interval diffs, grouped means and failure ratios without per-row Python loops.
+
+    from analytics_core import CalibrationHistory, interval_variance, failure_rates
+    hist = CalibrationHistory.from_rows(calibrations, tools)
+    interval_variance(hist)   # same shape as /cal/analytics/interval-variance
+    failure_rates(hist)       # same shape as /cal/analytics/failure-rates
+
+The per-tenant reports are served by SQL functions (migration 019); this core
+is for Python-side work over the same history — reliability fitting, bulk
+cross-tenant runs, offline analysis. Benchmark: scripts/bench_analytics.py.
+"""
+
+from dataclasses import dataclass
+
+import numpy as np
+
+FAIL_RESULTS = ("fail", "out_of_tolerance")
+
+
+@dataclass
+class CalibrationHistory:
+    """One element per calibration record; tool attributes are broadcast per record."""
+    tool_id: np.ndarray      # int64
+    date: np.ndarray         # datetime64[D], NaT when missing
+    failed: np.ndarray       # bool
+    type_code: np.ndarray    # int32 index into type_names
+    type_names: np.ndarray   # str, sorted
+    planned: np.ndarray      # float64 cal_interval_days, NaN when unset
+
+    @classmethod
+    def from_rows(cls, calibrations: list, tools: list) -> "CalibrationHistory":
+        """Build from PostgREST rows: calibrations {tool_id, calibration_date, result},
+        tools {id, tool_type, cal_interval_days}. Records for unknown tools are dropped."""
+        tool_ids = np.array([t["id"] for t in tools], dtype=np.int64)
+        order = np.argsort(tool_ids)
+        tool_ids = tool_ids[order]
+        type_names, tool_type_code = np.unique(
+            np.array([t.get("tool_type") or "Unknown" for t in tools], dtype=object)[order].astype(str),
+            return_inverse=True,
+        )
+        tool_planned = np.array(
+            [t.get("cal_interval_days") or np.nan for t in tools], dtype=np.float64,
+        )[order]
+
+        cal_tool = np.array([c["tool_id"] for c in calibrations], dtype=np.int64)
+        pos = np.searchsorted(tool_ids, cal_tool)
+        pos_clipped = np.minimum(pos, max(len(tool_ids) - 1, 0))
+        known = (pos < len(tool_ids)) & (tool_ids[pos_clipped] == cal_tool) if len(tool_ids) else np.zeros(len(cal_tool), bool)
+        dates = np.array(
+            [str(c["calibration_date"])[:10] if c.get("calibration_date") else None for c in calibrations],
+            dtype="datetime64[D]",
+        )
+        results = np.array([c.get("result") or "" for c in calibrations], dtype=object)
+        failed = np.isin(results, FAIL_RESULTS)
+
+        idx = pos_clipped[known]
+        return cls(
+            tool_id=cal_tool[known],
+            date=dates[known],
+            failed=failed[known],
+            type_code=tool_type_code[idx].astype(np.int32),
+            type_names=type_names,
+            planned=tool_planned[idx],
+        )
+
+    def __len__(self) -> int:
+        return len(self.tool_id)
+
+
+@dataclass
+class Intervals:
+    """Consecutive-calibration intervals: one element per (previous, next) pair of a tool."""
+    tool_id: np.ndarray      # int64
+    days: np.ndarray         # int64, > 0
+    type_code: np.ndarray    # int32
+    planned: np.ndarray      # float64
+    failed_at_end: np.ndarray  # bool — the calibration closing the interval failed
+
+
+def intervals(hist: CalibrationHistory) -> Intervals:
+    """Sort by (tool, date) once and diff neighbours; keep same-tool, positive gaps."""
+    has_date = ~np.isnat(hist.date)
+    tool_id, dates = hist.tool_id[has_date], hist.date[has_date]
+    order = np.lexsort((dates, tool_id))
+    t = tool_id[order]
+    d = dates[order]
+    diff = np.diff(d).astype(np.int64)
+    keep = (t[1:] == t[:-1]) & (diff > 0)
+    end = order[1:][keep]
+    sel = np.flatnonzero(has_date)[end]
+    return Intervals(
+        tool_id=t[1:][keep],
+        days=diff[keep],
+        type_code=hist.type_code[sel],
+        planned=hist.planned[sel],
+        failed_at_end=hist.failed[sel],
+    )
+
+
+def interval_variance(hist: CalibrationHistory) -> list:
+    """Average actual interval vs planned cal_interval_days per tool_type."""
+    iv = intervals(hist)
+    mask = iv.planned > 0  # NaN compares False
+    codes, days, tools, planned = iv.type_code[mask], iv.days[mask], iv.tool_id[mask], iv.planned[mask]
+    if not len(codes):
+        return []
+    n_types = len(hist.type_names)
+    counts = np.bincount(codes, minlength=n_types)
+    sums = np.bincount(codes, weights=days, minlength=n_types)
+    # Planned days for a type = planned of its lowest tool id.
+    first = np.lexsort((tools, codes))
+    first = first[np.r_[True, codes[first][1:] != codes[first][:-1]]]
+    planned_by_type = np.full(n_types, np.nan)
+    planned_by_type[codes[first]] = planned[first]
+
+    present = np.flatnonzero(counts)
+    avg_actual = np.round(sums[present] / counts[present]).astype(np.int64)
+    plan = planned_by_type[present]
+    ratio = np.round(avg_actual / plan, 2)
+    result = [
+        {
+            "tool_type": str(hist.type_names[c]), "planned_days": int(p), "avg_actual_days": int(a),
+            "ratio": float(r), "sample_size": int(counts[c]),
+            "flag": "over-calibrating (cost waste)" if r < 0.8 else
+                    "under-calibrating (compliance risk)" if r > 1.2 else "on target",
+        }
+        for c, p, a, r in zip(present, plan, avg_actual, ratio)
+    ]
+    return sorted(result, key=lambda x: (x["ratio"], x["tool_type"]))
+
+
+def failure_rates(hist: CalibrationHistory, min_total: int = 3) -> list:
+    """Fail/OOT share per tool_type (types with >= min_total records), highest first."""
+    n_types = len(hist.type_names)
+    total = np.bincount(hist.type_code, minlength=n_types)
+    fails = np.bincount(hist.type_code, weights=hist.failed, minlength=n_types).astype(np.int64)
+    present = np.flatnonzero(total >= min_total)
+    pct = np.round(fails[present] * 100.0 / total[present], 1)
+    result = [
+        {"tool_type": str(hist.type_names[c]), "total": int(total[c]), "failures": int(fails[c]),
+         "failure_pct": float(p), "flagged": bool(p > 10)}
+        for c, p in zip(present, pct)
+    ]
+    return sorted(result, key=lambda x: (-x["failure_pct"], x["tool_type"]))
+
+
+# ── Reliability-based interval optimization ────────────────────────────────
+# Each interval is a current-status observation: the tool was put in service
+# calibrated, and at the closing calibration t days later it was either found
+# in tolerance or failed / out of tolerance. With a Weibull time-to-OOT,
+#   P(OOT by t) = 1 - exp(-(t / scale) ** shape)
+# which is a binomial GLM with complementary log-log link on x = ln t:
+#   cloglog(p) = a + shape * x,   scale = exp(-a / shape).
+# Exponential is the same model with shape fixed at 1. Every tool_type is
+# fitted at once by IRLS on grouped 2x2 normal equations (bincount sums).
+# One pseudo-observation (y = 0.5 at the group's mean ln t) keeps the fit
+# finite for groups with no failures or only failures.
+
+WEIBULL_MIN_FAILURES = 5        # fewer OOT events than this -> exponential
+WEIBULL_MIN_LOG_SPREAD = 0.1    # std of ln t below this cannot identify the shape
+WEIBULL_SHAPE_BOUNDS = (0.3, 8.0)
+MAX_INTERVAL_CHANGE = 2.0       # recommendations stay within [current / 2, current * 2]
+
+
+def _fit_cloglog(codes: np.ndarray, x: np.ndarray, y: np.ndarray, n_groups: int,
+                 fit_shape: bool, iterations: int = 30) -> tuple:
+    """Per-group IRLS for cloglog(P(y=1)) = a + b*x. Returns (a, b); b == 1 unless fit_shape."""
+    n = np.bincount(codes, minlength=n_groups)
+    x_bar = np.bincount(codes, weights=x, minlength=n_groups) / np.maximum(n, 1)
+    # Observations plus one pseudo-observation per group.
+    g = np.concatenate([codes, np.arange(n_groups)])
+    xs = np.concatenate([x, x_bar])
+    ys = np.concatenate([y, np.full(n_groups, 0.5)])
+
+    p0 = np.clip(np.bincount(g, weights=ys, minlength=n_groups) / (n + 1), 1e-6, 1 - 1e-6)
+    b = np.ones(n_groups)
+    a = np.log(-np.log1p(-p0)) - x_bar
+    for _ in range(iterations):
+        eta = a[g] + b[g] * xs
+        e = np.exp(np.clip(eta, -30, 5))
+        mu = np.clip(-np.expm1(-e), 1e-10, 1 - 1e-10)
+        d = e * np.exp(-e)
+        w = d * d / (mu * (1 - mu))
+        z = eta + (ys - mu) / np.maximum(d, 1e-300)
+        if fit_shape:
+            sw = np.bincount(g, weights=w, minlength=n_groups)
+            swx = np.bincount(g, weights=w * xs, minlength=n_groups)
+            swxx = np.bincount(g, weights=w * xs * xs, minlength=n_groups)
+            swz = np.bincount(g, weights=w * z, minlength=n_groups)
+            swxz = np.bincount(g, weights=w * xs * z, minlength=n_groups)
+            det = sw * swxx - swx * swx
+            ok = det > 1e-12
+            safe = np.where(ok, det, 1.0)
+            a = np.where(ok, (swxx * swz - swx * swxz) / safe, a)
+            b = np.where(ok, (sw * swxz - swx * swz) / safe, b)
+        else:
+            a = (np.bincount(g, weights=w * (z - xs), minlength=n_groups)
+                 / np.maximum(np.bincount(g, weights=w, minlength=n_groups), 1e-300))
+    return a, b
+
+
+def recommend_intervals(hist: CalibrationHistory, target: float = 0.95, min_intervals: int = 10) -> list:
+    """Fit per-tool_type reliability models and recommend the interval at which the
+    probability of still being in tolerance equals `target`."""
+    iv = intervals(hist)
+    if not len(iv.days):
+        return []
+    n_types = len(hist.type_names)
+    codes = iv.type_code
+    x = np.log(iv.days.astype(np.float64))
+    y = iv.failed_at_end.astype(np.float64)
+
+    n = np.bincount(codes, minlength=n_types)
+    r = np.bincount(codes, weights=y, minlength=n_types)
+    x_bar = np.bincount(codes, weights=x, minlength=n_types) / np.maximum(n, 1)
+    x_sd = np.sqrt(np.maximum(
+        np.bincount(codes, weights=x * x, minlength=n_types) / np.maximum(n, 1) - x_bar ** 2, 0))
+    planned_sum = np.bincount(codes, weights=np.nan_to_num(iv.planned), minlength=n_types)
+    planned_n = np.bincount(codes, weights=iv.planned > 0, minlength=n_types)
+    current = np.where(planned_n > 0, planned_sum / np.maximum(planned_n, 1), np.exp(x_bar))
+
+    a_exp, _ = _fit_cloglog(codes, x, y, n_types, fit_shape=False)
+    a_wb, b_wb = _fit_cloglog(codes, x, y, n_types, fit_shape=True)
+    use_weibull = ((r >= WEIBULL_MIN_FAILURES) & (x_sd >= WEIBULL_MIN_LOG_SPREAD)
+                   & (b_wb >= WEIBULL_SHAPE_BOUNDS[0]) & (b_wb <= WEIBULL_SHAPE_BOUNDS[1]))
+    a = np.where(use_weibull, a_wb, a_exp)
+    shape = np.where(use_weibull, b_wb, 1.0)
+
+    # Solve 1 - exp(-exp(a + shape * ln t)) = 1 - target for t.
+    raw = np.exp((np.log(-np.log(target)) - a) / shape)
+    recommended = np.clip(raw, current / MAX_INTERVAL_CHANGE, current * MAX_INTERVAL_CHANGE)
+    rel_current = np.exp(-np.exp(a + shape * np.log(current)))
+    scale = np.exp(-a / shape)
+
+    result = []
+    for c in np.flatnonzero(n >= min_intervals):
+        result.append({
+            "tool_type": str(hist.type_names[c]),
+            "model": "weibull" if use_weibull[c] else "exponential",
+            "shape": round(float(shape[c]), 3),
+            "scale_days": round(float(scale[c]), 1),
+            "intervals": int(n[c]),
+            "failures": int(r[c]),
+            "current_interval_days": int(round(current[c])),
+            "reliability_at_current": round(float(rel_current[c]), 4),
+            "target_reliability": target,
+            "recommended_interval_days": int(round(recommended[c])),
+            "clamped": bool(abs(raw[c] - recommended[c]) > 0.5),
+        })
+    return sorted(result, key=lambda x: x["reliability_at_current"])
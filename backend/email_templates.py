@@ -0,0 +1,152 @@
+"""
+Email bodies for the cron mailers.
+
+Each body is a function returning one f-string, and the tool table is built as
+a list of rows joined once. A str.format or Template pattern was tried and
+measured slower for these small bodies (~3us per render vs ~0.25us for the
+f-string; scripts/bench_email_templates.py), so the layouts stay as plain
+f-strings, just moved out of main.py.
+
+    from email_templates import overdue_body, render_tool_table
+    body = overdue_body(len(tools), render_tool_table(tools), signature)
+
+Output is byte-identical to the former inline f-strings in main.py.
+"""
+
+
+# ── tool table ──────────────────────────────────────────────────────────────
+
+_TOOL_TABLE_HEAD = """<table border="1" cellpadding="6" cellspacing="0" style="border-collapse:collapse;font-family:Helvetica,sans-serif;font-size:13px;">
+<tr style="background:#003366;color:white;"><th>Asset Tag</th><th>Tool Name</th><th>Type</th><th>Calibrating Entity</th><th>Due Date</th></tr>
+"""
+
+
+def render_tool_table(tools: list) -> str:
+    """HTML table of tools for alert emails: one row string per tool, joined once."""
+    rows = []
+    for t in tools:
+        ndd = t.get("next_due_date") or t.get("next_calibration_date") or "N/A"
+        if isinstance(ndd, str) and len(ndd) > 10:
+            ndd = ndd[:10]
+        rows.append(f"<tr><td>{t.get('asset_tag','')}</td><td>{t.get('tool_name','')}</td><td>{t.get('tool_type','')}</td>"
+                    f"<td>{t.get('calibrating_entity','')}</td><td>{ndd}</td></tr>\n")
+    return _TOOL_TABLE_HEAD + "".join(rows) + "</table>"
+
+
+# ── signature ───────────────────────────────────────────────────────────────
+
+def render_signature(branding: dict) -> str:
+    """Branded HTML email signature with AI agent disclaimer."""
+    co_name = branding.get("company_name", "Calibration Agent")
+    primary = branding.get("primary_color", "#003366")
+    accent = branding.get("accent_color", "#CC0000")
+    font = branding.get("font", "Helvetica")
+    phone = branding.get("phone", "")
+    web = branding.get("web", "")
+    address_lines = branding.get("address_lines", [])
+
+    address_html = "<br>".join(address_lines) if address_lines else ""
+    phone_html = f'<br>Phone: <a href="tel:{phone}" style="color:{primary};text-decoration:none;">{phone}</a>' if phone else ""
+    web_html = f'<br><a href="https://{web}" style="color:{primary};text-decoration:none;">{web}</a>' if web else ""
+
+    return f"""
+<div style="margin-top:32px;padding-top:16px;border-top:2px solid {primary};font-family:{font},Arial,sans-serif;">
+  <table cellpadding="0" cellspacing="0" border="0" style="font-size:13px;color:#333;">
+    <tr>
+      <td style="padding-right:16px;border-right:3px solid {accent};">
+        <strong style="font-size:15px;color:{primary};">Cal</strong>
+        <br><span style="font-size:11px;color:#666;">AI Calibration Agent</span>
+      </td>
+      <td style="padding-left:16px;">
+        <strong style="color:{primary};">{co_name}</strong>
+        <br><span style="font-size:12px;color:#555;">{address_html}</span>
+        {phone_html}
+        {web_html}
+      </td>
+    </tr>
+  </table>
+  <p style="font-size:10px;color:#999;margin-top:12px;line-height:1.4;">
+    This message was generated by Cal, an AI-powered calibration management agent
+    operated by {co_name} Quality Department.
+    For questions or corrections, contact your Quality Manager directly.
+  </p>
+  <p style="font-size:9px;color:#b0b0b0;margin-top:8px;line-height:1.3;font-style:italic;">
+    Cal is currently in supervised evaluation. Information provided is generated from
+    calibration records and should be independently verified against your quality
+    management system prior to taking action. {co_name} Quality Department maintains
+    full authority over all calibration decisions and compliance determinations.
+  </p>
+</div>
+"""
+
+
+# ── enforcement_scan bodies ─────────────────────────────────────────────────
+
+def overdue_body(count, table, signature) -> str:
+    return f"""<div style="font-family:Helvetica,sans-serif;">
+<h2 style="color:#CC0000;">[ACTION REQUIRED] {count} Overdue Calibrations</h2>
+<p>The following tools have <strong>expired calibrations</strong> and must be <strong>removed from service immediately</strong> per ISO 9001 and company policy.</p>
+{table}
+<p style="margin-top:16px;"><strong>Required actions:</strong></p>
+<ul>
+<li>Remove all listed tools from service NOW</li>
+<li>Tag with red "OUT OF CALIBRATION" labels</li>
+<li>Schedule calibration with approved vendor immediately</li>
+<li>Document removal in quality records</li>
+</ul>
+{signature}
+</div>"""
+
+
+def critical_body(count, table, signature) -> str:
+    return f"""<div style="font-family:Helvetica,sans-serif;">
+<h2 style="color:#CC6600;">[URGENT] {count} Calibrations Due Within 7 Days</h2>
+<p>The following tools require calibration within the next 7 days:</p>
+{table}
+<p><strong>Action:</strong> Schedule these calibrations immediately to avoid overdue status.</p>
+{signature}
+</div>"""
+
+
+def warning_body(count, table, signature) -> str:
+    return f"""<div style="font-family:Helvetica,sans-serif;">
+<h2 style="color:#003366;">[NOTICE] {count} Calibrations Due Within 30 Days</h2>
+<p>Plan ahead — the following tools need calibration soon:</p>
+{table}
+{signature}
+</div>"""
+
+
+def purchasing_body(count, table, signature) -> str:
+    return f"""<div style="font-family:Helvetica,sans-serif;">
+<h2 style="color:#003366;">[CAL REQUEST] {count} Tools Need Vendor Calibration</h2>
+<p>The following vendor-calibrated tools are due within 30 days. Please initiate purchase orders with the listed calibrating entities:</p>
+{table}
+<p><strong>Contact the Quality Department for vendor details and shipping instructions.</strong></p>
+{signature}
+</div>"""
+
+
+def milestone_body(color, subject, urgency, tag, name, tool_type, method, vendor, due, signature) -> str:
+    return f"""<div style="font-family:Helvetica,sans-serif;">
+<h2 style="color:{color};">{subject}</h2>
+<p>{urgency}</p>
+<table style="border-collapse:collapse;margin:12px 0;">
+<tr><td style="padding:4px 12px;font-weight:bold;">Asset Tag:</td><td>{tag}</td></tr>
+<tr><td style="padding:4px 12px;font-weight:bold;">Tool:</td><td>{name}</td></tr>
+<tr><td style="padding:4px 12px;font-weight:bold;">Type:</td><td>{tool_type}</td></tr>
+<tr><td style="padding:4px 12px;font-weight:bold;">Method:</td><td>{method}</td></tr>
+<tr><td style="padding:4px 12px;font-weight:bold;">Vendor:</td><td>{vendor}</td></tr>
+<tr><td style="padding:4px 12px;font-weight:bold;">Due Date:</td><td>{due}</td></tr>
+</table>
+{signature}
+</div>"""
+
+
+def milestone_digest_body(color, subject, urgency, table, signature) -> str:
+    return f"""<div style="font-family:Helvetica,sans-serif;">
+<h2 style="color:{color};">{subject}</h2>
+<p>{urgency}</p>
+{table}
+{signature}
+</div>"""
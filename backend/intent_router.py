@@ -0,0 +1,170 @@
+"""
+Canned intents for /cal/question.
+
+A handful of question shapes make up most of the agent's traffic — what's
+overdue, what's due this week/month, how many of a tool type, and the
+status, last calibration or vendor of one asset. classify() recognizes
+them with anchored patterns and extracts their parameters; main.py answers
+them with fixed, tenant-scoped PostgREST queries and a spoken-style
+template, without the multi-turn Claude loop. Anything else — open-ended
+questions (why, should, compare, trend, ...), negated ones ("what is not
+overdue"), other tenses or dates ("what was overdue in 2024"), and
+qualifiers an intent can't apply ("... in building 2") — returns None and
+falls through to the agent.
+
+    from intent_router import classify
+    classify("When is GP-0012 due?")             # Intent("asset_status", {"tag": "GP-0012"})
+    classify("Which snap gages are overdue?")    # Intent("overdue", {"type": "snap gages", ...})
+    classify("Why do snap gages fail?")          # None
+
+A "type" parameter is the raw phrase; main.py resolves it against the
+tenant's tool_type values and falls through when nothing matches.
+
+Classification is pure; nothing here touches the database.
+"""
+
+import re
+from dataclasses import dataclass, field
+
+MAX_WORDS = 16
+
+OPEN_ENDED = re.compile(
+    r"\b(why|should|recommend\w*|suggest\w*|compare|comparison|trend\w*|explain|analy[sz]\w*|"
+    r"predict\w*|improve|best|worst|risk\w*|compliance|audit\w*|interval\w*|and|or|except|excluding|"
+    r"between|before|after|since|email\w*|cost\w*|budget)\b"
+)
+
+# Negated questions ask the opposite of what the intent answers; other tenses
+# and dates ask about a different time. Time words are only allowed inside the
+# phrase an intent parses itself ("due next month", "last calibrated").
+NEGATION = re.compile(r"\b(not|no|never|none|nothing|neither|nor|without)\b|n't\b")
+TIME_SHIFT = re.compile(r"\b(will|would|was|were|did|had|been|going|used|last|next|ago|yesterday|previous(ly)?|ever|(19|20)\d{2})\b")
+NON_TYPE_WORDS = {"be", "been", "being", "did", "do", "does", "will", "was", "were", "in", "on", "at", "for", "by",
+                  "with", "from", "to", "this", "that", "which", "who", "week", "month", "year", "today", "tomorrow",
+                  "soon", "yet", "ever", "only", "also", "it", "they", "us", "you", "me", "my", "your", "their"}
+
+# Asset tags: letters, optional dash, digits (GP-0012, CAL0042, SG-12A).
+ASSET_TAG = re.compile(r"\b([a-z]{1,6}-?\d{2,}[a-z0-9-]*)\b", re.I)
+
+ASSET_LAST_CAL = re.compile(r"\b(last|latest|most recent|previous)\s+(cal\w*|cert\w*)\b|\bwhen was\b.*\bcalibrated\b")
+ASSET_VENDOR = re.compile(r"\b(vendor|who calibrates|calibrated by|calibrating entity|which lab|what lab)\b")
+ASSET_STATUS = re.compile(r"\b(status|when is\b.*\bdue|due date|is\b.*\b(due|overdue|current|calibrated|in cal\w*|out of cal\w*))\b")
+
+OVERDUE = re.compile(r"\b(overdue|past due|expired|out of cal\w*)\b")
+DUE_WINDOW = re.compile(
+    r"\bdue\b.*\b(?:(this|next)\s+(week|month)|(?:next|within|in)\s+(\d{1,3})\s+days?|(today|tomorrow))\b"
+    r"|\b(this|next)\s+(week|month)\b.*\bdue\b"
+)
+COUNT_BY_TYPE = re.compile(r"\b(by|per|each)\s+(tool\s+)?type\b|\bbreakdown\b")
+COUNT_TYPE = re.compile(r"^how many\s+([a-z][a-z -]*?)\s*(?:do we have|are there|have we got|in total|total|we have|exist)?$")
+LIST_WORDS = re.compile(r"^(what|which|list|show|show me|tell me|give me|any|anything|is anything|is there anything|"
+                        r"are there any|do we have any|how many)\b")
+SUBJECT = re.compile(
+    r"^(?:what|which|list|show me|show|tell me|give me|any|anything|is anything|is there anything|are there any|"
+    r"do we have any|how many)\s+(.*?)\s*\b(?:(?:are|is|were|will be)\s+)?(overdue|past due|expired|out of cal\w*|due)\b(.*)$"
+)
+GENERIC_WORDS = {"the", "our", "of", "tools", "tool", "equipment", "items", "item", "instruments", "instrument",
+                 "things", "assets", "asset", "gear", "is", "are", "there", "we", "have", "got", "do", "any", "all",
+                 "right", "now", "currently", "still", "calibrations", "calibration"}
+CONTRACTIONS = {"what's": "what is", "when's": "when is", "who's": "who is", "where's": "where is", "how's": "how is"}
+
+
+@dataclass
+class Intent:
+    name: str
+    params: dict = field(default_factory=dict)
+
+
+def normalize(question: str) -> str:
+    """Lowercase, unify apostrophes, strip trailing punctuation and filler."""
+    q = (question or "").lower().replace("’", "'").strip()
+    q = re.sub(r"[?.!]+$", "", q).strip()
+    q = re.sub(r"^(hey |hi |ok |okay )?(cal[, ]+)?(please |can you |could you )?", "", q)
+    q = re.sub(r"\b(" + "|".join(re.escape(c) for c in CONTRACTIONS) + r")", lambda m: CONTRACTIONS[m.group(1)], q)
+    return re.sub(r"\s+", " ", q).strip()
+
+
+def _subject(q: str, window: bool) -> tuple[str | None, bool]:
+    """Tool-type phrase a list question is narrowed to ("which snap gages are due" -> "snap gages"),
+    and whether the question is fully understood — False when a qualifier the intent can't
+    apply follows the keyword ("what's overdue in building 2")."""
+    m = SUBJECT.match(q)
+    if not m:
+        return None, True
+    words = [w for w in m.group(1).split() if w not in GENERIC_WORDS]
+    trailing = [w for w in m.group(3).split() if w not in GENERIC_WORDS]
+    if window:
+        trailing = []           # the due-window phrase follows; checked by the caller
+    elif not words:
+        words, trailing = trailing, []
+    phrase = " ".join(words) or None
+    return phrase, not trailing and (phrase is None or _type_phrase(phrase))
+
+
+def _type_phrase(phrase: str) -> bool:
+    """True when every word could be part of a tool_type name."""
+    return all(re.fullmatch(r"[a-z][a-z/-]*", w) and w not in NON_TYPE_WORDS for w in phrase.split())
+
+
+def _shifted(q: str, allowed: re.Match | None = None) -> bool:
+    """Tense/date words outside the span the intent itself parses."""
+    if allowed:
+        q = q[:allowed.start()] + " " + q[allowed.end():]
+    return bool(TIME_SHIFT.search(q))
+
+
+def classify(question: str) -> Intent | None:
+    q = normalize(question)
+    if not q or len(q.split()) > MAX_WORDS or OPEN_ENDED.search(q) or NEGATION.search(q):
+        return None
+
+    tags = ASSET_TAG.findall(question or "")
+    if tags:
+        if len(tags) > 1:
+            return None
+        tag = tags[0].upper()
+        q_rest = re.sub(re.escape(tags[0].lower()), " ", q)
+        m = ASSET_LAST_CAL.search(q_rest)
+        if m:
+            return None if _shifted(q_rest, m) else Intent("asset_last_cal", {"tag": tag})
+        if _shifted(q_rest):
+            return None
+        if ASSET_VENDOR.search(q_rest):
+            return Intent("asset_vendor", {"tag": tag})
+        if ASSET_STATUS.search(q_rest):
+            return Intent("asset_status", {"tag": tag})
+        return None
+
+    m = DUE_WINDOW.search(q)
+    if _shifted(q, m):
+        return None
+
+    if OVERDUE.search(q) and LIST_WORDS.search(q) and not m:
+        subject, understood = _subject(q, window=False)
+        if not understood:
+            return None
+        return Intent("overdue", {"count_only": q.startswith("how many"), "type": subject})
+
+    if m and LIST_WORDS.search(q):
+        which, unit, n_days, day = m.group(1) or m.group(5), m.group(2) or m.group(6), m.group(3), m.group(4)
+        if n_days:
+            params = {"from": 0, "to": int(n_days), "label": f"in the next {int(n_days)} days"}
+        elif day:
+            offset = 0 if day == "today" else 1
+            params = {"from": offset, "to": offset, "label": day}
+        else:
+            params = {"period": f"{which}_{unit}", "label": f"{which} {unit}"}
+        params["count_only"] = q.startswith("how many")
+        params["type"], understood = _subject(q, window=True)
+        if not understood or [w for w in q[m.end():].split() if w not in GENERIC_WORDS]:
+            return None
+        return Intent("due_window", params)
+
+    if COUNT_BY_TYPE.search(q) and re.search(r"\b(how many|count|number of|breakdown)\b", q):
+        return Intent("count_by_type")
+
+    m = COUNT_TYPE.match(q)
+    if m and _type_phrase(m.group(1).strip()):
+        return Intent("count_type", {"type": m.group(1).strip()})
+
+    return None
@@ -1,4 +1,4 @@
-from fastapi import FastAPI, Depends, HTTPException, UploadFile, File, Request
+from fastapi import FastAPI, Depends, HTTPException, UploadFile, File, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from supabase import create_client, Client
@@ -75,6 +75,224 @@ pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 security = HTTPBearer(auto_error=False)
 anthropic_client = Anthropic(api_key=ANTHROPIC_API_KEY)
 
+# ============================================================
+# METRICS (Prometheus /metrics)
+# ============================================================
+# With --workers N each uvicorn process keeps its own counters. When
+# PROMETHEUS_MULTIPROC_DIR is set (see Dockerfile), every worker writes its
+# values to mmap files in that dir and /metrics merges all of them, so a
+# scrape sees the whole container no matter which worker answers it.
+
+import time
+from contextlib import contextmanager
+
+PROMETHEUS_MULTIPROC_DIR = os.getenv("PROMETHEUS_MULTIPROC_DIR", "")
+if PROMETHEUS_MULTIPROC_DIR:
+    os.makedirs(PROMETHEUS_MULTIPROC_DIR, exist_ok=True)
+
+from prometheus_client import (
+    Counter, Gauge, Histogram, CollectorRegistry, REGISTRY,
+    generate_latest, CONTENT_TYPE_LATEST, multiprocess,
+)
+
+HTTP_REQUESTS = Counter(
+    "cal_http_requests_total", "HTTP requests by route and status",
+    ["method", "route", "status"],
+)
+HTTP_LATENCY = Histogram(
+    "cal_http_request_duration_seconds", "HTTP request latency by route",
+    ["method", "route"],
+    buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60),
+)
+HTTP_IN_FLIGHT = Gauge(
+    "cal_http_requests_in_flight", "HTTP requests currently being served",
+    ["method", "route"], multiprocess_mode="livesum",
+)
+SUPABASE_LATENCY = Histogram(
+    "cal_supabase_request_duration_seconds", "Supabase SDK call latency",
+    ["op", "table"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+)
+SUPABASE_ERRORS = Counter(
+    "cal_supabase_errors_total", "Supabase SDK calls that raised", ["op", "table"],
+)
+CLAUDE_LATENCY = Histogram(
+    "cal_claude_request_duration_seconds", "Anthropic messages.create latency",
+    ["endpoint"],
+    buckets=(0.5, 1, 2, 4, 8, 15, 30, 60, 120),
+)
+CLAUDE_REQUESTS = Counter(
+    "cal_claude_requests_total", "Anthropic calls by endpoint and tenant",
+    ["endpoint", "company_id", "outcome"],
+)
+CLAUDE_TOKENS = Counter(
+    "cal_claude_tokens_total", "Anthropic tokens by endpoint, tenant and kind",
+    ["endpoint", "company_id", "kind"],
+)
+CLAUDE_CACHE_HITS = Counter(
+    "cal_claude_cache_hits_total", "Anthropic calls that read from the prompt cache",
+    ["endpoint", "company_id"],
+)
+MAILGUN_SENDS = Counter(
+    "cal_mailgun_sends_total", "Outbound email attempts by outcome", ["outcome"],
+)
+JOB_DURATION = Histogram(
+    "cal_job_duration_seconds", "Scheduler job wall time", ["job"],
+    buckets=(0.1, 0.5, 1, 5, 15, 30, 60, 120, 300, 600, 1800),
+)
+JOB_RUNS = Counter(
+    "cal_job_runs_total", "Scheduler job runs by outcome", ["job", "outcome"],
+)
+PASSWORD_OPS = Counter(
+    "cal_password_ops_total", "bcrypt hash/verify calls by outcome", ["op", "outcome"],
+)
+PASSWORD_QUEUE = Gauge(
+    "cal_password_queue_depth", "bcrypt operations queued or running",
+    multiprocess_mode="livesum",
+)
+PASSWORD_WAIT = Histogram(
+    "cal_password_queue_wait_seconds", "Time a bcrypt operation waited for a pool thread",
+    buckets=(0.001, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5),
+)
+AUTH_THROTTLED = Counter(
+    "cal_auth_throttled_total", "Auth attempts rejected by the failure throttle", ["endpoint"],
+)
+AUTH_CACHE = Counter(
+    "cal_auth_cache_total", "verify_token credential cache lookups", ["kind", "outcome"],
+)
+AUTH_LATENCY = Histogram(
+    "cal_auth_duration_seconds", "verify_token wall time by how the request authenticated",
+    ["mode"],
+    buckets=(0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.01, 0.05, 0.1, 0.5),
+)
+TENANT_CACHE = Counter(
+    "cal_tenant_cache_total", "Company/settings lookups by cache outcome",
+    ["kind", "outcome"],
+)
+ANALYTICS_CACHE = Counter(
+    "cal_analytics_cache_total", "Analytics report lookups by cache outcome",
+    ["report", "outcome"],
+)
+BRANDING_CACHE = Counter(
+    "cal_branding_cache_total", "Tenant branding/signature lookups by cache outcome",
+    ["outcome"],
+)
+MEMORY_INDEX = Counter(
+    "cal_memory_index_total", "Conversation memory index lookups by how the index was served",
+    ["outcome"],
+)
+MEMORY_CONTEXT_TOKENS = Histogram(
+    "cal_memory_context_tokens", "Estimated tokens of conversation memory injected per question",
+    buckets=(0, 50, 100, 250, 500, 750, 1000, 1500, 2500),
+)
+ANSWER_CACHE = Counter(
+    "cal_answer_cache_total", "/cal/question answer cache lookups by outcome "
+    "(hit rate = hit_exact + hit_similar over all lookups)",
+    ["outcome"],
+)
+INTENT_REQUESTS = Counter(
+    "cal_intent_requests_total", "/cal/question canned intents by outcome", ["intent", "outcome"],
+)
+INTENT_LATENCY = Histogram(
+    "cal_intent_duration_seconds", "Time to answer a canned intent", ["intent"],
+    buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5),
+)
+WS_CONNECTIONS = Gauge(
+    "cal_websocket_connections", "Open /ws/agent-events connections",
+    multiprocess_mode="livesum",
+)
+
+
+@contextmanager
+def _observe_supabase(op: str, table: str):
+    """Time one Supabase SDK round trip and count failures."""
+    t0 = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        SUPABASE_ERRORS.labels(op, table).inc()
+        raise
+    finally:
+        SUPABASE_LATENCY.labels(op, table).observe(time.perf_counter() - t0)
+
+
+def _observe_claude(endpoint: str, company_id, response, elapsed: float):
+    """Record latency, token and prompt-cache counters for one Claude response."""
+    cid = str(company_id) if company_id is not None else "none"
+    CLAUDE_LATENCY.labels(endpoint).observe(elapsed)
+    CLAUDE_REQUESTS.labels(endpoint, cid, "ok").inc()
+    usage = response.usage
+    cache_read = getattr(usage, "cache_read_input_tokens", 0) or 0
+    cache_write = getattr(usage, "cache_creation_input_tokens", 0) or 0
+    CLAUDE_TOKENS.labels(endpoint, cid, "input").inc(usage.input_tokens)
+    CLAUDE_TOKENS.labels(endpoint, cid, "output").inc(usage.output_tokens)
+    if cache_read:
+        CLAUDE_TOKENS.labels(endpoint, cid, "cache_read").inc(cache_read)
+        CLAUDE_CACHE_HITS.labels(endpoint, cid).inc()
+    if cache_write:
+        CLAUDE_TOKENS.labels(endpoint, cid, "cache_write").inc(cache_write)
+
+
+def _timed_job(name: str, fn):
+    """Wrap a scheduler job so its duration and outcome land in /metrics."""
+    import functools
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        t0 = time.perf_counter()
+        try:
+            result = fn(*args, **kwargs)
+            JOB_RUNS.labels(name, "ok").inc()
+            return result
+        except Exception:
+            JOB_RUNS.labels(name, "error").inc()
+            raise
+        finally:
+            JOB_DURATION.labels(name).observe(time.perf_counter() - t0)
+    return wrapper
+
+
+def _route_template(request: Request) -> str:
+    """Resolve the matched route path (e.g. /admin/users/{user_id}) to keep label cardinality bounded."""
+    from starlette.routing import Match
+    for route in request.app.router.routes:
+        match, _ = route.matches(request.scope)
+        if match == Match.FULL:
+            return getattr(route, "path", "unmatched")
+    return "unmatched"
+
+
+@app.middleware("http")
+async def metrics_middleware(request: Request, call_next):
+    route = _route_template(request)
+    if route == "/metrics":
+        return await call_next(request)
+    method = request.method
+    in_flight = HTTP_IN_FLIGHT.labels(method, route)
+    in_flight.inc()
+    t0 = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        in_flight.dec()
+        HTTP_LATENCY.labels(method, route).observe(time.perf_counter() - t0)
+        HTTP_REQUESTS.labels(method, route, str(status)).inc()
+
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus scrape endpoint. Not routed by Caddy — scrape via 127.0.0.1:8200."""
+    from fastapi.responses import Response
+    if PROMETHEUS_MULTIPROC_DIR:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return Response(content=generate_latest(registry), media_type=CONTENT_TYPE_LATEST)
+
 # ============================================================
 # SUPABASE SDK CLIENT (cal schema)
 # ============================================================
@@ -120,6 +338,10 @@ def _apply_filters(q, params: dict):
             q = q.like(key, val[5:])
         elif val.startswith("ilike."):
             q = q.ilike(key, val[6:])
+        elif key == "and" and val.startswith("("):
+            q = q.or_(f"and{val}")  # and=(a,b): a single and-group inside or=(...)
+        elif key == "or" and val.startswith("("):
+            q = q.or_(val[1:-1])
 
     if order_clause:
         for part in order_clause.split(","):
@@ -137,27 +359,133 @@ def sb_get(table: str, params: dict = None) -> list:
     """SELECT from cal schema via Supabase SDK."""
     q = cal_table(table)
     if not params:
-        return q.select("*").execute().data or []
-    q = _apply_filters(q, params)
-    return q.execute().data or []
+        q = q.select("*")
+    else:
+        q = _apply_filters(q, params)
+    with _observe_supabase("select", table):
+        return q.execute().data or []
 
 def sb_post(table: str, data: dict) -> dict:
     """INSERT into cal schema via Supabase SDK."""
-    result = cal_table(table).insert(data).execute()
+    with _observe_supabase("insert", table):
+        result = cal_table(table).insert(data).execute()
     return result.data[0] if result.data else {}
 
 def sb_patch(table: str, params: dict, data: dict) -> list:
-    """UPDATE cal schema via Supabase SDK. Params are eq filters for WHERE."""
+    """UPDATE cal schema via Supabase SDK. Params are eq./in.() filters for WHERE."""
     q = cal_table(table).update(data)
     for key, val in params.items():
         val = str(val)
         if val.startswith("eq."):
             q = q.eq(key, val[3:])
-    return q.execute().data or []
+        elif val.startswith("in.("):
+            q = q.in_(key, [v.strip() for v in val[4:-1].split(",")])
+    with _observe_supabase("update", table):
+        return q.execute().data or []
+
+def sb_upsert(table: str, rows: list, on_conflict: str = "id") -> list:
+    """Multi-row INSERT ... ON CONFLICT DO UPDATE in one round trip."""
+    with _observe_supabase("upsert", table):
+        return cal_table(table).upsert(rows, on_conflict=on_conflict).execute().data or []
+
+def sb_count(table: str, params: dict = None) -> int:
+    """Exact row count (PostgREST count=exact). Params are eq filters."""
+    q = cal_table(table).select("id", count="exact").limit(1)
+    for key, val in (params or {}).items():
+        val = str(val)
+        if val.startswith("eq."):
+            q = q.eq(key, val[3:])
+    with _observe_supabase("count", table):
+        return q.execute().count or 0
 
 def sb_rpc(fn_name: str, params: dict = None) -> any:
     """Call a Supabase RPC function via SDK."""
-    return sb.rpc(fn_name, params or {}).execute().data
+    with _observe_supabase("rpc", fn_name):
+        return sb.rpc(fn_name, params or {}).execute().data
+
+def cal_rpc(fn_name: str, params: dict = None) -> any:
+    """Call an RPC function that lives in the cal schema (sb.rpc only sees public)."""
+    with _observe_supabase("rpc", fn_name):
+        return sb.postgrest.schema("cal").rpc(fn_name, params or {}).execute().data
+
+# ============================================================
+# TENANT METADATA CACHE
+# ============================================================
+# companies rows and per-tenant cal.settings maps are tiny and read on
+# almost every request, and per tenant in every cron job. Each worker keeps
+# an LRU with a short TTL. Writes made by this service (Stripe webhook,
+# provisioning, settings updates, kernel edits) invalidate the local entry;
+# the TTL bounds how long another worker can serve the previous value.
+
+import threading
+from collections import OrderedDict
+
+TENANT_CACHE_TTL = 60          # seconds
+TENANT_CACHE_MAX = 5000        # entries per kind, per worker
+TENANT_COMPANY_COLUMNS = "id,name,slug,subscription_plan,is_active,max_users,max_tools"
+_tenant_cache: dict = {"company": OrderedDict(), "slug": OrderedDict(), "settings": OrderedDict()}
+_tenant_cache_lock = threading.Lock()
+
+
+def _tenant_cache_get(kind: str, key) -> tuple[bool, any]:
+    with _tenant_cache_lock:
+        entry = _tenant_cache[kind].get(key)
+        if entry is not None:
+            if time.monotonic() - entry[0] < TENANT_CACHE_TTL:
+                _tenant_cache[kind].move_to_end(key)
+                TENANT_CACHE.labels(kind, "hit").inc()
+                return True, entry[1]
+            del _tenant_cache[kind][key]
+    TENANT_CACHE.labels(kind, "miss").inc()
+    return False, None
+
+
+def _tenant_cache_put(kind: str, key, value):
+    with _tenant_cache_lock:
+        cache = _tenant_cache[kind]
+        cache[key] = (time.monotonic(), value)
+        cache.move_to_end(key)
+        while len(cache) > TENANT_CACHE_MAX:
+            cache.popitem(last=False)
+
+
+def invalidate_tenant(company_id: int):
+    """Drop this worker's cached company row and settings for a tenant."""
+    company_id = int(company_id)
+    with _tenant_cache_lock:
+        entry = _tenant_cache["company"].pop(company_id, None)
+        _tenant_cache["settings"].pop(company_id, None)
+        if entry and entry[1]:
+            _tenant_cache["slug"].pop(entry[1]["slug"], None)
+
+
+def get_company(company_id: int) -> dict | None:
+    """companies row (TENANT_COMPANY_COLUMNS) by id, or None if it doesn't exist."""
+    company_id = int(company_id)
+    hit, company = _tenant_cache_get("company", company_id)
+    if not hit:
+        rows = sb_get("companies", {"select": TENANT_COMPANY_COLUMNS, "id": f"eq.{company_id}"})
+        company = rows[0] if rows else None
+        if company:
+            _tenant_cache_put("company", company_id, company)
+            _tenant_cache_put("slug", company["slug"], company_id)
+    return dict(company) if company else None
+
+
+def get_company_by_slug(slug: str) -> dict | None:
+    """companies row by slug, or None. Unknown slugs are not cached."""
+    hit, company_id = _tenant_cache_get("slug", slug)
+    if hit:
+        company = get_company(company_id)
+        if company and company["slug"] == slug:
+            return company
+    rows = sb_get("companies", {"select": TENANT_COMPANY_COLUMNS, "slug": f"eq.{slug}"})
+    if not rows:
+        return None
+    _tenant_cache_put("company", rows[0]["id"], rows[0])
+    _tenant_cache_put("slug", slug, rows[0]["id"])
+    return dict(rows[0])
+
 
 # ============================================================
 # MODELS
@@ -238,43 +566,110 @@ class ChangePasswordRequest(BaseModel):
 # ============================================================
 # DEPENDENCIES
 # ============================================================
+# verify_token runs on every authenticated request. Verified JWT claims are
+# cached by token hash until the token's exp, and SSO profiles by a hash of
+# the Cookie header for AUTH_SSO_TTL, in small per-worker LRUs. A bearer
+# token is checked first (no network); get_gp3_user is only consulted when
+# there is no valid bearer and the request carries cookies.
+
+import hashlib
+import threading
+from collections import OrderedDict
+
+AUTH_CACHE_MAX = 10000         # entries per kind, per worker
+AUTH_SSO_TTL = 60              # seconds an SSO profile is reused
+_auth_cache: dict = {"jwt": OrderedDict(), "sso": OrderedDict()}
+_auth_cache_lock = threading.Lock()
+
+
+def _auth_cache_get(kind: str, key: str):
+    with _auth_cache_lock:
+        entry = _auth_cache[kind].get(key)
+        if entry is not None:
+            if time.time() < entry[0]:
+                _auth_cache[kind].move_to_end(key)
+                AUTH_CACHE.labels(kind, "hit").inc()
+                return entry[1]
+            del _auth_cache[kind][key]
+    AUTH_CACHE.labels(kind, "miss").inc()
+    return None
+
+
+def _auth_cache_put(kind: str, key: str, value: dict, expires_at: float):
+    with _auth_cache_lock:
+        cache = _auth_cache[kind]
+        cache[key] = (expires_at, value)
+        cache.move_to_end(key)
+        while len(cache) > AUTH_CACHE_MAX:
+            cache.popitem(last=False)
+
+
+def _jwt_auth(token: str) -> dict | None:
+    key = hashlib.sha256(token.encode()).hexdigest()
+    auth = _auth_cache_get("jwt", key)
+    if auth is not None:
+        return auth
+    try:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    except JWTError:
+        return None
+    auth = {
+        "user_id": payload["user_id"],
+        "company_id": payload["company_id"],
+        "role": payload.get("role", "user"),
+    }
+    if payload.get("exp"):
+        _auth_cache_put("jwt", key, auth, float(payload["exp"]))
+    return auth
 
 
-def verify_token(
-    request: Request = None,
-    credentials: HTTPAuthorizationCredentials = Depends(security),
-):
-    # Mode 1: GP3 SSO cookie
-    if SSO_AVAILABLE and request:
+def _sso_auth(request: Request) -> dict | None:
+    """GP3 SSO cookie auth. Raises 403 when the profile has no access to Cal."""
+    key = hashlib.sha256(request.headers.get("cookie", "").encode()).hexdigest()
+    profile = _auth_cache_get("sso", key)
+    if profile is None:
         try:
             profile = get_gp3_user(request)
-            allowed = profile.get("allowed_apps") or []
-            if "cal" not in allowed and profile.get("role") != "admin":
-                raise HTTPException(status_code=403, detail="No access to Calibration Manager")
-            return {
-                "user_id": profile.get("id") or profile.get("auth_id"),
-                "company_id": profile.get("company_id") or 1,
-                "role": profile.get("role", "user"),
-                "_sso": True,
-            }
         except HTTPException as e:
             if e.status_code == 403:
                 raise
-            pass
+            return None
+        _auth_cache_put("sso", key, profile, time.time() + AUTH_SSO_TTL)
+    allowed = profile.get("allowed_apps") or []
+    if "cal" not in allowed and profile.get("role") != "admin":
+        raise HTTPException(status_code=403, detail="No access to Calibration Manager")
+    return {
+        "user_id": profile.get("id") or profile.get("auth_id"),
+        "company_id": profile.get("company_id") or 1,
+        "role": profile.get("role", "user"),
+        "_sso": True,
+    }
 
-    # Mode 2: Legacy cal JWT
-    if credentials and credentials.credentials:
-        try:
-            payload = jwt.decode(credentials.credentials, SECRET_KEY, algorithms=[ALGORITHM])
-            return {
-                "user_id": payload["user_id"],
-                "company_id": payload["company_id"],
-                "role": payload.get("role", "user"),
-            }
-        except JWTError:
-            pass
 
-    raise HTTPException(status_code=401, detail="Not authenticated")
+def verify_token(
+    request: Request = None,
+    credentials: HTTPAuthorizationCredentials = Depends(security),
+):
+    t0 = time.perf_counter()
+    mode = "denied"
+    try:
+        # Mode 1: Legacy cal JWT (bearer) — local HMAC check, cached until exp
+        if credentials and credentials.credentials:
+            auth = _jwt_auth(credentials.credentials)
+            if auth is not None:
+                mode = "jwt"
+                return dict(auth)
+
+        # Mode 2: GP3 SSO cookie
+        if SSO_AVAILABLE and request and request.cookies:
+            auth = _sso_auth(request)
+            if auth is not None:
+                mode = "sso"
+                return auth
+
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    finally:
+        AUTH_LATENCY.labels(mode).observe(time.perf_counter() - t0)
 
 def require_admin(auth: dict = Depends(verify_token)):
     """Dependency: require admin role. Apply to write-mutating endpoints."""
@@ -298,8 +693,7 @@ def load_tenant_kernel(db_unused, company_id: int) -> str:
 
     # Get company info via REST
     try:
-        companies = sb_get("companies", {"select": "name,slug", "id": f"eq.{company_id}"})
-        company = companies[0] if companies else {}
+        company = get_company(company_id) or {}
     except Exception:
         company = {}
     company_name = company.get("name", "Unknown")
@@ -334,16 +728,75 @@ def load_tenant_kernel(db_unused, company_id: int) -> str:
 
     return kernel
 
-def load_tenant_branding(company_id: int) -> dict:
-    """Parse branding block from tenant kernel."""
-    try:
-        companies = sb_get("companies", {"select": "slug,name", "id": f"eq.{company_id}"})
-        company = companies[0] if companies else None
-    except Exception:
-        company = None
-    if not company:
+# Branding (and the email signature rendered from it) is cached per tenant.
+# An entry is reused while the tenant kernel's mtime and the tenant upload
+# dir's mtime (changes when a logo file first appears) are unchanged, so
+# edits made through any worker invalidate it; update_kernel and
+# upload_logo also drop the local entry explicitly.
+
+import threading
+from email_templates import (
+    render_signature, render_tool_table,
+    overdue_body, critical_body, warning_body, purchasing_body, milestone_body, milestone_digest_body,
+)
+
+_branding_cache: dict = {}   # company_id -> {"company", "stamp", "branding", "signature"}
+_branding_lock = threading.Lock()
+
+
+def _branding_stamp(slug: str) -> tuple:
+    stamps = []
+    for path in (f"/app/kernels/tenants/{slug}.ttc.md", f"/app/uploads/tenants/{slug}"):
+        try:
+            stamps.append(os.stat(path).st_mtime_ns)
+        except OSError:
+            stamps.append(None)
+    return tuple(stamps)
+
+
+def invalidate_tenant_branding(company_id: int):
+    with _branding_lock:
+        _branding_cache.pop(company_id, None)
+
+
+def _branding_entry(company_id: int, company: dict | None) -> dict | None:
+    with _branding_lock:
+        entry = _branding_cache.get(company_id)
+    if company is None:
+        try:
+            company = get_company(company_id)
+        except Exception:
+            company = None
+        if not company:
+            return None
+    company = {"slug": company["slug"], "name": company["name"]}
+    stamp = _branding_stamp(company["slug"])
+    if entry and entry["company"] == company and entry["stamp"] == stamp:
+        BRANDING_CACHE.labels("hit").inc()
+        return entry
+    BRANDING_CACHE.labels("miss").inc()
+    entry = {
+        "company": company, "stamp": stamp,
+        "branding": _parse_tenant_branding(company), "signature": None,
+    }
+    with _branding_lock:
+        _branding_cache[company_id] = entry
+    return entry
+
+
+def load_tenant_branding(company_id: int, company: dict | None = None) -> dict:
+    """Tenant branding from the kernel's branding block, cached per tenant.
+    Pass `company` ({slug, name}) to skip the lookup."""
+    entry = _branding_entry(company_id, company)
+    if not entry:
         return {"company_name": "Unknown", "slug": "unknown"}
+    branding = dict(entry["branding"])
+    branding["address_lines"] = list(branding["address_lines"])
+    return branding
 
+
+def _parse_tenant_branding(company: dict) -> dict:
+    """Parse branding block from tenant kernel."""
     slug = company["slug"]
     company_name = company["name"]
 
@@ -534,16 +987,23 @@ def generate_branded_pdf(branding: dict, records: list, evidence_type: str, ai_s
     return buf.getvalue()
 
 
-def call_agent(kernel: str, user_message: str, context: str = "") -> dict:
+def call_agent(kernel: str, user_message: str, context: str = "",
+               endpoint: str = "unknown", company_id: int | None = None) -> dict:
     """Call Claude with tenant-specific kernel."""
     messages_content = f"{context}\n\n{user_message}" if context else user_message
 
-    response = anthropic_client.messages.create(
-        model="claude-sonnet-4-5-20250929",
-        max_tokens=4000,
-        system=kernel,
-        messages=[{"role": "user", "content": messages_content}],
-    )
+    t0 = time.perf_counter()
+    try:
+        response = anthropic_client.messages.create(
+            model="claude-sonnet-4-5-20250929",
+            max_tokens=4000,
+            system=kernel,
+            messages=[{"role": "user", "content": messages_content}],
+        )
+    except Exception:
+        CLAUDE_REQUESTS.labels(endpoint, str(company_id), "error").inc()
+        raise
+    _observe_claude(endpoint, company_id, response, time.perf_counter() - t0)
 
     return {
         "text": response.content[0].text,
@@ -577,6 +1037,18 @@ PLAN_FEATURES = {
 
 
 ALERT_MILESTONES = [30, 14, 7, 3, 1, 0]  # days before due date
+# days -> (subject tag, "Calibration Due ..." wording, heading color, "is due ..." phrase)
+MILESTONE_STYLES = {
+    0:  ("TODAY", "Today", "#CC0000", "<strong>TODAY</strong>"),
+    1:  ("TOMORROW", "Tomorrow", "#CC3300", "<strong>tomorrow</strong>"),
+    3:  ("3 DAYS", "in 3 Days", "#CC6600", "in <strong>3 days</strong>"),
+    7:  ("1 WEEK", "in 7 Days", "#CC6600", "in <strong>1 week</strong>"),
+    14: ("2 WEEKS", "in 14 Days", "#336699", "in <strong>2 weeks</strong>"),
+    30: ("30 DAYS", "in 30 Days", "#003366", "in <strong>30 days</strong>. Plan ahead"),
+}
+# cal.settings notify_milestone_mode: "digest" (default) groups a run's milestone hits into
+# one email per milestone and recipient list; "per_tool" sends one email per tool.
+MILESTONE_MODES = ("digest", "per_tool")
 
 def _get_monthly_ai_cost(company_id: int) -> float:
     """Get total AI cost for current billing month."""
@@ -610,8 +1082,8 @@ def _log_usage(company_id: int, user_id: int | None, endpoint: str, tokens_in: i
 def _check_ai_budget(company_id: int) -> tuple[bool, float, float]:
     """Check if company is within AI budget. Returns (allowed, used, cap)."""
     monthly_cost = _get_monthly_ai_cost(company_id)
-    company = sb_get("companies", {"select": "subscription_plan", "id": f"eq.{company_id}"})
-    plan = company[0]["subscription_plan"] if company else "basic"
+    company = get_company(company_id)
+    plan = company["subscription_plan"] if company else "basic"
     cap = PLAN_AI_CAPS.get(plan, PLAN_AI_CAPS["basic"])
     return monthly_cost < cap, monthly_cost, cap
 
@@ -625,34 +1097,146 @@ def call_agent_metered(company_id: int, user_id: int | None, endpoint: str,
             "input_tokens": 0, "output_tokens": 0, "budget_exceeded": True,
         }
 
-    result = call_agent(kernel, user_message, context)
+    result = call_agent(kernel, user_message, context, endpoint=endpoint, company_id=company_id)
     _log_usage(company_id, user_id, endpoint,
                result.get("input_tokens", 0), result.get("output_tokens", 0))
     return result
 
 
+# ============================================================
+# PASSWORD HASHING (bounded pool) + AUTH THROTTLE
+# ============================================================
+# bcrypt costs ~250 ms of CPU per call. Handlers await hash_password /
+# verify_password, which run on a small dedicated thread pool (the bcrypt
+# extension releases the GIL), so the event loop keeps serving other
+# requests. At most PASSWORD_QUEUE_MAX operations may be pending per
+# worker; beyond that callers get 503 instead of an ever-growing queue.
+# Failed logins / challenge resets are throttled per account and per
+# client IP before any bcrypt work is spent on them.
+
+import asyncio
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+PASSWORD_WORKERS = int(os.getenv("PASSWORD_WORKERS", "2"))
+PASSWORD_QUEUE_MAX = 32
+_password_pool = ThreadPoolExecutor(max_workers=PASSWORD_WORKERS, thread_name_prefix="bcrypt")
+_password_pending = 0          # touched only from the event loop
+
+AUTH_FAIL_WINDOW = 900         # seconds
+AUTH_FAIL_MAX_ACCOUNT = 5      # failures per account per window
+AUTH_FAIL_MAX_IP = 30          # failures per client IP per window
+AUTH_FAIL_KEYS = 20_000        # tracked account/IP keys per worker (least recently failed evicted)
+_auth_failures: "OrderedDict[str, list]" = OrderedDict()  # key -> failure timestamps (monotonic); event loop only
+_auth_swept_at = 0.0
+
+
+async def _password_op(op: str, fn, *args):
+    global _password_pending
+    if _password_pending >= PASSWORD_QUEUE_MAX:
+        PASSWORD_OPS.labels(op, "rejected").inc()
+        raise HTTPException(status_code=503, detail="Authentication is busy — please retry in a moment",
+                            headers={"Retry-After": "2"})
+    _password_pending += 1
+    PASSWORD_QUEUE.inc()
+    queued = time.perf_counter()
+
+    def run():
+        PASSWORD_WAIT.observe(time.perf_counter() - queued)
+        return fn(*args)
+
+    try:
+        result = await asyncio.get_running_loop().run_in_executor(_password_pool, run)
+        PASSWORD_OPS.labels(op, "ok").inc()
+        return result
+    except Exception:
+        PASSWORD_OPS.labels(op, "error").inc()
+        raise
+    finally:
+        _password_pending -= 1
+        PASSWORD_QUEUE.dec()
+
+
+async def hash_password(secret: str) -> str:
+    return await _password_op("hash", pwd_context.hash, secret)
+
+
+async def verify_password(secret: str, hashed: str) -> bool:
+    return await _password_op("verify", pwd_context.verify, secret, hashed)
+
+
+def _client_ip(request: Request) -> str:
+    """Peer address. uvicorn --proxy-headers resolves X-Forwarded-For only when the
+    peer is in FORWARDED_ALLOW_IPS (the reverse proxy); the client-set first hop is never trusted."""
+    return request.client.host if request.client else "unknown"
+
+
+def _auth_recent_failures(key: str, now: float) -> list:
+    hits = [t for t in _auth_failures.get(key, []) if now - t < AUTH_FAIL_WINDOW]
+    if hits:
+        _auth_failures[key] = hits
+    else:
+        _auth_failures.pop(key, None)
+    return hits
+
+
+def _auth_throttle_check(endpoint: str, account: str, ip: str):
+    """429 if this account or IP has too many recent failures on `endpoint`."""
+    now = time.monotonic()
+    for key, limit in ((f"{endpoint}:acct:{account.lower()}", AUTH_FAIL_MAX_ACCOUNT),
+                       (f"{endpoint}:ip:{ip}", AUTH_FAIL_MAX_IP)):
+        hits = _auth_recent_failures(key, now)
+        if len(hits) >= limit:
+            AUTH_THROTTLED.labels(endpoint).inc()
+            retry_after = int(AUTH_FAIL_WINDOW - (now - hits[0])) + 1
+            raise HTTPException(status_code=429, detail="Too many failed attempts — try again later",
+                                headers={"Retry-After": str(retry_after)})
+
+
+def _auth_throttle_fail(endpoint: str, account: str, ip: str):
+    global _auth_swept_at
+    now = time.monotonic()
+    for key in (f"{endpoint}:acct:{account.lower()}", f"{endpoint}:ip:{ip}"):
+        _auth_failures.setdefault(key, []).append(now)
+        _auth_failures.move_to_end(key)
+    # Keys are otherwise only pruned when checked again; drop expired ones
+    # once per window and cap the rest so one-off accounts/IPs don't pile up.
+    if now - _auth_swept_at > AUTH_FAIL_WINDOW:
+        _auth_swept_at = now
+        for key in [k for k, hits in _auth_failures.items() if now - hits[-1] >= AUTH_FAIL_WINDOW]:
+            del _auth_failures[key]
+    while len(_auth_failures) > AUTH_FAIL_KEYS:
+        _auth_failures.popitem(last=False)
+
+
+def _auth_throttle_clear(endpoint: str, account: str):
+    _auth_failures.pop(f"{endpoint}:acct:{account.lower()}", None)
+
+
 # ============================================================
 # AUTH ENDPOINTS
 # ============================================================
 
 @app.post("/auth/login")
-async def login(req: LoginRequest):
+async def login(req: LoginRequest, request: Request):
+    ip = _client_ip(request)
+    _auth_throttle_check("login", req.email, ip)
+
     # Fetch user via REST
     users = sb_get("users", {
         "select": "id,password_hash,company_id,role,force_reset,security_question",
         "email": f"eq.{req.email}",
         "is_active": "eq.true",
     })
-    if not users:
+    if not users or not await verify_password(req.password, users[0]["password_hash"]):
+        _auth_throttle_fail("login", req.email, ip)
         raise HTTPException(status_code=401, detail="Invalid credentials")
     user = users[0]
-
-    if not pwd_context.verify(req.password, user["password_hash"]):
-        raise HTTPException(status_code=401, detail="Invalid credentials")
+    _auth_throttle_clear("login", req.email)
 
     # Get company name
-    companies = sb_get("companies", {"select": "name", "id": f"eq.{user['company_id']}"})
-    company_name = companies[0]["name"] if companies else "Unknown"
+    company = get_company(user["company_id"])
+    company_name = company["name"] if company else "Unknown"
 
     # Update last login
     try:
@@ -709,14 +1293,20 @@ async def set_challenges(req: ChallengeSetupRequest, auth: dict = Depends(verify
         raise HTTPException(status_code=400, detail="Password must be at least 8 characters")
 
     # Hash answers (lowercase + stripped for consistency)
+    password_hash, answer_1, answer_2, answer_3 = await asyncio.gather(
+        hash_password(req.new_password),
+        hash_password(req.answer_1.strip().lower()),
+        hash_password(req.answer_2.strip().lower()),
+        hash_password(req.answer_3.strip().lower()),
+    )
     sb_patch("users", {"id": f"eq.{user_id}"}, {
-        "password_hash": pwd_context.hash(req.new_password),
+        "password_hash": password_hash,
         "security_question": req.question_1,
-        "security_answer_hash": pwd_context.hash(req.answer_1.strip().lower()),
+        "security_answer_hash": answer_1,
         "security_question_2": req.question_2,
-        "security_answer_hash_2": pwd_context.hash(req.answer_2.strip().lower()),
+        "security_answer_hash_2": answer_2,
         "security_question_3": req.question_3,
-        "security_answer_hash_3": pwd_context.hash(req.answer_3.strip().lower()),
+        "security_answer_hash_3": answer_3,
         "force_reset": False,
         "challenge_set_at": datetime.utcnow().isoformat(),
     })
@@ -751,8 +1341,10 @@ async def challenge_lookup(req: dict):
 
 
 @app.post("/auth/challenge-reset")
-async def challenge_reset(req: ChallengeResetRequest):
+async def challenge_reset(req: ChallengeResetRequest, request: Request):
     """Reset password by answering all 3 challenge questions correctly."""
+    ip = _client_ip(request)
+    _auth_throttle_check("challenge_reset", req.email, ip)
     users = sb_get("users", {
         "select": "id,security_answer_hash,security_answer_hash_2,security_answer_hash_3",
         "email": f"eq.{req.email}",
@@ -772,9 +1364,15 @@ async def challenge_reset(req: ChallengeResetRequest):
         ("answer_2", user.get("security_answer_hash_2", ""), req.answer_2),
         ("answer_3", user.get("security_answer_hash_3", ""), req.answer_3),
     ]
-    for label, stored_hash, provided in checks:
-        if not stored_hash or not pwd_context.verify(provided.strip().lower(), stored_hash):
-            raise HTTPException(status_code=401, detail="One or more answers are incorrect")
+    if not all(stored_hash for _, stored_hash, _ in checks):
+        raise HTTPException(status_code=401, detail="One or more answers are incorrect")
+    results = await asyncio.gather(*(
+        verify_password(provided.strip().lower(), stored_hash) for _, stored_hash, provided in checks
+    ))
+    if not all(results):
+        _auth_throttle_fail("challenge_reset", req.email, ip)
+        raise HTTPException(status_code=401, detail="One or more answers are incorrect")
+    _auth_throttle_clear("challenge_reset", req.email)
 
     # Password validation
     if len(req.new_password) < 8:
@@ -782,7 +1380,7 @@ async def challenge_reset(req: ChallengeResetRequest):
 
     # Reset password
     sb_patch("users", {"id": f"eq.{user['id']}"}, {
-        "password_hash": pwd_context.hash(req.new_password),
+        "password_hash": await hash_password(req.new_password),
         "force_reset": False,
     })
 
@@ -798,14 +1396,14 @@ async def change_password(req: ChangePasswordRequest, auth: dict = Depends(verif
     if not users:
         raise HTTPException(status_code=404, detail="User not found")
 
-    if not pwd_context.verify(req.current_password, users[0]["password_hash"]):
+    if not await verify_password(req.current_password, users[0]["password_hash"]):
         raise HTTPException(status_code=401, detail="Current password is incorrect")
 
     if len(req.new_password) < 8:
         raise HTTPException(status_code=400, detail="Password must be at least 8 characters")
 
     sb_patch("users", {"id": f"eq.{user_id}"}, {
-        "password_hash": pwd_context.hash(req.new_password),
+        "password_hash": await hash_password(req.new_password),
     })
 
     return {"status": "success", "message": "Password changed"}
@@ -870,15 +1468,10 @@ async def create_company_user(company_id: int, req: dict, auth: dict = Depends(v
         if current_users >= plan_limit:
             raise HTTPException(status_code=402, detail=f"User limit reached ({plan_limit}). Upgrade your plan.")
 
-    # Get next ID
-    all_users = sb_get("users", {"select": "id", "order": "id.desc", "limit": "1"})
-    next_id = (all_users[0]["id"] + 1) if all_users else 1
-
-    sb_post("users", {
-        "id": next_id,
+    user = sb_post("users", {
         "company_id": company_id,
         "email": email,
-        "password_hash": pwd_context.hash("1Bunting!"),
+        "password_hash": await hash_password("1Bunting!"),
         "first_name": req.get("first_name", ""),
         "last_name": req.get("last_name", ""),
         "role": req.get("role", "user"),
@@ -886,7 +1479,7 @@ async def create_company_user(company_id: int, req: dict, auth: dict = Depends(v
         "force_reset": True,
     })
 
-    return {"status": "created", "user_id": next_id, "email": email, "initial_password": "1Bunting!"}
+    return {"status": "created", "user_id": user["id"], "email": email, "initial_password": "1Bunting!"}
 
 
 @app.patch("/admin/users/{user_id}")
@@ -912,7 +1505,7 @@ async def update_user(user_id: int, req: dict, auth: dict = Depends(verify_token
     if "last_name" in req:
         update_data["last_name"] = req["last_name"]
     if req.get("reset_password"):
-        update_data["password_hash"] = pwd_context.hash("1Bunting!")
+        update_data["password_hash"] = await hash_password("1Bunting!")
         update_data["force_reset"] = True
 
     if not update_data:
@@ -958,6 +1551,7 @@ async def get_notification_settings(auth: dict = Depends(verify_token)):
 async def update_notification_settings(req: dict, auth: dict = Depends(verify_token)):
     """Update notification preferences. Admin/company_admin only.
     Body: {"notify_overdue_to": "email@...", "notify_critical_cc": "a@..,b@..", ...}
+    All keys are written in one upsert; the response carries the merged notification settings.
     """
     if auth["role"] not in ("admin", "company_admin"):
         raise HTTPException(status_code=403, detail="Admin access required")
@@ -969,34 +1563,17 @@ async def update_notification_settings(req: dict, auth: dict = Depends(verify_to
         "notify_warning_to", "notify_warning_cc",
         "notify_purchasing_to", "notify_purchasing_cc",
         "notify_summary_to", "notify_summary_cc",
+        "notify_milestone_mode",
     }
+    mode = req.get("notify_milestone_mode")
+    if mode is not None and mode not in MILESTONE_MODES:
+        raise HTTPException(status_code=400, detail=f"notify_milestone_mode must be one of {', '.join(MILESTONE_MODES)}")
 
-    updated = 0
-    for key, value in req.items():
-        if key not in allowed_keys:
-            continue
-        # Upsert: try patch first, then insert
-        existing = sb_get("settings", {
-            "select": "id",
-            "company_id": f"eq.{company_id}",
-            "key": f"eq.{key}",
-        })
-        if existing:
-            sb_patch("settings", {
-                "id": f"eq.{existing[0]['id']}",
-            }, {"value": value})
-        else:
-            all_settings = sb_get("settings", {"select": "id", "order": "id.desc", "limit": "1"})
-            next_id = (all_settings[0]["id"] + 1) if all_settings else 1
-            sb_post("settings", {
-                "id": next_id,
-                "company_id": company_id,
-                "key": key,
-                "value": value,
-            })
-        updated += 1
-
-    return {"status": "updated", "fields": updated}
+    values = {k: v for k, v in req.items() if k in allowed_keys}
+    settings = save_company_settings(company_id, values)
+    notify_keys = [k for k in settings if k.startswith("notify_")]
+    return {"status": "updated", "fields": len(values),
+            "notifications": {k: settings[k] for k in notify_keys}}
 
 
 # ============================================================
@@ -1005,8 +1582,8 @@ async def update_notification_settings(req: dict, auth: dict = Depends(verify_to
 
 def _check_plan_limit(company_id: int, feature: str):
     """Get a plan feature limit for a company. Returns the limit value."""
-    company = sb_get("companies", {"select": "subscription_plan", "id": f"eq.{company_id}"})
-    plan = company[0]["subscription_plan"] if company else "basic"
+    company = get_company(company_id)
+    plan = company["subscription_plan"] if company else "basic"
     limits = PLAN_FEATURES.get(plan, PLAN_FEATURES["basic"])
     return limits.get(feature)
 
@@ -1015,11 +1592,11 @@ def _check_plan_limit(company_id: int, feature: str):
 async def get_plan_info(auth: dict = Depends(verify_token)):
     """Return current plan details and usage for the company."""
     company_id = auth["company_id"]
-    company = sb_get("companies", {"select": "subscription_plan,max_users,max_tools,name", "id": f"eq.{company_id}"})
+    company = get_company(company_id)
     if not company:
         raise HTTPException(status_code=404, detail="Company not found")
 
-    plan = company[0]["subscription_plan"]
+    plan = company["subscription_plan"]
     features = PLAN_FEATURES.get(plan, PLAN_FEATURES["basic"])
 
     # Current usage
@@ -1039,7 +1616,7 @@ async def get_plan_info(auth: dict = Depends(verify_token)):
         monthly_ai_cost = 0.0
 
     return {
-        "company": company[0]["name"],
+        "company": company["name"],
         "plan": plan,
         "features": features,
         "usage": {
@@ -1080,23 +1657,18 @@ async def get_pricing():
 @app.post("/auth/register")
 async def register(req: RegisterRequest):
     # Look up company by slug via REST
-    companies = sb_get("companies", {"select": "id", "slug": f"eq.{req.company_code}", "is_active": "eq.true"})
-    if not companies:
+    company = get_company_by_slug(req.company_code)
+    if not company or not company["is_active"]:
         raise HTTPException(status_code=404, detail="Invalid registration code")
-    company_id = companies[0]["id"]
+    company_id = company["id"]
 
     # Check email not taken
     existing = sb_get("users", {"select": "id", "email": f"eq.{req.email}"})
     if existing:
         raise HTTPException(status_code=409, detail="Email already registered")
 
-    # Generate next user ID (cal.users has no auto-increment)
-    all_users = sb_get("users", {"select": "id", "order": "id.desc", "limit": "1"})
-    next_id = (all_users[0]["id"] + 1) if all_users else 1
-
-    password_hash = pwd_context.hash(req.password)
+    password_hash = await hash_password(req.password)
     sb_post("users", {
-        "id": next_id,
         "company_id": company_id,
         "email": req.email,
         "password_hash": password_hash,
@@ -1149,16 +1721,8 @@ async def self_serve_signup(req: SignupRequest):
     if existing_co:
         slug = f"{slug}-{uuid.uuid4().hex[:6]}"
 
-    # Get next IDs (cal.companies and cal.users have no auto-increment)
-    all_companies = sb_get("companies", {"select": "id", "order": "id.desc", "limit": "1"})
-    next_company_id = (all_companies[0]["id"] + 1) if all_companies else 1
-
-    all_users = sb_get("users", {"select": "id", "order": "id.desc", "limit": "1"})
-    next_user_id = (all_users[0]["id"] + 1) if all_users else 1
-
-    # Create company (inactive until payment)
+    # Create company (inactive until payment); ids come from the column defaults (migration 025)
     company = sb_post("companies", {
-        "id": next_company_id,
         "name": req.company_name,
         "slug": slug,
         "subscription_plan": "founder",
@@ -1172,10 +1736,9 @@ async def self_serve_signup(req: SignupRequest):
     name_parts = req.contact_name.strip().split(" ", 1)
     first_name = name_parts[0]
     last_name = name_parts[1] if len(name_parts) > 1 else ""
-    password_hash = pwd_context.hash(req.password)
+    password_hash = await hash_password(req.password)
 
     user = sb_post("users", {
-        "id": next_user_id,
         "email": req.email,
         "password_hash": password_hash,
         "first_name": first_name,
@@ -1295,6 +1858,7 @@ async def stripe_webhook(request: Request):
                 except Exception:
                     pass
 
+            invalidate_tenant(company_id)
             logger.info(
                 f"TENANT_ACTIVATED company={company_id} user={user_id} "
                 f"stripe_customer={stripe_customer}"
@@ -1307,6 +1871,7 @@ async def stripe_webhook(request: Request):
         company_id = meta.get("company_id")
         if company_id:
             sb_patch("companies", {"id": f"eq.{company_id}"}, {"is_active": False})
+            invalidate_tenant(company_id)
             logger.info(f"TENANT_DEACTIVATED company={company_id} (subscription cancelled)")
 
     return {"status": "ok"}
@@ -1339,10 +1904,9 @@ async def portal_exchange(req: PortalExchangeRequest):
         raise HTTPException(status_code=403, detail="No tenant_id in portal token")
 
     # Map tenant_id (string slug) -> company_id (integer)
-    companies = sb_get("companies", {"select": "id,name", "slug": f"eq.{tenant_id}"})
-    if not companies:
+    company = get_company_by_slug(tenant_id)
+    if not company:
         raise HTTPException(status_code=404, detail=f"No company for tenant '{tenant_id}'")
-    company = companies[0]
 
     # Find or auto-create cal.users record for this portal user
     email = sb_user.get("email", "")
@@ -1361,7 +1925,7 @@ async def portal_exchange(req: PortalExchangeRequest):
         new_user = sb_post("users", {
             "company_id": company["id"],
             "email": email,
-            "password_hash": pwd_context.hash(str(uuid.uuid4())),
+            "password_hash": await hash_password(str(uuid.uuid4())),
             "first_name": meta.get("first_name", "Portal"),
             "last_name": meta.get("last_name", "User"),
             "role": "user",
@@ -1492,6 +2056,7 @@ result values: pass=within spec, adjusted=corrected during visit (usable), out_o
         "next_due_date": data.get("next_due_date"),
         "calibration_status": "current",
     })
+    _refresh_dashboard_snapshot(company_id)
 
     return {
         "status": "success",
@@ -1590,6 +2155,490 @@ def execute_safe_sql(db, sql: str, company_id: int) -> str:
         return f"SQL error: {str(e)}"
 
 
+# ============================================================
+# CONVERSATION MEMORY INDEX
+# ============================================================
+# Each worker keeps a BM25 index (memory_index.py) per tenant over
+# conversation_memory. ask_question injects only the memories relevant to
+# the question, within MEMORY_TOKEN_BUDGET, instead of the 20 most-used
+# rows. The index is loaded once, then kept current incrementally: this
+# worker's own answers are added as they are stored, and rows written by
+# other workers are pulled by last_used_at at most every MEMORY_SYNC_SECONDS
+# (a backlog of more than MEMORY_SYNC_ROWS triggers a full reload instead).
+# A full reload every MEMORY_RELOAD_SECONDS picks up feedback edits/deletes.
+# Loads page through PostgREST's 1000-row max-rows cap.
+
+import threading
+from collections import OrderedDict
+from memory_index import MemoryIndex, estimate_tokens
+
+MEMORY_TOP_K = 6
+MEMORY_TOKEN_BUDGET = 1200
+MEMORY_SYNC_SECONDS = 30
+MEMORY_RELOAD_SECONDS = 3600
+MEMORY_INDEX_ROWS = 5000        # most recently used rows indexed per tenant
+MEMORY_PAGE_ROWS = 1000         # PostgREST max-rows
+MEMORY_SYNC_ROWS = 1000         # delta rows per sync; more means reload
+MEMORY_INDEX_TENANTS = 200      # tenants indexed per worker (LRU)
+MEMORY_COLUMNS = "id,question,answer,feedback,used_count,last_used_at"
+
+_memory_indexes: "OrderedDict[int, dict]" = OrderedDict()
+_memory_lock = threading.Lock()
+
+
+def _memory_rows(company_id: int) -> list:
+    """Up to MEMORY_INDEX_ROWS most recently used rows, newest first, keyset-paged
+    on (last_used_at, id) so pages stay within max-rows."""
+    rows: list = []
+    while len(rows) < MEMORY_INDEX_ROWS:
+        params = {
+            "select": MEMORY_COLUMNS,
+            "company_id": f"eq.{company_id}",
+            "not.last_used_at.is": "null",
+            "order": "last_used_at.desc,id.desc",
+            "limit": str(min(MEMORY_PAGE_ROWS, MEMORY_INDEX_ROWS - len(rows))),
+        }
+        if rows:
+            ts, last_id = rows[-1]["last_used_at"], rows[-1]["id"]
+            params["or"] = f'(last_used_at.lt."{ts}",and(last_used_at.eq."{ts}",id.lt.{last_id}))'
+        page = sb_get("conversation_memory", params)
+        rows.extend(page)
+        if len(page) < int(params["limit"]):
+            break
+    return rows
+
+
+def _memory_load(company_id: int) -> dict:
+    rows = _memory_rows(company_id)
+    index = MemoryIndex()
+    for r in reversed(rows):
+        index.upsert(r["question"], r.get("answer"), r.get("feedback"), r.get("used_count") or 1)
+    now = time.monotonic()
+    return {
+        "index": index,
+        "watermark": max((r["last_used_at"] for r in rows if r.get("last_used_at")), default=None),
+        "synced": now,
+        "loaded": now,
+    }
+
+
+def _memory_entry(company_id: int) -> dict:
+    """This worker's index for a tenant, loaded or delta-synced as needed."""
+    company_id = int(company_id)
+    with _memory_lock:
+        entry = _memory_indexes.get(company_id)
+        if entry is not None:
+            _memory_indexes.move_to_end(company_id)
+    now = time.monotonic()
+    reload = entry is None or now - entry["loaded"] > MEMORY_RELOAD_SECONDS
+    if not reload and now - entry["synced"] > MEMORY_SYNC_SECONDS:
+        params = {"select": MEMORY_COLUMNS, "company_id": f"eq.{company_id}",
+                  "order": "last_used_at.asc", "limit": str(MEMORY_SYNC_ROWS)}
+        if entry["watermark"]:
+            params["last_used_at"] = f"gte.{entry['watermark']}"
+        rows = sb_get("conversation_memory", params)
+        if len(rows) >= MEMORY_SYNC_ROWS:
+            reload = True       # further behind than one page: rebuild instead of catching up
+        else:
+            with _memory_lock:
+                for r in rows:
+                    entry["index"].upsert(r["question"], r.get("answer"), r.get("feedback"), r.get("used_count") or 1)
+                    if r.get("last_used_at"):
+                        entry["watermark"] = max(entry["watermark"] or r["last_used_at"], r["last_used_at"])
+                entry["synced"] = now
+            MEMORY_INDEX.labels("sync").inc()
+            return entry
+    if reload:
+        entry = _memory_load(company_id)
+        with _memory_lock:
+            _memory_indexes[company_id] = entry
+            _memory_indexes.move_to_end(company_id)
+            while len(_memory_indexes) > MEMORY_INDEX_TENANTS:
+                _memory_indexes.popitem(last=False)
+        MEMORY_INDEX.labels("load").inc()
+    else:
+        MEMORY_INDEX.labels("hit").inc()
+    return entry
+
+
+def _memory_context(company_id: int, question: str) -> str:
+    """Past Q&As most relevant to `question`, rendered for the system prompt."""
+    entry = _memory_entry(company_id)
+    with _memory_lock:
+        memories = entry["index"].search(question, k=MEMORY_TOP_K, token_budget=MEMORY_TOKEN_BUDGET)
+    context = "\n".join(m.render() for m in memories)
+    MEMORY_CONTEXT_TOKENS.observe(estimate_tokens(context) if context else 0)
+    return context
+
+
+def _remember_answer(company_id: int, question: str, answer: str):
+    """Add a just-stored Q&A to this worker's index (mirrors upsert_conversation_memory)."""
+    with _memory_lock:
+        entry = _memory_indexes.get(int(company_id))
+        if entry is None:
+            return
+        index = entry["index"]
+        prev = index.get(question)
+        index.upsert(question, answer, prev.feedback if prev else None, (prev.used_count + 1) if prev else 1)
+
+
+# ============================================================
+# ANSWER CACHE (/cal/question)
+# ============================================================
+# Repeated questions ("what's overdue?") are answered from a per-worker
+# cache instead of rerunning the agent loop. Entries are grouped per tenant
+# under (tenant data version, kernel file mtime, today): any tool,
+# calibration or vendor write (migrations 017, 020), a kernel edit or a new
+# day empties the tenant's group, so a cached answer is only served while
+# the data and instructions it was computed from are unchanged. Only
+# complete answers are stored — never one cut off by max_tokens or the turn
+# limit. A question hits
+# when its normalized text matches exactly, or when its term vector is at
+# least ANSWER_CACHE_SIMILARITY cosine-similar to a cached one and both
+# carry the same identifiers/numbers (asset tags, counts, years) and
+# negations — "is GP-0012 due" never reuses the answer for GP-0013.
+
+import math
+import threading
+from collections import OrderedDict
+from memory_index import TOKEN_RE, STOPWORDS
+
+ANSWER_CACHE_SIMILARITY = float(os.getenv("ANSWER_CACHE_SIMILARITY", "0.92"))  # 1.0 = exact only
+ANSWER_CACHE_TTL = int(os.getenv("ANSWER_CACHE_TTL", "3600"))                    # seconds
+ANSWER_CACHE_PER_TENANT = 200
+ANSWER_CACHE_TENANTS = 500
+_ANSWER_KEEP_TERMS = {"no", "not", "without"}
+_ANSWER_STOPWORDS = STOPWORDS - _ANSWER_KEEP_TERMS
+
+_answer_cache: "OrderedDict[int, dict]" = OrderedDict()
+_answer_cache_lock = threading.Lock()
+
+
+def _answer_cache_kernel(company_id: int):
+    """mtime of the tenant's kernel file; the agent's answers change with it."""
+    try:
+        company = get_company(company_id)
+        return os.stat(f"/app/kernels/tenants/{company['slug']}.ttc.md").st_mtime_ns if company else None
+    except Exception:
+        return None
+
+
+def _answer_terms(question: str) -> dict[str, int]:
+    terms: dict[str, int] = {}
+    for t in TOKEN_RE.findall((question or "").lower()):
+        if (len(t) > 1 and t not in _ANSWER_STOPWORDS) or t.isdigit():
+            terms[t] = terms.get(t, 0) + 1
+    return terms
+
+
+def _answer_key_terms(terms: dict) -> frozenset:
+    """Terms that must match exactly: anything with a digit, and negations."""
+    return frozenset(t for t in terms if t in _ANSWER_KEEP_TERMS or any(c.isdigit() for c in t))
+
+
+def _cosine(a: dict, b: dict) -> float:
+    dot = sum(n * b.get(t, 0) for t, n in a.items())
+    if not dot:
+        return 0.0
+    return dot / math.sqrt(sum(n * n for n in a.values()) * sum(n * n for n in b.values()))
+
+
+def _answer_cache_get(company_id: int, version: int, question: str) -> str | None:
+    norm = " ".join(TOKEN_RE.findall(question.lower()))
+    terms = _answer_terms(question)
+    key_terms = _answer_key_terms(terms)
+    kernel = _answer_cache_kernel(company_id)
+    now = time.monotonic()
+    with _answer_cache_lock:
+        group = _answer_cache.get(company_id)
+        if group is None or group["version"] != version or group["kernel"] != kernel or group["day"] != date.today():
+            if group is not None:
+                del _answer_cache[company_id]
+            ANSWER_CACHE.labels("stale" if group is not None else "miss").inc()
+            return None
+        _answer_cache.move_to_end(company_id)
+        items = group["items"]
+        item = items.get(norm)
+        if item and now - item["at"] < ANSWER_CACHE_TTL:
+            items.move_to_end(norm)
+            ANSWER_CACHE.labels("hit_exact").inc()
+            return item["answer"]
+        if terms and ANSWER_CACHE_SIMILARITY < 1.0:
+            best, best_sim = None, ANSWER_CACHE_SIMILARITY
+            for k, it in items.items():
+                if it["key_terms"] != key_terms or now - it["at"] >= ANSWER_CACHE_TTL:
+                    continue
+                sim = _cosine(terms, it["terms"])
+                if sim >= best_sim:
+                    best, best_sim = k, sim
+            if best is not None:
+                items.move_to_end(best)
+                ANSWER_CACHE.labels("hit_similar").inc()
+                return items[best]["answer"]
+    ANSWER_CACHE.labels("miss").inc()
+    return None
+
+
+def _answer_cache_put(company_id: int, version: int, question: str, answer: str):
+    norm = " ".join(TOKEN_RE.findall(question.lower()))
+    if not norm or not answer:
+        return
+    terms = _answer_terms(question)
+    kernel = _answer_cache_kernel(company_id)
+    with _answer_cache_lock:
+        group = _answer_cache.get(company_id)
+        if group is None or group["version"] != version or group["kernel"] != kernel or group["day"] != date.today():
+            if group is not None and group["version"] > version:
+                return          # data moved on while this answer was being computed
+            group = {"version": version, "kernel": kernel, "day": date.today(), "items": OrderedDict()}
+            _answer_cache[company_id] = group
+        _answer_cache.move_to_end(company_id)
+        items = group["items"]
+        items[norm] = {"answer": answer, "terms": terms, "key_terms": _answer_key_terms(terms), "at": time.monotonic()}
+        items.move_to_end(norm)
+        while len(items) > ANSWER_CACHE_PER_TENANT:
+            items.popitem(last=False)
+        while len(_answer_cache) > ANSWER_CACHE_TENANTS:
+            _answer_cache.popitem(last=False)
+
+
+# ============================================================
+# CANNED INTENTS (/cal/question)
+# ============================================================
+# intent_router.classify() recognizes the common question shapes; each
+# handler below answers one with fixed, company-scoped queries and a short
+# spoken-style reply, skipping the Claude loop entirely. A handler returns
+# None when it can't answer with certainty (unknown asset tag, tool type
+# that matches nothing), and the question goes to the agent as before.
+
+import calendar
+from intent_router import classify as classify_question
+
+INTENT_LIST_MAX = 8            # tools read out by name before "and N more"
+INTENT_GENERIC_NOUNS = {"tool", "instrument", "equipment", "asset", "item", "device"}
+INTENT_TOOL_COLUMNS = "id,asset_tag,tool_name,tool_type,next_due_date,calibration_status,calibrating_entity,cal_vendor_id"
+
+
+def _intent_singular(phrase: str) -> str:
+    words = phrase.lower().split()
+    if not words:
+        return ""
+    w = words[-1]
+    if w.endswith(("ches", "shes", "sses", "xes")):
+        w = w[:-2]
+    elif w.endswith("s") and not w.endswith("ss"):
+        w = w[:-1]
+    return " ".join(words[:-1] + [w])
+
+
+def _intent_type_counts(company_id: int) -> dict:
+    """Active tools per tool_type (None for untyped), one GROUP BY (migration 027)."""
+    return {r["tool_type"]: int(r["n"]) for r in cal_rpc("tool_type_counts", {"p_company_id": company_id}) or []}
+
+
+def _intent_types(company_id: int, phrase: str | None, counts: dict | None = None) -> set | None:
+    """Resolve a type phrase to the tenant's tool_type values. None = no filter; empty set = no match."""
+    if not phrase:
+        return None
+    want = _intent_singular(phrase)
+    types = {t for t in (counts if counts is not None else _intent_type_counts(company_id)) if t}
+    exact = {t for t in types if _intent_singular(t) == want}
+    return exact or {t for t in types if re.search(rf"\b{re.escape(want)}\b", _intent_singular(t))}
+
+
+def _intent_due(t: dict) -> date | None:
+    try:
+        return date.fromisoformat(str(t.get("next_due_date"))[:10])
+    except (ValueError, TypeError):
+        return None
+
+
+def _intent_tool_list(tools: list) -> str:
+    names = [f"{t.get('asset_tag') or t.get('tool_name')} ({t.get('tool_name') or t.get('tool_type')}, due {_intent_due(t)})"
+             for t in tools[:INTENT_LIST_MAX]]
+    more = f", and {len(tools) - INTENT_LIST_MAX} more" if len(tools) > INTENT_LIST_MAX else ""
+    return "; ".join(names) + more + "."
+
+
+def _intent_plural(n: int, word: str) -> str:
+    return f"{n} {word}" + ("" if n == 1 else "s")
+
+
+def _intent_tools(company_id: int, types: set | None, **filters) -> list:
+    """Active tools matching `filters` (and `types`), every page, soonest due first."""
+    tools = []
+    for page in _iter_table_pages("tools", extra={
+        "select": INTENT_TOOL_COLUMNS, "company_id": f"eq.{company_id}", "active": "eq.true", **filters,
+    }):
+        tools.extend(t for t in page if types is None or t.get("tool_type") in types)
+    tools.sort(key=lambda t: (_intent_due(t) or date.max, t["id"]))
+    return tools
+
+
+def _intent_find_tool(company_id: int, tag: str) -> dict | None:
+    rows = sb_get("tools", {"select": INTENT_TOOL_COLUMNS, "company_id": f"eq.{company_id}", "asset_tag": f"ilike.{tag}"})
+    return rows[0] if len(rows) == 1 else None
+
+
+def _intent_due_range(params: dict, today: date) -> tuple[date, date]:
+    if "period" not in params:
+        return today + timedelta(days=params["from"]), today + timedelta(days=params["to"])
+    which, unit = params["period"].split("_")
+    if unit == "week":
+        start = today - timedelta(days=today.weekday())
+        if which == "next":
+            start += timedelta(days=7)
+        return max(start, today), start + timedelta(days=6)
+    year, month = today.year, today.month
+    if which == "next":
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+    start = date(year, month, 1)
+    return max(start, today), date(year, month, calendar.monthrange(year, month)[1])
+
+
+def _answer_overdue(company_id: int, params: dict, today: date) -> str | None:
+    types = _intent_types(company_id, params.get("type"))
+    if types is not None and not types:
+        return None
+    tools = _intent_tools(company_id, types, next_due_date=f"lt.{today.isoformat()}")
+    what = params.get("type") or "tools"
+    if not tools:
+        return f"Good news — no {what} are overdue right now."
+    head = f"{_intent_plural(len(tools), 'tool')} {'is' if len(tools) == 1 else 'are'} overdue"
+    if types is not None:
+        head += f" ({', '.join(sorted(types))})"
+    them, they = ("it", "it's") if len(tools) == 1 else ("them", "they're")
+    if params.get("count_only"):
+        return f"{head}. Keep {them} out of service until {they} calibrated."
+    return f"{head}: {_intent_tool_list(tools)} Pull {them} from service until {they} calibrated."
+
+
+def _answer_due_window(company_id: int, params: dict, today: date) -> str | None:
+    types = _intent_types(company_id, params.get("type"))
+    if types is not None and not types:
+        return None
+    start, end = _intent_due_range(params, today)
+    tools = _intent_tools(company_id, types, **{
+        "and": f"(next_due_date.gte.{start.isoformat()},next_due_date.lte.{end.isoformat()})",
+    })
+    what = params.get("type") or "tools"
+    if not tools:
+        return f"Nothing is due {params['label']} — no {what} fall between {start} and {end}."
+    head = f"{_intent_plural(len(tools), 'tool')} {'is' if len(tools) == 1 else 'are'} due {params['label']}"
+    if params.get("count_only"):
+        return head + f", between {start} and {end}."
+    return f"{head}: {_intent_tool_list(tools)}"
+
+
+def _answer_count_by_type(company_id: int, params: dict, today: date) -> str | None:
+    counts: dict = {}
+    for t, n in _intent_type_counts(company_id).items():
+        counts[t or "Unspecified"] = counts.get(t or "Unspecified", 0) + n
+    if not counts:
+        return "You don't have any active tools on record yet."
+    parts = [f"{n} {t}" for t, n in sorted(counts.items(), key=lambda kv: (-kv[1], kv[0]))]
+    return f"You have {_intent_plural(sum(counts.values()), 'active tool')}: {', '.join(parts)}."
+
+
+def _answer_count_type(company_id: int, params: dict, today: date) -> str | None:
+    phrase = " ".join(w for w in params["type"].split() if w not in ("active", "total"))
+    counts = _intent_type_counts(company_id)
+    types = None if _intent_singular(phrase) in INTENT_GENERIC_NOUNS else _intent_types(company_id, phrase, counts)
+    if types is not None and not types:
+        return None
+    if types is None:
+        return f"You have {_intent_plural(sum(counts.values()), 'active tool')}."
+    n = sum(counts[t] for t in types)
+    return f"You have {_intent_plural(n, 'active tool')} of type {', '.join(sorted(types))}."
+
+
+def _answer_asset_status(company_id: int, params: dict, today: date) -> str | None:
+    tool = _intent_find_tool(company_id, params["tag"])
+    if not tool:
+        return None
+    due = _intent_due(tool)
+    name = f"{tool['asset_tag']} ({tool.get('tool_name') or tool.get('tool_type')})"
+    if not due:
+        return f"{name} has no calibration due date on record."
+    days = (due - today).days
+    if days < 0:
+        return f"{name} is overdue — it was due {due}, {_intent_plural(-days, 'day')} ago. Pull it from service until it's calibrated."
+    status = "due today" if days == 0 else f"due {due}, in {_intent_plural(days, 'day')}"
+    state = "critical" if days <= 7 else "expiring soon" if days <= 30 else "current"
+    return f"{name} is {state}, {status}."
+
+
+def _answer_asset_last_cal(company_id: int, params: dict, today: date) -> str | None:
+    tool = _intent_find_tool(company_id, params["tag"])
+    if not tool:
+        return None
+    rows = sb_get("calibrations", {
+        "select": "calibration_date,result,performed_by,cert_number",
+        "tool_id": f"eq.{tool['id']}", "order": "calibration_date.desc", "limit": "1",
+    })
+    name = f"{tool['asset_tag']} ({tool.get('tool_name') or tool.get('tool_type')})"
+    if not rows:
+        return f"I don't have any calibration records for {name}."
+    c = rows[0]
+    out = f"{name} was last calibrated on {str(c.get('calibration_date'))[:10]}"
+    if c.get("performed_by"):
+        out += f" by {c['performed_by']}"
+    if c.get("result"):
+        out += f", result {c['result']}"
+    if c.get("cert_number"):
+        out += f", certificate {c['cert_number']}"
+    return out + "."
+
+
+def _answer_asset_vendor(company_id: int, params: dict, today: date) -> str | None:
+    tool = _intent_find_tool(company_id, params["tag"])
+    if not tool:
+        return None
+    name = f"{tool['asset_tag']} ({tool.get('tool_name') or tool.get('tool_type')})"
+    vendor = None
+    if tool.get("cal_vendor_id"):
+        rows = sb_get("vendors", {"select": "vendor_name,accreditation_number,nist_traceable",
+                                  "id": f"eq.{tool['cal_vendor_id']}", "company_id": f"eq.{company_id}"})
+        vendor = rows[0] if rows else None
+    if vendor:
+        out = f"{name} is calibrated by {vendor['vendor_name']}"
+        if vendor.get("accreditation_number"):
+            out += f", accreditation {vendor['accreditation_number']}"
+        return out + (", NIST traceable." if vendor.get("nist_traceable") else ".")
+    if tool.get("calibrating_entity"):
+        return f"{name} is calibrated by {tool['calibrating_entity']}."
+    return f"{name} has no calibrating vendor on record."
+
+
+INTENT_HANDLERS = {
+    "overdue": _answer_overdue,
+    "due_window": _answer_due_window,
+    "count_by_type": _answer_count_by_type,
+    "count_type": _answer_count_type,
+    "asset_status": _answer_asset_status,
+    "asset_last_cal": _answer_asset_last_cal,
+    "asset_vendor": _answer_asset_vendor,
+}
+
+
+def _answer_intent(company_id: int, question: str) -> tuple[str, str] | None:
+    """(intent, answer) for a canned question, or None to fall through to the agent."""
+    intent = classify_question(question)
+    if intent is None:
+        return None
+    t0 = time.perf_counter()
+    try:
+        answer = INTENT_HANDLERS[intent.name](company_id, intent.params, date.today())
+    except Exception as e:
+        logger.warning(f"[INTENT] {intent.name} failed for company {company_id}: {e}")
+        answer = None
+    INTENT_REQUESTS.labels(intent.name, "answered" if answer else "fallthrough").inc()
+    if answer:
+        INTENT_LATENCY.labels(intent.name).observe(time.perf_counter() - t0)
+        return intent.name, answer
+    return None
+
+
 @app.post("/cal/question")
 async def ask_question(
     req: QuestionRequest,
@@ -1597,6 +2646,25 @@ async def ask_question(
 ):
     company_id = auth["company_id"]
 
+    # Answer cache: same (or near-identical) question, unchanged data
+    try:
+        data_version = _tenant_data_version(company_id)
+    except Exception as e:
+        logger.warning(f"[ANSWER_CACHE] data version unavailable for company {company_id}: {e}")
+        data_version = None
+    if data_version is not None:
+        cached_answer = _answer_cache_get(company_id, data_version, req.question)
+        if cached_answer is not None:
+            return {"status": "success", "answer": cached_answer, "cached": True}
+
+    # Canned intents: answered from fixed queries, no agent loop
+    routed = _answer_intent(company_id, req.question)
+    if routed:
+        intent_name, answer = routed
+        if data_version is not None:
+            _answer_cache_put(company_id, data_version, req.question, answer)
+        return {"status": "success", "answer": answer, "intent": intent_name}
+
     # Load kernels
     kernel = load_tenant_kernel(None, company_id)
 
@@ -1604,19 +2672,11 @@ async def ask_question(
     faq_path = Path("/app/kernels/cal-faq.md")
     faq_knowledge = faq_path.read_text() if faq_path.exists() else ""
 
-    # Load conversation memory for this company via REST
+    # Conversation memory: only past Q&As relevant to this question
     try:
-        memories = sb_get("conversation_memory", {
-            "select": "question,answer,feedback",
-            "company_id": f"eq.{company_id}",
-            "order": "used_count.desc,created_at.desc",
-            "limit": "20",
-        })
-        memory_context = "\n".join([
-            f"Previous Q: {m['question']}\nA: {m['answer']}" + (f" (feedback: {m['feedback']})" if m.get('feedback') else "")
-            for m in memories
-        ]) if memories else ""
-    except Exception:
+        memory_context = _memory_context(company_id, req.question)
+    except Exception as e:
+        logger.warning(f"[MEMORY] retrieval failed for company {company_id}: {e}")
         memory_context = ""
 
     system_prompt = f"""{CAL_KERNEL}
@@ -1655,17 +2715,24 @@ INSTRUCTIONS:
     messages = [{"role": "user", "content": req.question}]
     max_turns = 5
     final_text = ""
+    completed = False
     total_in_tokens = 0
     total_out_tokens = 0
 
     for _ in range(max_turns):
-        response = anthropic_client.messages.create(
-            model="claude-sonnet-4-5-20250929",
-            max_tokens=2000,
-            system=system_prompt,
-            tools=[CAL_SQL_TOOL],
-            messages=messages,
-        )
+        t0 = time.perf_counter()
+        try:
+            response = anthropic_client.messages.create(
+                model="claude-sonnet-4-5-20250929",
+                max_tokens=2000,
+                system=system_prompt,
+                tools=[CAL_SQL_TOOL],
+                messages=messages,
+            )
+        except Exception:
+            CLAUDE_REQUESTS.labels("/cal/question", str(company_id), "error").inc()
+            raise
+        _observe_claude("/cal/question", company_id, response, time.perf_counter() - t0)
 
         # Accumulate token usage for metering
         total_in_tokens += response.usage.input_tokens
@@ -1679,7 +2746,8 @@ INSTRUCTIONS:
             elif block.type == "tool_use":
                 tool_calls.append(block)
 
-        if response.stop_reason == "end_turn" or not tool_calls:
+        completed = response.stop_reason == "end_turn"
+        if completed or not tool_calls:
             break
 
         # Execute tool calls and feed results back
@@ -1708,9 +2776,13 @@ INSTRUCTIONS:
             "p_question": req.question,
             "p_answer": final_text[:2000],
         })
+        _remember_answer(company_id, req.question, final_text[:2000])
     except Exception:
         pass
 
+    if data_version is not None and completed and final_text.strip():
+        _answer_cache_put(company_id, data_version, req.question, final_text)
+
     return {"status": "success", "answer": final_text}
 
 @app.post("/cal/upload-logo")
@@ -1722,11 +2794,11 @@ async def upload_logo(
     if auth["role"] != "admin":
         raise HTTPException(status_code=403, detail="Admin only")
 
-    companies = sb_get("companies", {"select": "slug", "id": f"eq.{auth['company_id']}"})
-    if not companies:
+    company = get_company(auth["company_id"])
+    if not company:
         raise HTTPException(status_code=404, detail="Company not found")
 
-    slug = companies[0]["slug"]
+    slug = company["slug"]
     logo_dir = Path(f"/app/uploads/tenants/{slug}")
     logo_dir.mkdir(parents=True, exist_ok=True)
 
@@ -1741,6 +2813,7 @@ async def upload_logo(
     file_path = logo_dir / logo_filename
     file_content = await file.read()
     file_path.write_bytes(file_content)
+    invalidate_tenant_branding(auth["company_id"])
 
     return {"status": "success", "message": f"Logo uploaded as {logo_filename}", "path": str(file_path)}
 
@@ -1815,42 +2888,226 @@ Records:
         "generated_at": datetime.utcnow().isoformat(),
     }
 
+# ============================================================
+# DATA VERSION / CONDITIONAL GET
+# ============================================================
+# cal.tenant_data_versions (migration 017) is bumped by trigger on every
+# tool/calibration write. Read endpoints derive a weak ETag from it and
+# answer If-None-Match with 304 before touching the tools table.
+
+def _tenant_data_version(company_id: int) -> int:
+    rows = sb_get("tenant_data_versions", {"select": "version", "company_id": f"eq.{company_id}"})
+    return int(rows[0]["version"]) if rows else 0
+
+
+def _etag_for(*parts) -> str:
+    import hashlib
+    return 'W/"' + hashlib.sha1("|".join(str(p) for p in parts).encode()).hexdigest()[:20] + '"'
+
+
+def _not_modified(request: Request, response: Response, etag: str) -> Response | None:
+    """Set ETag headers on the response; return a 304 if the client already has this version."""
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    response.headers.update(headers)
+    inm = request.headers.get("if-none-match", "")
+    if inm.strip() == "*" or etag in [t.strip() for t in inm.split(",")]:
+        return Response(status_code=304, headers=headers)
+    return None
+
+
 # ============================================================
 # EQUIPMENT MANAGEMENT
 # ============================================================
 
+EQUIPMENT_COLUMNS = "id,asset_tag,tool_name,tool_type,calibration_method,calibrating_entity,cal_vendor_id,manufacturer,model,serial_number,location,building,cal_interval_days,notes,calibration_status,active,last_calibration_date,next_due_date"
+EQUIPMENT_SORTABLE = {
+    "asset_tag", "tool_name", "tool_type", "manufacturer", "location", "building",
+    "calibration_status", "next_due_date", "last_calibration_date",
+}
+EQUIPMENT_SEARCH_COLUMNS = ("asset_tag", "tool_name", "manufacturer", "model", "serial_number")
+EQUIPMENT_MAX_PAGE = 500
+
+
+def _equipment_row(t: dict) -> dict:
+    return {
+        "id": t["id"], "asset_tag": t.get("asset_tag", ""),
+        "tool_name": t.get("tool_name", ""), "tool_type": t.get("tool_type", ""),
+        "calibration_method": t.get("calibration_method", ""),
+        "calibrating_entity": t.get("calibrating_entity", ""),
+        "manufacturer": t.get("manufacturer", ""),
+        "model": t.get("model", ""), "serial_number": t.get("serial_number", ""),
+        "location": t.get("location", ""), "building": t.get("building", ""),
+        "cal_interval_days": t.get("cal_interval_days"),
+        "notes": t.get("notes", ""),
+        "calibration_status": t.get("calibration_status", ""),
+        "active": t.get("active", True),
+        "last_cal_date": str(t["last_calibration_date"]) if t.get("last_calibration_date") else None,
+        "next_due_date": str(t["next_due_date"]) if t.get("next_due_date") else None,
+    }
+
+
+def _pgrst_quote(val) -> str:
+    """Double-quote a value for use inside a PostgREST or=(...) logic tree."""
+    return '"' + str(val).replace("\\", "\\\\").replace('"', '\\"') + '"'
+
+
+def _encode_cursor(data: dict) -> str:
+    import base64
+    return base64.urlsafe_b64encode(json.dumps(data, separators=(",", ":")).encode()).decode().rstrip("=")
+
+
+def _decode_cursor(cursor: str) -> dict:
+    import base64
+    try:
+        return json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def _keyset_clause(col: str, desc: bool, last_val, last_id: int) -> str:
+    """Rows strictly after (last_val, last_id) in ORDER BY col [DESC], id ASC.
+    Postgres sorts NULLs as the largest value: last when ascending, first when descending."""
+    v = _pgrst_quote(last_val) if last_val is not None else None
+    if desc:
+        if v is None:
+            return f"and({col}.is.null,id.gt.{last_id}),{col}.not.is.null"
+        return f"{col}.lt.{v},and({col}.eq.{v},id.gt.{last_id})"
+    if v is None:
+        return f"and({col}.is.null,id.gt.{last_id})"
+    return f"{col}.gt.{v},and({col}.eq.{v},id.gt.{last_id}),{col}.is.null"
+
+
+def _equipment_query(company_id: int, status: str | None, tool_type: str | None,
+                     location: str | None, building: str | None, select: str, count: str | None = None):
+    q = cal_table("tools").select(select, count=count) if count else cal_table("tools").select(select)
+    q = q.eq("company_id", company_id)
+    statuses = [x.strip() for x in (status or "").split(",") if x.strip()]
+    if len(statuses) > 1:
+        q = q.in_("calibration_status", statuses)
+    elif statuses:
+        q = q.eq("calibration_status", statuses[0])
+    if tool_type:
+        q = q.eq("tool_type", tool_type)
+    if location:
+        q = q.eq("location", location)
+    if building:
+        q = q.eq("building", building)
+    return q
+
+
 @app.get("/cal/equipment")
 async def list_equipment(
+    request: Request,
+    response: Response,
     auth: dict = Depends(verify_token),
+    limit: int | None = None,
+    cursor: str | None = None,
+    status: str | None = None,
+    type: str | None = None,
+    location: str | None = None,
+    building: str | None = None,
+    q: str | None = None,
+    sort: str | None = None,
+    count: str | None = None,
 ):
+    """List tools. With no paging/filter params this returns the full registry in the
+    original shape. Pass `limit` (and then `cursor` from `next_cursor`) for keyset pages,
+    filter with status (comma list), type, location, building and `q` (substring over
+    asset tag, name, manufacturer, model, serial). `sort` is a column, `-column` for
+    descending. `count=exact|planned|estimated` adds `total` for the filtered set.
+    Responses carry an ETag tied to the tenant data version; If-None-Match gets a 304."""
     company_id = auth["company_id"]
 
-    tools = sb_get("tools", {
-        "select": "id,asset_tag,tool_name,tool_type,calibration_method,calibrating_entity,cal_vendor_id,manufacturer,model,serial_number,location,building,cal_interval_days,notes,calibration_status,active,last_calibration_date,next_due_date",
+    version = _tenant_data_version(company_id)
+    cached = _not_modified(request, response, _etag_for("equipment", company_id, version, request.url.query))
+    if cached:
+        return cached
+
+    if not any([limit, cursor, status, type, location, building, q, sort, count]):
+        tools = sb_get("tools", {
+            "select": EQUIPMENT_COLUMNS,
+            "company_id": f"eq.{company_id}",
+            "order": "tool_type,asset_tag",
+        })
+        return {"equipment": [_equipment_row(t) for t in tools], "total": len(tools)}
+
+    sort = sort or "asset_tag"
+    desc = sort.startswith("-")
+    col = sort.lstrip("-")
+    if col not in EQUIPMENT_SORTABLE:
+        raise HTTPException(status_code=400, detail=f"sort must be one of {sorted(EQUIPMENT_SORTABLE)}")
+    if count and count not in ("exact", "planned", "estimated"):
+        raise HTTPException(status_code=400, detail="count must be exact, planned or estimated")
+    limit = max(1, min(limit or 100, EQUIPMENT_MAX_PAGE))
+
+    ors = []
+    if q:
+        needle = _pgrst_quote(f"*{q.strip()}*")
+        ors.append(",".join(f"{c}.ilike.{needle}" for c in EQUIPMENT_SEARCH_COLUMNS))
+    if cursor:
+        c = _decode_cursor(cursor)
+        if c.get("s") != sort:
+            raise HTTPException(status_code=400, detail="Cursor does not match sort")
+        ors.append(_keyset_clause(col, desc, c.get("v"), int(c.get("id", 0))))
+
+    query = _equipment_query(company_id, status, type, location, building, EQUIPMENT_COLUMNS)
+    if len(ors) == 1:
+        query = query.or_(ors[0])
+    elif ors:
+        query = query.or_("and(" + ",".join(f"or({o})" for o in ors) + ")")
+    query = query.order(col, desc=desc).order("id").limit(limit + 1)
+    with _observe_supabase("select", "tools"):
+        tools = query.execute().data or []
+
+    next_cursor = None
+    if len(tools) > limit:
+        tools = tools[:limit]
+        last = tools[-1]
+        next_cursor = _encode_cursor({"s": sort, "v": last.get(col), "id": last["id"]})
+
+    result = {"equipment": [_equipment_row(t) for t in tools], "next_cursor": next_cursor}
+    if count:
+        # Total over the filtered set, not the remaining pages — so no cursor clause.
+        cq = _equipment_query(company_id, status, type, location, building, "id", count=count)
+        if q:
+            cq = cq.or_(ors[0])
+        with _observe_supabase("count", "tools"):
+            result["total"] = cq.limit(1).execute().count
+    return result
+
+@app.get("/cal/equipment/changes")
+async def equipment_changes(
+    since: int = 0,
+    auth: dict = Depends(verify_token),
+):
+    """Delta sync: tools changed and tool ids deleted after data version `since`.
+    Clients store the returned `version` and pass it as `since` next time."""
+    company_id = auth["company_id"]
+    version = _tenant_data_version(company_id)
+    if since > version:
+        # Client is ahead of the server (e.g. after a restore) — it must refetch everything.
+        return {"version": version, "full_resync": True, "changed": [], "deleted": []}
+    if since == version:
+        return {"version": version, "full_resync": False, "changed": [], "deleted": []}
+
+    changed = sb_get("tools", {
+        "select": EQUIPMENT_COLUMNS + ",data_version",
         "company_id": f"eq.{company_id}",
-        "order": "tool_type,asset_tag",
+        "data_version": f"gt.{since}",
+        "order": "data_version.asc",
     })
-
+    deleted = sb_get("row_tombstones", {
+        "select": "row_id",
+        "table_name": "eq.tools",
+        "company_id": f"eq.{company_id}",
+        "data_version": f"gt.{since}",
+    })
+    changed_ids = {t["id"] for t in changed}
     return {
-        "equipment": [
-            {
-                "id": t["id"], "asset_tag": t.get("asset_tag", ""),
-                "tool_name": t.get("tool_name", ""), "tool_type": t.get("tool_type", ""),
-                "calibration_method": t.get("calibration_method", ""),
-                "calibrating_entity": t.get("calibrating_entity", ""),
-                "manufacturer": t.get("manufacturer", ""),
-                "model": t.get("model", ""), "serial_number": t.get("serial_number", ""),
-                "location": t.get("location", ""), "building": t.get("building", ""),
-                "cal_interval_days": t.get("cal_interval_days"),
-                "notes": t.get("notes", ""),
-                "calibration_status": t.get("calibration_status", ""),
-                "active": t.get("active", True),
-                "last_cal_date": str(t["last_calibration_date"]) if t.get("last_calibration_date") else None,
-                "next_due_date": str(t["next_due_date"]) if t.get("next_due_date") else None,
-            }
-            for t in tools
-        ],
-        "total": len(tools),
+        "version": version,
+        "full_resync": False,
+        "changed": [_equipment_row(t) for t in changed],
+        "deleted": sorted({d["row_id"] for d in deleted} - changed_ids),
     }
 
 @app.post("/cal/equipment")
@@ -1883,6 +3140,7 @@ async def add_equipment(
         "notes": eq.notes,
         "active": True,
     })
+    _refresh_dashboard_snapshot(company_id)
 
     return {"status": "success", "message": f"Tool {eq.asset_tag} added."}
 
@@ -1947,6 +3205,9 @@ async def import_tools(
             errors.append({"row": i, "asset_tag": asset_tag, "reason": str(e)[:200]})
             skipped += 1
 
+    if imported:
+        _refresh_dashboard_snapshot(company_id)
+
     return {
         "status": "done",
         "imported": imported,
@@ -1958,12 +3219,9 @@ async def import_tools(
 # DASHBOARD DATA
 # ============================================================
 
-@app.get("/cal/dashboard")
-async def dashboard(
-    auth: dict = Depends(verify_token),
-):
-    company_id = auth["company_id"]
-
+def _dashboard_from_tools(company_id: int) -> dict:
+    """Compute the dashboard summary from the tools table. Fallback for when the
+    snapshot RPC (migration 018) is unavailable."""
     # Get all tools for this company
     all_tools = sb_get("tools", {
         "select": "id,asset_tag,tool_name,tool_type,manufacturer,calibration_status,next_due_date",
@@ -1980,7 +3238,6 @@ async def dashboard(
         status_counts[s] = status_counts.get(s, 0) + 1
 
     # Categorize by date
-    from datetime import date
     today = date.today()
     upcoming = []
     overdue_list = []
@@ -2029,6 +3286,35 @@ async def dashboard(
         ],
     }
 
+
+def _refresh_dashboard_snapshot(company_id: int):
+    """Recompute the stored dashboard summary after a tool/calibration write."""
+    try:
+        cal_rpc("refresh_dashboard_snapshot", {"p_company_id": company_id})
+    except Exception as e:
+        logger.warning(f"[DASHBOARD] snapshot refresh failed for company {company_id}: {e}")
+
+
+@app.get("/cal/dashboard")
+async def dashboard(
+    request: Request,
+    response: Response,
+    auth: dict = Depends(verify_token),
+):
+    """Served from cal.dashboard_snapshots: one keyed RPC that only recomputes when the
+    stored snapshot is from an older data version or an earlier day."""
+    company_id = auth["company_id"]
+    try:
+        snap = cal_rpc("dashboard_snapshot", {"p_company_id": company_id})
+    except Exception as e:
+        logger.warning(f"[DASHBOARD] snapshot unavailable for company {company_id}: {e}")
+        return _dashboard_from_tools(company_id)
+
+    cached = _not_modified(request, response, _etag_for("dashboard", company_id, snap["data_version"], snap["as_of"]))
+    if cached:
+        return cached
+    return snap["summary"]
+
 # ============================================================
 # HEALTH
 # ============================================================
@@ -2117,8 +3403,8 @@ async def get_usage(auth: dict = Depends(verify_token)):
     total_tokens = sum(u.get("tokens_in", 0) + u.get("tokens_out", 0) for u in usage)
 
     # Get plan cap
-    company = sb_get("companies", {"select": "subscription_plan", "id": f"eq.{company_id}"})
-    plan = company[0]["subscription_plan"] if company else "basic"
+    company = get_company(company_id)
+    plan = company["subscription_plan"] if company else "basic"
     cap = PLAN_AI_CAPS.get(plan, PLAN_AI_CAPS["basic"])
 
     # Breakdown by endpoint
@@ -2171,72 +3457,48 @@ def _validate_email_domains(addresses: str, allowed_domains: list[str]) -> tuple
             rejected.append(email)
     return len(rejected) == 0, rejected
 
-def _build_email_signature(company_id: int) -> str:
-    """Build branded HTML email signature with AI agent disclaimer."""
-    branding = load_tenant_branding(company_id)
-    co_name = branding.get("company_name", "Calibration Agent")
-    primary = branding.get("primary_color", "#003366")
-    accent = branding.get("accent_color", "#CC0000")
-    font = branding.get("font", "Helvetica")
-    phone = branding.get("phone", "")
-    web = branding.get("web", "")
-    address_lines = branding.get("address_lines", [])
-
-    address_html = "<br>".join(address_lines) if address_lines else ""
-    phone_html = f'<br>Phone: <a href="tel:{phone}" style="color:{primary};text-decoration:none;">{phone}</a>' if phone else ""
-    web_html = f'<br><a href="https://{web}" style="color:{primary};text-decoration:none;">{web}</a>' if web else ""
-
-    return f"""
-<div style="margin-top:32px;padding-top:16px;border-top:2px solid {primary};font-family:{font},Arial,sans-serif;">
-  <table cellpadding="0" cellspacing="0" border="0" style="font-size:13px;color:#333;">
-    <tr>
-      <td style="padding-right:16px;border-right:3px solid {accent};">
-        <strong style="font-size:15px;color:{primary};">Cal</strong>
-        <br><span style="font-size:11px;color:#666;">AI Calibration Agent</span>
-      </td>
-      <td style="padding-left:16px;">
-        <strong style="color:{primary};">{co_name}</strong>
-        <br><span style="font-size:12px;color:#555;">{address_html}</span>
-        {phone_html}
-        {web_html}
-      </td>
-    </tr>
-  </table>
-  <p style="font-size:10px;color:#999;margin-top:12px;line-height:1.4;">
-    This message was generated by Cal, an AI-powered calibration management agent
-    operated by {co_name} Quality Department.
-    For questions or corrections, contact your Quality Manager directly.
-  </p>
-  <p style="font-size:9px;color:#b0b0b0;margin-top:8px;line-height:1.3;font-style:italic;">
-    Cal is currently in supervised evaluation. Information provided is generated from
-    calibration records and should be independently verified against your quality
-    management system prior to taking action. {co_name} Quality Department maintains
-    full authority over all calibration decisions and compliance determinations.
-  </p>
-</div>
-"""
-
-def _send_mailgun(sender: str, to: str, subject: str, body: str, cc: str = "") -> bool:
-    """Send email via Mailgun. Returns True on success."""
+def _build_email_signature(company_id: int, company: dict | None = None) -> str:
+    """Branded HTML email signature with AI agent disclaimer, rendered once per branding version."""
+    entry = _branding_entry(company_id, company)
+    if not entry:
+        return render_signature({"company_name": "Unknown", "slug": "unknown"})
+    if entry["signature"] is None:
+        entry["signature"] = render_signature(entry["branding"])
+    return entry["signature"]
+
+def _mailgun_precheck(to: str, cc: str = "") -> str | None:
+    """Safety gates shared by inline and queued sends. Returns the outcome label
+    (not_configured / blocked / dry_run) when the message must not reach Mailgun."""
     if not MAILGUN_API_KEY:
         logger.warning("MAILGUN_API_KEY not set — skipping email")
-        return False
+        MAILGUN_SENDS.labels("not_configured").inc()
+        return "not_configured"
 
     # --- DOMAIN SAFETY GUARD ---
     to_ok, to_rejected = _validate_email_domains(to, EMAIL_ALLOWED_DOMAINS)
     if not to_ok:
         logger.error(f"[EMAIL BLOCKED] TO addresses outside allowed domains: {to_rejected}. Allowed: {EMAIL_ALLOWED_DOMAINS}")
-        return False
+        MAILGUN_SENDS.labels("blocked").inc()
+        return "blocked"
     if cc:
         cc_ok, cc_rejected = _validate_email_domains(cc, EMAIL_ALLOWED_DOMAINS)
         if not cc_ok:
             logger.error(f"[EMAIL BLOCKED] CC addresses outside allowed domains: {cc_rejected}. Allowed: {EMAIL_ALLOWED_DOMAINS}")
-            return False
+            MAILGUN_SENDS.labels("blocked").inc()
+            return "blocked"
 
     # --- DRY RUN ---
     if EMAIL_DRY_RUN:
-        logger.info(f"[EMAIL DRY-RUN] Would send to={to} cc={cc} subject={subject}")
-        return True
+        logger.info(f"[EMAIL DRY-RUN] Would send to={to} cc={cc}")
+        MAILGUN_SENDS.labels("dry_run").inc()
+        return "dry_run"
+    return None
+
+def _send_mailgun(sender: str, to: str, subject: str, body: str, cc: str = "") -> bool:
+    """Send email via Mailgun. Returns True on success."""
+    gate = _mailgun_precheck(to, cc)
+    if gate:
+        return gate == "dry_run"
 
     data = {"from": sender, "to": to, "subject": subject, "html": body}
     if cc:
@@ -2248,9 +3510,11 @@ def _send_mailgun(sender: str, to: str, subject: str, body: str, cc: str = "") -
             data=data,
             timeout=15,
         )
+        MAILGUN_SENDS.labels("sent" if r.status_code == 200 else "failed").inc()
         return r.status_code == 200
     except Exception as e:
         logger.error(f"Mailgun send failed: {e}")
+        MAILGUN_SENDS.labels("error").inc()
         return False
 
 def _log_email(company_id: int, sender: str, to: str, subject: str, body: str, status: str):
@@ -2269,14 +3533,234 @@ def _log_email(company_id: int, sender: str, to: str, subject: str, body: str, s
         pass
 
 def _get_company_settings(company_id: int) -> dict:
-    """Load all cal.settings rows for a company into a flat dict."""
+    """Load all cal.settings rows for a company into a flat dict (tenant cache)."""
+    hit, settings = _tenant_cache_get("settings", int(company_id))
+    if hit:
+        return dict(settings)
     try:
         rows = sb_get("settings", {"select": "key,value", "company_id": f"eq.{company_id}"})
-        return {r["key"]: r["value"] for r in rows}
+        settings = {r["key"]: r["value"] for r in rows}
+        _tenant_cache_put("settings", int(company_id), settings)
+        return dict(settings)
     except Exception as e:
         logger.warning(f"[SETTINGS] Failed to load settings for company {company_id}: {e}")
         return {}
 
+
+def save_company_settings(company_id: int, values: dict) -> dict:
+    """Upsert several cal.settings keys in one statement (migration 026) and return the
+    tenant's merged settings. This worker's settings cache is refreshed with the result."""
+    if not values:
+        return _get_company_settings(company_id)
+    settings = cal_rpc("upsert_company_settings", {
+        "p_company_id": int(company_id),
+        "p_settings": values,
+    }) or {}
+    _tenant_cache_put("settings", int(company_id), settings)
+    return dict(settings)
+
+# ============================================================
+# EMAIL OUTBOX (migration 023)
+# ============================================================
+# Jobs and handlers call _enqueue_email(s); each worker's async sender
+# claims due rows (SKIP LOCKED), sends through one pooled httpx client under
+# per-recipient-domain token buckets, retries 429/5xx/network errors with
+# exponential backoff, and writes email_log + on_delivered follow-ups from
+# the final outcome. Multi-recipient To lists without CC go out as one
+# Mailgun batch call with recipient-variables (one private copy each).
+
+import asyncio
+import random
+
+OUTBOX_POLL_SECONDS = 5
+OUTBOX_CLAIM_LIMIT = 20
+OUTBOX_CONCURRENCY = 8          # in-flight Mailgun requests per worker
+OUTBOX_DOMAIN_RATE = 2.0        # sends/second per recipient domain, per worker
+OUTBOX_DOMAIN_BURST = 5
+OUTBOX_BACKOFF_BASE = 30        # seconds before the 2nd attempt; doubles each retry
+OUTBOX_BACKOFF_MAX = 3600
+OUTBOX_WORKER_ID = f"{os.uname().nodename}:{os.getpid()}"
+
+
+def _email_recipients(addresses: str) -> list[str]:
+    return [a.strip() for a in (addresses or "").split(",") if a.strip()]
+
+
+def _mark_alerted_action(tools: list, level: str) -> dict:
+    """on_delivered payload: stamp last_alert_* on these tools once the email is sent."""
+    return {"mark_alerted": {"level": level, "tool_ids": [t["id"] for t in tools]}}
+
+
+def _outbox_row(company_id: int, sender: str, to: str, subject: str, body: str, cc: str = "",
+                log_subject: str | None = None, category: str | None = None,
+                is_html: bool = True, on_delivered: dict | None = None) -> dict:
+    recipients = _email_recipients(to)
+    return {
+        "company_id": company_id, "category": category, "sender": sender,
+        "to_address": to, "cc_address": cc or None,
+        "subject": subject, "log_subject": log_subject, "body": body, "is_html": is_html,
+        "recipient_variables": {r: {"email": r} for r in recipients} if len(recipients) > 1 and not cc else None,
+        "on_delivered": on_delivered,
+    }
+
+
+def _enqueue_emails_each(rows: list) -> list[bool]:
+    """Queue outbox rows (built by _outbox_row) in one insert; one flag per row, True when
+    it was queued (or, with the outbox unavailable, sent inline so alerts still go out)."""
+    if not rows:
+        return []
+    try:
+        with _observe_supabase("insert", "email_outbox"):
+            cal_table("email_outbox").insert(rows).execute()
+        return [True] * len(rows)
+    except Exception as e:
+        logger.error(f"[OUTBOX] enqueue failed ({e}) — sending {len(rows)} inline")
+    results = []
+    for row in rows:
+        ok = _send_mailgun(row["sender"], row["to_address"], row["subject"], row["body"], row["cc_address"] or "")
+        _log_email(row["company_id"], row["sender"], row["to_address"],
+                   row["log_subject"] or row["subject"], row["body"], "sent" if ok else "failed")
+        if ok:
+            _outbox_on_delivered(row.get("on_delivered"))
+        results.append(ok)
+    return results
+
+
+def _enqueue_emails(rows: list) -> int:
+    """Queue outbox rows in one insert. Returns how many were accepted (see _enqueue_emails_each)."""
+    return sum(_enqueue_emails_each(rows))
+
+
+def _enqueue_email(company_id: int, sender: str, to: str, subject: str, body: str, cc: str = "", **kwargs) -> bool:
+    return _enqueue_emails([_outbox_row(company_id, sender, to, subject, body, cc, **kwargs)]) == 1
+
+
+def _outbox_on_delivered(action: dict | None):
+    if not action:
+        return
+    mark = action.get("mark_alerted")
+    if mark and mark.get("tool_ids"):
+        ids = [str(i) for i in mark["tool_ids"]]
+        sent_at = datetime.utcnow().isoformat()
+        for i in range(0, len(ids), 200):   # keep the in.(...) filter well under URL limits
+            try:
+                sb_patch("tools", {"id": f"in.({','.join(ids[i:i + 200])})"}, {
+                    "last_alert_sent_at": sent_at,
+                    "last_alert_level": mark["level"],
+                })
+            except Exception as e:
+                logger.warning(f"[ALERT] Failed to mark tools {ids[i:i + 200]} as alerted: {e}")
+
+
+class _DomainRateLimiter:
+    """Token bucket per recipient domain (single event loop, no locking needed)."""
+
+    def __init__(self, rate: float, burst: int):
+        self.rate, self.burst = rate, burst
+        self.buckets: dict = {}
+
+    async def acquire(self, domain: str):
+        while True:
+            now = time.monotonic()
+            tokens, last = self.buckets.get(domain, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - last) * self.rate)
+            if tokens >= 1:
+                self.buckets[domain] = (tokens - 1, now)
+                return
+            self.buckets[domain] = (tokens, now)
+            await asyncio.sleep((1 - tokens) / self.rate)
+
+
+async def _outbox_deliver(client: httpx.AsyncClient, row: dict) -> tuple[str, str | None, str | None]:
+    """One Mailgun attempt. Returns (outcome, provider_message_id, error) with
+    outcome sent | retry | dead."""
+    gate = _mailgun_precheck(row["to_address"], row.get("cc_address") or "")
+    if gate == "dry_run":
+        return "sent", None, None
+    if gate:
+        return "dead", None, gate
+
+    data = {
+        "from": row["sender"],
+        "to": _email_recipients(row["to_address"]),
+        "subject": row["subject"],
+        "html" if row.get("is_html", True) else "text": row["body"],
+    }
+    if row.get("cc_address"):
+        data["cc"] = row["cc_address"]
+    if row.get("recipient_variables"):
+        data["recipient-variables"] = json.dumps(row["recipient_variables"])
+    try:
+        r = await client.post(f"https://api.mailgun.net/v3/{MAILGUN_DOMAIN}/messages",
+                              auth=("api", MAILGUN_API_KEY), data=data)
+    except httpx.HTTPError as e:
+        MAILGUN_SENDS.labels("error").inc()
+        return "retry", None, f"{type(e).__name__}: {e}"[:300]
+    if r.status_code == 200:
+        MAILGUN_SENDS.labels("sent").inc()
+        return "sent", r.json().get("id"), None
+    MAILGUN_SENDS.labels("failed").inc()
+    error = f"HTTP {r.status_code}: {r.text[:200]}"
+    return ("retry" if r.status_code == 429 or r.status_code >= 500 else "dead"), None, error
+
+
+def _outbox_finish(row: dict, outcome: str, provider_id: str | None, error: str | None):
+    """Persist the attempt result; on a final outcome write email_log and run on_delivered."""
+    now = datetime.utcnow()
+    if outcome == "retry" and row["attempts"] < row["max_attempts"]:
+        delay = min(OUTBOX_BACKOFF_BASE * 2 ** (row["attempts"] - 1), OUTBOX_BACKOFF_MAX)
+        delay *= random.uniform(0.8, 1.2)
+        sb_patch("email_outbox", {"id": f"eq.{row['id']}"}, {
+            "status": "queued", "locked_by": None, "last_error": error,
+            "next_attempt_at": (now + timedelta(seconds=delay)).isoformat(),
+        })
+        logger.warning(f"[OUTBOX] message {row['id']} attempt {row['attempts']} failed ({error}) — retry in {delay:.0f}s")
+        return
+    sent = outcome == "sent"
+    sb_patch("email_outbox", {"id": f"eq.{row['id']}"}, {
+        "status": "sent" if sent else "dead", "locked_by": None, "last_error": error,
+        "provider_message_id": provider_id, "sent_at": now.isoformat() if sent else None,
+    })
+    if not sent:
+        logger.error(f"[OUTBOX] message {row['id']} dead after {row['attempts']} attempts: {error}")
+    _log_email(row["company_id"], row["sender"], row["to_address"],
+               row.get("log_subject") or row["subject"], row["body"], "sent" if sent else "failed")
+    if sent:
+        _outbox_on_delivered(row.get("on_delivered"))
+
+
+async def _outbox_process(client: httpx.AsyncClient, limiter: _DomainRateLimiter,
+                          slots: asyncio.Semaphore, row: dict):
+    try:
+        first = (_email_recipients(row["to_address"]) or ["@unknown"])[0]
+        await limiter.acquire(first.rsplit("@", 1)[-1].strip("> ").lower())
+        async with slots:
+            outcome, provider_id, error = await _outbox_deliver(client, row)
+        await asyncio.to_thread(_outbox_finish, row, outcome, provider_id, error)
+    except Exception as e:
+        logger.error(f"[OUTBOX] message {row.get('id')} processing error: {e}")
+
+
+async def _outbox_sender_loop():
+    """Runs for the life of the worker (started from lifespan)."""
+    limiter = _DomainRateLimiter(OUTBOX_DOMAIN_RATE, OUTBOX_DOMAIN_BURST)
+    slots = asyncio.Semaphore(OUTBOX_CONCURRENCY)
+    limits = httpx.Limits(max_connections=OUTBOX_CONCURRENCY, max_keepalive_connections=OUTBOX_CONCURRENCY)
+    async with httpx.AsyncClient(timeout=15, limits=limits) as client:
+        while True:
+            try:
+                rows = await asyncio.to_thread(cal_rpc, "claim_email_outbox", {
+                    "p_worker": OUTBOX_WORKER_ID, "p_limit": OUTBOX_CLAIM_LIMIT,
+                }) or []
+            except Exception as e:
+                logger.warning(f"[OUTBOX] claim failed: {e}")
+                rows = []
+            if rows:
+                await asyncio.gather(*(_outbox_process(client, limiter, slots, r) for r in rows))
+            if len(rows) < OUTBOX_CLAIM_LIMIT:
+                await asyncio.sleep(OUTBOX_POLL_SECONDS)
+
+
 def _process_cert_attachment(company_id: int, filename: str, content: bytes, mime_type: str, email_log_id=None) -> dict:
     """Extract calibration data from cert bytes, create cal record + attachment. Returns status dict.
     Shared by /cal/upload and /api/email/ingest."""
@@ -2358,6 +3842,7 @@ result: pass=within spec, adjusted=corrected during visit, out_of_tolerance=not
         "next_due_date": data.get("next_due_date"),
         "calibration_status": "current",
     })
+    _refresh_dashboard_snapshot(company_id)
     if email_log_id and cal_record.get("id"):
         try:
             sb_patch("email_log", {"id": f"eq.{email_log_id}"}, {
@@ -2380,232 +3865,217 @@ result: pass=within spec, adjusted=corrected during visit, out_of_tolerance=not
 # ANALYTICS FUNCTIONS (Fix 3, 4, 5, 9, 10)
 # ============================================================
 
-def failure_rate_by_type(company_id: int) -> list:
-    """Failure/OOT rate per tool_type. Flags types with >10% non-pass rate."""
+# Aggregation runs in Postgres (migration 019). Results are cached per
+# (company_id, report, params) and tagged with the tenant data version
+# (migrations 017/020): a per-worker LRU in front of the shared
+# cal.analytics_cache table. An entry from an older version is served
+# stale (up to ANALYTICS_STALE_MAX old) while one background refresh
+# recomputes it. Date-relative reports keep one row per params too: an
+# entry computed on an earlier day is stale, and yesterday's is still
+# served while today's is computed.
+
+import threading
+import functools
+import inspect
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+ANALYTICS_CACHE_MAX = 2000                   # L1 entries per worker
+ANALYTICS_STALE_MAX = timedelta(hours=6)     # oldest result served while revalidating
+_analytics_l1: OrderedDict = OrderedDict()
+_analytics_lock = threading.Lock()
+_analytics_refreshing: set = set()
+_analytics_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="analytics-swr")
+
+
+def _analytics_l1_get(key: tuple) -> dict | None:
+    with _analytics_lock:
+        entry = _analytics_l1.get(key)
+        if entry is not None:
+            _analytics_l1.move_to_end(key)
+        return entry
+
+
+def _analytics_l1_put(key: tuple, entry: dict):
+    with _analytics_lock:
+        _analytics_l1[key] = entry
+        _analytics_l1.move_to_end(key)
+        while len(_analytics_l1) > ANALYTICS_CACHE_MAX:
+            _analytics_l1.popitem(last=False)
+
+
+def _analytics_l2_get(key: tuple) -> dict | None:
+    company_id, report, params_key = key
     try:
-        tools = sb_get("tools", {"select": "id,tool_type", "company_id": f"eq.{company_id}", "active": "eq.true"})
-        if not tools:
-            return []
-        tool_map = {t["id"]: t.get("tool_type", "Unknown") for t in tools}
-        tool_ids = ",".join(str(t["id"]) for t in tools)
-        cals = sb_get("calibrations", {"select": "tool_id,result", f"tool_id": f"in.({tool_ids})"})
-        by_type: dict = {}
-        for c in cals:
-            tt = tool_map.get(c["tool_id"], "Unknown")
-            by_type.setdefault(tt, {"total": 0, "failures": 0})
-            by_type[tt]["total"] += 1
-            if c.get("result") in ("fail", "out_of_tolerance"):
-                by_type[tt]["failures"] += 1
-        result = []
-        for tt, counts in by_type.items():
-            if counts["total"] < 3:
-                continue
-            pct = round(counts["failures"] * 100.0 / counts["total"], 1)
-            result.append({"tool_type": tt, "total": counts["total"],
-                           "failures": counts["failures"], "failure_pct": pct, "flagged": pct > 10})
-        return sorted(result, key=lambda x: -x["failure_pct"])
+        rows = sb_get("analytics_cache", {
+            "select": "data_version,result,computed_at",
+            "company_id": f"eq.{company_id}", "report": f"eq.{report}", "params_key": f"eq.{params_key}",
+        })
     except Exception as e:
-        logger.warning(f"[ANALYTICS] failure_rate_by_type: {e}")
-        return []
+        logger.warning(f"[ANALYTICS] cache read failed for {report}: {e}")
+        return None
+    if not rows:
+        return None
+    return {
+        "version": int(rows[0]["data_version"]),
+        "result": rows[0]["result"],
+        "computed_at": datetime.fromisoformat(str(rows[0]["computed_at"]).replace("Z", "+00:00")).timestamp(),
+    }
 
-def interval_variance_report(company_id: int) -> list:
-    """Compare avg actual calibration interval vs planned (cal_interval_days) per tool_type."""
+
+def _analytics_store(key: tuple, version: int, compute) -> any:
+    company_id, report, params_key = key
+    result = compute()
+    entry = {"version": version, "result": result, "computed_at": time.time()}
+    _analytics_l1_put(key, entry)
     try:
-        tools = sb_get("tools", {
-            "select": "id,tool_type,cal_interval_days",
-            "company_id": f"eq.{company_id}", "active": "eq.true",
-        })
-        if not tools:
-            return []
-        tool_map = {t["id"]: t for t in tools}
-        tool_ids = ",".join(str(t["id"]) for t in tools)
-        cals = sb_get("calibrations", {
-            "select": "tool_id,calibration_date",
-            f"tool_id": f"in.({tool_ids})",
-            "order": "tool_id.asc,calibration_date.asc",
-        })
-        # Group by tool_id, compute consecutive diffs
-        by_tool: dict = {}
-        for c in cals:
-            tid = c["tool_id"]
-            if not c.get("calibration_date"):
-                continue
-            by_tool.setdefault(tid, []).append(c["calibration_date"][:10])
-        # Compute intervals per tool
-        type_intervals: dict = {}  # {tool_type: [actual_days, ...]}
-        for tid, dates in by_tool.items():
-            if len(dates) < 2:
-                continue
-            tool = tool_map.get(tid, {})
-            tt = tool.get("tool_type", "Unknown")
-            planned = tool.get("cal_interval_days")
-            if not planned:
-                continue
-            for i in range(1, len(dates)):
-                try:
-                    diff = (date.fromisoformat(dates[i]) - date.fromisoformat(dates[i-1])).days
-                    if diff > 0:
-                        type_intervals.setdefault(tt, {"diffs": [], "planned": planned})["diffs"].append(diff)
-                except Exception:
-                    pass
-        result = []
-        for tt, data in type_intervals.items():
-            if not data["diffs"]:
-                continue
-            avg_actual = round(sum(data["diffs"]) / len(data["diffs"]))
-            planned = data["planned"]
-            ratio = avg_actual / planned if planned else 1
-            flag = "over-calibrating (cost waste)" if ratio < 0.8 else \
-                   "under-calibrating (compliance risk)" if ratio > 1.2 else "on target"
-            result.append({
-                "tool_type": tt, "planned_days": planned, "avg_actual_days": avg_actual,
-                "ratio": round(ratio, 2), "sample_size": len(data["diffs"]), "flag": flag,
-            })
-        return sorted(result, key=lambda x: x["ratio"])
+        sb_upsert("analytics_cache", [{
+            "company_id": company_id, "report": report, "params_key": params_key,
+            "data_version": version, "result": result, "computed_at": datetime.utcnow().isoformat(),
+        }], on_conflict="company_id,report,params_key")
     except Exception as e:
-        logger.warning(f"[ANALYTICS] interval_variance_report: {e}")
-        return []
+        logger.warning(f"[ANALYTICS] cache write failed for {report}: {e}")
+    return result
 
-def vendor_turnaround_report(company_id: int) -> list:
-    """Avg turnaround days vs SLA per vendor. Flags SLA violations."""
+
+def _analytics_revalidate(key: tuple, compute):
     try:
-        tools = sb_get("tools", {"select": "id", "company_id": f"eq.{company_id}", "active": "eq.true"})
-        if not tools:
-            return []
-        tool_ids = ",".join(str(t["id"]) for t in tools)
-        cals = sb_get("calibrations", {
-            "select": "performed_by,sent_to_vendor_date,received_from_vendor_date",
-            f"tool_id": f"in.({tool_ids})",
-            "not.sent_to_vendor_date.is": "null",
-            "not.received_from_vendor_date.is": "null",
-        })
-        vendors = sb_get("vendors", {"select": "vendor_name,sla_days", "company_id": f"eq.{company_id}"})
-        sla_map = {v["vendor_name"].lower(): v.get("sla_days", 14) for v in vendors}
-        by_vendor: dict = {}
-        for c in cals:
-            name = c.get("performed_by", "Unknown")
-            try:
-                days = (date.fromisoformat(str(c["received_from_vendor_date"])[:10]) -
-                        date.fromisoformat(str(c["sent_to_vendor_date"])[:10])).days
-                if days >= 0:
-                    by_vendor.setdefault(name, []).append(days)
-            except Exception:
-                pass
-        result = []
-        for name, days_list in by_vendor.items():
-            avg = round(sum(days_list) / len(days_list), 1)
-            sla = sla_map.get(name.lower(), 14)
-            result.append({"vendor": name, "avg_turnaround_days": avg, "sla_days": sla,
-                           "sample_size": len(days_list), "sla_exceeded": avg > sla})
-        return sorted(result, key=lambda x: -x["avg_turnaround_days"])
+        _analytics_store(key, _tenant_data_version(key[0]), compute)
     except Exception as e:
-        logger.warning(f"[ANALYTICS] vendor_turnaround_report: {e}")
-        return []
+        logger.warning(f"[ANALYTICS] background refresh of {key[1]} for company {key[0]} failed: {e}")
+    finally:
+        with _analytics_lock:
+            _analytics_refreshing.discard(key)
+
+
+def _analytics_cached(report: str, fallback, daily: bool = False):
+    """Cache an analytics report. `fallback()` is returned when computing fails and
+    nothing is cached; `daily` marks date-relative reports, whose entries go stale at midnight."""
+    def wrap(fn):
+        sig = inspect.signature(fn)
+
+        @functools.wraps(fn)
+        def cached(company_id: int, *args, **kwargs):
+            bound = sig.bind(company_id, *args, **kwargs)
+            bound.apply_defaults()
+            params = {k: v for k, v in bound.arguments.items() if k != "company_id"}
+            compute = lambda: fn(*bound.args, **bound.kwargs)
+            key = (company_id, report, json.dumps(params, sort_keys=True, separators=(",", ":"), default=str))
+            today = date.today()
+
+            def current(e: dict) -> bool:
+                return e["version"] == version and (not daily or date.fromtimestamp(e["computed_at"]) == today)
+
+            try:
+                version = _tenant_data_version(company_id)
+            except Exception as e:
+                logger.warning(f"[ANALYTICS] data version unavailable, computing {report} uncached: {e}")
+                try:
+                    return compute()
+                except Exception as e:
+                    logger.warning(f"[ANALYTICS] {fn.__name__}: {e}")
+                    return fallback()
+
+            entry = _analytics_l1_get(key)
+            if entry is None or not current(entry):
+                shared = _analytics_l2_get(key)
+                if shared and (entry is None or (shared["version"], shared["computed_at"]) > (entry["version"], entry["computed_at"])):
+                    entry = shared
+                    _analytics_l1_put(key, entry)
+
+            if entry and current(entry):
+                ANALYTICS_CACHE.labels(report, "hit").inc()
+                return entry["result"]
+
+            if entry and (time.time() - entry["computed_at"] < ANALYTICS_STALE_MAX.total_seconds()
+                          or (daily and entry["version"] == version
+                              and date.fromtimestamp(entry["computed_at"]) == today - timedelta(days=1))):
+                ANALYTICS_CACHE.labels(report, "stale").inc()
+                with _analytics_lock:
+                    schedule = key not in _analytics_refreshing
+                    _analytics_refreshing.add(key)
+                if schedule:
+                    _analytics_pool.submit(_analytics_revalidate, key, compute)
+                return entry["result"]
+
+            ANALYTICS_CACHE.labels(report, "miss").inc()
+            try:
+                return _analytics_store(key, version, compute)
+            except Exception as e:
+                logger.warning(f"[ANALYTICS] {fn.__name__}: {e}")
+                return entry["result"] if entry else fallback()
+        return cached
+    return wrap
 
+
+@_analytics_cached("failure_rates", fallback=list)
+def failure_rate_by_type(company_id: int) -> list:
+    """Failure/OOT rate per tool_type. Flags types with >10% non-pass rate."""
+    return cal_rpc("analytics_failure_rates", {"p_company_id": company_id}) or []
+
+@_analytics_cached("interval_variance", fallback=list)
+def interval_variance_report(company_id: int) -> list:
+    """Compare avg actual calibration interval vs planned (cal_interval_days) per tool_type."""
+    return cal_rpc("analytics_interval_variance", {"p_company_id": company_id}) or []
+
+@_analytics_cached("vendor_turnaround", fallback=list)
+def vendor_turnaround_report(company_id: int) -> list:
+    """Avg turnaround days vs SLA per vendor. Flags SLA violations."""
+    return cal_rpc("analytics_vendor_turnaround", {"p_company_id": company_id}) or []
+
+@_analytics_cached("cost_projection", daily=True,
+                   fallback=lambda: {"total_estimated": 0, "by_type": [], "confidence": "low"})
 def cost_projection(company_id: int, days: int = 90) -> dict:
     """Estimate calibration costs for next {days} days using historical avg cost per type."""
-    try:
-        tools = sb_get("tools", {"select": "id,tool_type", "company_id": f"eq.{company_id}", "active": "eq.true"})
-        if not tools:
-            return {"total_estimated": 0, "by_type": [], "confidence": "low"}
-        tool_map = {t["id"]: t.get("tool_type", "Unknown") for t in tools}
-        tool_ids = ",".join(str(t["id"]) for t in tools)
-        # Historical cost by tool_type
-        all_cals = sb_get("calibrations", {"select": "tool_id,cost", f"tool_id": f"in.({tool_ids})"})
-        cost_by_type: dict = {}
-        for c in all_cals:
-            cost = c.get("cost")
-            if cost is None:
-                continue
-            tt = tool_map.get(c["tool_id"], "Unknown")
-            cost_by_type.setdefault(tt, []).append(float(cost))
-        # Upcoming tools
-        cutoff = (date.today() + timedelta(days=days)).isoformat()
-        upcoming = sb_get("tools", {
-            "select": "tool_type",
-            "company_id": f"eq.{company_id}", "active": "eq.true",
-            "next_due_date": f"lte.{cutoff}",
-            "next_due_date": f"gte.{date.today().isoformat()}",
-        })
-        upcoming_counts: dict = {}
-        for t in upcoming:
-            tt = t.get("tool_type", "Unknown")
-            upcoming_counts[tt] = upcoming_counts.get(tt, 0) + 1
-        total = 0.0
-        by_type = []
-        for tt, count in upcoming_counts.items():
-            costs = cost_by_type.get(tt, [])
-            avg_cost = round(sum(costs) / len(costs), 2) if costs else 0
-            estimated = round(avg_cost * count, 2)
-            confidence = "high" if len(costs) >= 5 else "medium" if len(costs) >= 2 else "low"
-            by_type.append({"tool_type": tt, "upcoming_count": count,
-                           "avg_historical_cost": avg_cost, "estimated": estimated, "confidence": confidence})
-            total += estimated
-        overall_confidence = "high" if all(b["confidence"] == "high" for b in by_type) else \
-                            "low" if all(b["confidence"] == "low" for b in by_type) else "medium"
-        return {"total_estimated": round(total, 2), "by_type": sorted(by_type, key=lambda x: -x["estimated"]),
-                "confidence": overall_confidence, "days_ahead": days}
-    except Exception as e:
-        logger.warning(f"[ANALYTICS] cost_projection: {e}")
-        return {"total_estimated": 0, "by_type": [], "confidence": "low"}
+    return cal_rpc("analytics_cost_projection", {"p_company_id": company_id, "p_days": days})
 
+@_analytics_cached("seasonal", daily=True,
+                   fallback=lambda: {"monthly_counts": {}, "peak_months": [], "avg_monthly": 0})
 def seasonal_analysis(company_id: int) -> dict:
     """Monthly calibration volume over 24 months. Flags months >1.5x average."""
+    return cal_rpc("analytics_seasonal", {"p_company_id": company_id})
+
+def _build_tool_table_html(tools: list) -> str:
+    """Build an HTML table of tools for email."""
+    return render_tool_table(tools)
+
+def _tools_in_transition(company_id: int, select: str, today: date, order: str | None = None) -> list:
+    """Active tools whose next_transition_date (migration 024) is due — the only ones whose
+    status or alerts can change today. Falls back to every active tool if the column is missing."""
+    params = {"select": select, "company_id": f"eq.{company_id}", "active": "eq.true"}
+    if order:
+        params["order"] = order
     try:
-        tools = sb_get("tools", {"select": "id", "company_id": f"eq.{company_id}", "active": "eq.true"})
-        if not tools:
-            return {"monthly_counts": {}, "peak_months": [], "avg_monthly": 0}
-        tool_ids = ",".join(str(t["id"]) for t in tools)
-        cutoff_start = (date.today().replace(day=1) - timedelta(days=730)).isoformat()
-        cals = sb_get("calibrations", {
-            "select": "calibration_date",
-            f"tool_id": f"in.({tool_ids})",
-            "calibration_date": f"gte.{cutoff_start}",
+        return sb_get("tools", {**params, "next_transition_date": f"lte.{today.isoformat()}"})
+    except Exception as e:
+        logger.warning(f"[CRON] next_transition_date filter failed for company {company_id} ({e}) — scanning all tools")
+        return sb_get("tools", params)
+
+
+def _advance_transition_dates(company_id: int, today: date):
+    """Move tools handled today on to their next transition (as of tomorrow)."""
+    try:
+        cal_rpc("advance_transition_dates", {
+            "p_company_id": company_id,
+            "p_as_of": (today + timedelta(days=1)).isoformat(),
         })
-        monthly: dict = {}
-        for c in cals:
-            d = c.get("calibration_date", "")
-            if not d or len(d) < 7:
-                continue
-            month_key = str(d)[:7]  # YYYY-MM
-            monthly[month_key] = monthly.get(month_key, 0) + 1
-        if not monthly:
-            return {"monthly_counts": {}, "peak_months": [], "avg_monthly": 0}
-        avg = sum(monthly.values()) / len(monthly)
-        peak_months = [m for m, cnt in monthly.items() if cnt > avg * 1.5]
-        return {
-            "monthly_counts": dict(sorted(monthly.items())),
-            "peak_months": sorted(peak_months),
-            "avg_monthly": round(avg, 1),
-        }
     except Exception as e:
-        logger.warning(f"[ANALYTICS] seasonal_analysis: {e}")
-        return {"monthly_counts": {}, "peak_months": [], "avg_monthly": 0}
+        logger.warning(f"[CRON] advance_transition_dates failed for company {company_id}: {e}")
 
-def _build_tool_table_html(tools: list) -> str:
-    """Build an HTML table of tools for email."""
-    rows = ""
-    for t in tools:
-        ndd = t.get("next_due_date") or t.get("next_calibration_date") or "N/A"
-        if isinstance(ndd, str) and len(ndd) > 10:
-            ndd = ndd[:10]
-        rows += f"<tr><td>{t.get('asset_tag','')}</td><td>{t.get('tool_name','')}</td><td>{t.get('tool_type','')}</td><td>{t.get('calibrating_entity','')}</td><td>{ndd}</td></tr>\n"
-    return f"""<table border="1" cellpadding="6" cellspacing="0" style="border-collapse:collapse;font-family:Helvetica,sans-serif;font-size:13px;">
-<tr style="background:#003366;color:white;"><th>Asset Tag</th><th>Tool Name</th><th>Type</th><th>Calibrating Entity</th><th>Due Date</th></tr>
-{rows}</table>"""
-
-def refresh_statuses():
-    """Recalculate calibration_status for all active tools across all companies."""
-    companies = sb_get("companies", {"select": "id"})
+
+def refresh_statuses(run: dict | None = None):
+    """Recalculate calibration_status for active tools crossing a threshold today.
+    With a ledger `run`, each finished company is checkpointed and skipped on resume."""
+    companies = sb_get("companies", {"select": "id", "order": "id.asc"})
+    _job_set_total(run, len(companies))
     today = date.today()
     updated = 0
     for co in companies:
         cid = co["id"]
-        tools = sb_get("tools", {
-            "select": "id,next_due_date,calibration_status",
-            "company_id": f"eq.{cid}",
-            "active": "eq.true",
-        })
+        if _job_is_done(run, cid):
+            continue
+        changes: dict = {}
+        tools = _tools_in_transition(cid, "id,next_due_date,calibration_status", today)
         for t in tools:
             ndd = t.get("next_due_date")
             if not ndd:
@@ -2624,8 +4094,15 @@ def refresh_statuses():
             else:
                 new_status = "current"
             if t.get("calibration_status") != new_status:
-                sb_patch("tools", {"id": f"eq.{t['id']}"}, {"calibration_status": new_status})
-                updated += 1
+                changes.setdefault(new_status, []).append(str(t["id"]))
+        for new_status, ids in changes.items():
+            for i in range(0, len(ids), 200):
+                sb_patch("tools", {"id": f"in.({','.join(ids[i:i + 200])})"}, {"calibration_status": new_status})
+        company_updated = sum(len(ids) for ids in changes.values())
+        updated += company_updated
+        # Re-bucket for the new day even when no status changed.
+        _refresh_dashboard_snapshot(cid)
+        _job_checkpoint(run, cid, tools_updated=company_updated)
     logger.info(f"[CRON] refresh_statuses: updated {updated} tools")
     return updated
 
@@ -2647,41 +4124,39 @@ def _should_alert_tool(tool: dict, level: str, days: int) -> bool:
     return False
 
 
-def _mark_tool_alerted(tool_id: int, level: str):
-    """Update last_alert_sent_at and last_alert_level on a tool."""
-    try:
-        sb_patch("tools", {"id": f"eq.{tool_id}"}, {
-            "last_alert_sent_at": datetime.utcnow().isoformat(),
-            "last_alert_level": level,
-        })
-    except Exception as e:
-        logger.warning(f"[ALERT] Failed to mark tool {tool_id} as alerted: {e}")
-
-
-def enforcement_scan():
-    """Scan all companies for overdue/expiring tools and send enforcement emails.
-    Features: alert dedup (per-tool), progressive milestones (30/14/7/3/1/0d)."""
-    companies = sb_get("companies", {"select": "id,name,slug"})
+def enforcement_scan(run: dict | None = None):
+    """Scan all companies for overdue/expiring tools and queue enforcement emails.
+    Features: alert dedup (per-tool), progressive milestones (30/14/7/3/1/0d), sent as one
+    digest per milestone and recipient list unless the tenant sets notify_milestone_mode=per_tool.
+    Tools are marked alerted by the outbox sender once the email is actually delivered.
+    Only tools whose next_transition_date is due are read; they are advanced per tenant afterwards.
+    With a ledger `run`, companies already emailed by a failed earlier attempt are skipped."""
+    companies = sb_get("companies", {"select": "id,name,slug", "order": "id.asc"})
+    _job_set_total(run, len(companies))
     today = date.today()
     total_emails = 0
 
     for co in companies:
         cid, co_name, slug = co["id"], co["name"], co["slug"]
         sender = f"Cal - {co_name} <cal@{slug}.gp3.app>"
+        if _job_is_done(run, cid):
+            continue
+        emails_before = total_emails
 
         kernel_path = Path(f"/app/kernels/tenants/{slug}.ttc.md")
         if not kernel_path.exists():
+            _advance_transition_dates(cid, today)
+            _job_checkpoint(run, cid, emails_sent=0)
             continue
 
         notify = _get_company_settings(cid)
         signature = _build_email_signature(cid)
 
-        tools = sb_get("tools", {
-            "select": "id,asset_tag,tool_name,tool_type,calibration_method,calibrating_entity,calibration_status,next_due_date,last_alert_sent_at,last_alert_level",
-            "company_id": f"eq.{cid}",
-            "active": "eq.true",
-            "order": "next_due_date.asc.nullslast",
-        })
+        tools = _tools_in_transition(
+            cid,
+            "id,asset_tag,tool_name,tool_type,calibration_method,calibrating_entity,calibration_status,next_due_date,last_alert_sent_at,last_alert_level",
+            today, order="next_due_date.asc.nullslast",
+        )
 
         overdue = []
         critical = []
@@ -2720,192 +4195,120 @@ def enforcement_scan():
         # --- OVERDUE ---
         if overdue:
             table_html = _build_tool_table_html(overdue)
-            body = f"""<div style="font-family:Helvetica,sans-serif;">
-<h2 style="color:#CC0000;">[ACTION REQUIRED] {len(overdue)} Overdue Calibrations</h2>
-<p>The following tools have <strong>expired calibrations</strong> and must be <strong>removed from service immediately</strong> per ISO 9001 and company policy.</p>
-{table_html}
-<p style="margin-top:16px;"><strong>Required actions:</strong></p>
-<ul>
-<li>Remove all listed tools from service NOW</li>
-<li>Tag with red "OUT OF CALIBRATION" labels</li>
-<li>Schedule calibration with approved vendor immediately</li>
-<li>Document removal in quality records</li>
-</ul>
-{signature}
-</div>"""
+            body = overdue_body(count=len(overdue), table=table_html, signature=signature)
             to = notify.get("notify_overdue_to", "")
             cc = notify.get("notify_overdue_cc", "")
             if not to:
                 logger.warning(f"[CRON] notify_overdue_to not set for company {cid} — skipping overdue email")
             else:
-                sent = _send_mailgun(sender, to, f"[ACTION REQUIRED] {len(overdue)} Overdue Calibrations — Remove From Service", body, cc)
-                _log_email(cid, sender, to, f"[ACTION REQUIRED] {len(overdue)} Overdue Calibrations", body, "sent" if sent else "failed")
-                if sent:
+                if _enqueue_email(cid, sender, to, f"[ACTION REQUIRED] {len(overdue)} Overdue Calibrations — Remove From Service", body, cc,
+                                  log_subject=f"[ACTION REQUIRED] {len(overdue)} Overdue Calibrations", category="overdue",
+                                  on_delivered=_mark_alerted_action(overdue, "overdue")):
                     total_emails += 1
-                    for t in overdue:
-                        _mark_tool_alerted(t["id"], "overdue")
 
         # --- CRITICAL (<=7d) ---
         if critical:
             table_html = _build_tool_table_html(critical)
-            body = f"""<div style="font-family:Helvetica,sans-serif;">
-<h2 style="color:#CC6600;">[URGENT] {len(critical)} Calibrations Due Within 7 Days</h2>
-<p>The following tools require calibration within the next 7 days:</p>
-{table_html}
-<p><strong>Action:</strong> Schedule these calibrations immediately to avoid overdue status.</p>
-{signature}
-</div>"""
+            body = critical_body(count=len(critical), table=table_html, signature=signature)
             to = notify.get("notify_critical_to", "")
             cc = notify.get("notify_critical_cc", "")
             if not to:
                 logger.warning(f"[CRON] notify_critical_to not set for company {cid} — skipping critical email")
             else:
-                sent = _send_mailgun(sender, to, f"[URGENT] {len(critical)} Calibrations Due Within 7 Days", body, cc)
-                _log_email(cid, sender, to, f"[URGENT] {len(critical)} Calibrations Due Within 7 Days", body, "sent" if sent else "failed")
-                if sent:
+                if _enqueue_email(cid, sender, to, f"[URGENT] {len(critical)} Calibrations Due Within 7 Days", body, cc,
+                                  log_subject=f"[URGENT] {len(critical)} Calibrations Due Within 7 Days", category="critical",
+                                  on_delivered=_mark_alerted_action(critical, "critical")):
                     total_emails += 1
-                    for t in critical:
-                        _mark_tool_alerted(t["id"], "critical")
 
         # --- WARNING (<=30d) ---
         if warning:
             table_html = _build_tool_table_html(warning)
             vendor_tools = [t for t in warning if t.get("calibration_method", "").lower().startswith("vendor")]
-            body = f"""<div style="font-family:Helvetica,sans-serif;">
-<h2 style="color:#003366;">[NOTICE] {len(warning)} Calibrations Due Within 30 Days</h2>
-<p>Plan ahead — the following tools need calibration soon:</p>
-{table_html}
-{signature}
-</div>"""
+            body = warning_body(count=len(warning), table=table_html, signature=signature)
             to = notify.get("notify_warning_to", "")
             cc = notify.get("notify_warning_cc", "")
             if not to:
                 logger.warning(f"[CRON] notify_warning_to not set for company {cid} — skipping warning email")
             else:
-                sent = _send_mailgun(sender, to, f"[NOTICE] {len(warning)} Calibrations Due Within 30 Days", body, cc)
-                _log_email(cid, sender, to, f"[NOTICE] {len(warning)} Calibrations Due Within 30 Days", body, "sent" if sent else "failed")
-                if sent:
+                if _enqueue_email(cid, sender, to, f"[NOTICE] {len(warning)} Calibrations Due Within 30 Days", body, cc,
+                                  log_subject=f"[NOTICE] {len(warning)} Calibrations Due Within 30 Days", category="warning",
+                                  on_delivered=_mark_alerted_action(warning, "warning")):
                     total_emails += 1
-                    for t in warning:
-                        _mark_tool_alerted(t["id"], "warning")
 
             # Purchasing notification for vendor-calibrated tools
             if vendor_tools:
                 vendor_table = _build_tool_table_html(vendor_tools)
-                po_body = f"""<div style="font-family:Helvetica,sans-serif;">
-<h2 style="color:#003366;">[CAL REQUEST] {len(vendor_tools)} Tools Need Vendor Calibration</h2>
-<p>The following vendor-calibrated tools are due within 30 days. Please initiate purchase orders with the listed calibrating entities:</p>
-{vendor_table}
-<p><strong>Contact the Quality Department for vendor details and shipping instructions.</strong></p>
-{signature}
-</div>"""
+                po_body = purchasing_body(count=len(vendor_tools), table=vendor_table, signature=signature)
                 to = notify.get("notify_purchasing_to", "")
                 cc = notify.get("notify_purchasing_cc", "")
                 if not to:
                     logger.warning(f"[CRON] notify_purchasing_to not set for company {cid} — skipping purchasing email")
                 else:
-                    sent = _send_mailgun(sender, to, f"[CAL REQUEST] {len(vendor_tools)} Tools Need Vendor Calibration", po_body, cc)
-                    _log_email(cid, sender, to, f"[CAL REQUEST] {len(vendor_tools)} Vendor Calibrations", po_body, "sent" if sent else "failed")
-                    if sent:
+                    if _enqueue_email(cid, sender, to, f"[CAL REQUEST] {len(vendor_tools)} Tools Need Vendor Calibration", po_body, cc,
+                                      log_subject=f"[CAL REQUEST] {len(vendor_tools)} Vendor Calibrations", category="purchasing"):
                         total_emails += 1
 
         # --- PROGRESSIVE MILESTONE ALERTS ---
+        digest = notify.get("notify_milestone_mode", "digest") != "per_tool"
+        groups: dict = {}
         for t in milestone_alerts:
             days = t["_days_until"]
-            tag = t.get("asset_tag", "?")
-            name = t.get("tool_name", "Unknown")
-            if days == 0:
-                subj = f"[TODAY] Calibration Due Today: {tag} — {name}"
-                color = "#CC0000"
-                urgency = "Calibration is due <strong>TODAY</strong>."
-            elif days == 1:
-                subj = f"[TOMORROW] Calibration Due Tomorrow: {tag} — {name}"
-                color = "#CC3300"
-                urgency = "Calibration is due <strong>tomorrow</strong>."
-            elif days == 3:
-                subj = f"[3 DAYS] Calibration Due in 3 Days: {tag} — {name}"
-                color = "#CC6600"
-                urgency = "Calibration is due in <strong>3 days</strong>."
-            elif days == 7:
-                subj = f"[1 WEEK] Calibration Due in 7 Days: {tag} — {name}"
-                color = "#CC6600"
-                urgency = "Calibration is due in <strong>1 week</strong>."
-            elif days == 14:
-                subj = f"[2 WEEKS] Calibration Due in 14 Days: {tag} — {name}"
-                color = "#336699"
-                urgency = "Calibration is due in <strong>2 weeks</strong>."
-            elif days == 30:
-                subj = f"[30 DAYS] Calibration Due in 30 Days: {tag} — {name}"
-                color = "#003366"
-                urgency = "Calibration is due in <strong>30 days</strong>. Plan ahead."
-            else:
-                continue
-
-            body = f"""<div style="font-family:Helvetica,sans-serif;">
-<h2 style="color:{color};">{subj}</h2>
-<p>{urgency}</p>
-<table style="border-collapse:collapse;margin:12px 0;">
-<tr><td style="padding:4px 12px;font-weight:bold;">Asset Tag:</td><td>{tag}</td></tr>
-<tr><td style="padding:4px 12px;font-weight:bold;">Tool:</td><td>{name}</td></tr>
-<tr><td style="padding:4px 12px;font-weight:bold;">Type:</td><td>{t.get("tool_type","")}</td></tr>
-<tr><td style="padding:4px 12px;font-weight:bold;">Method:</td><td>{t.get("calibration_method","")}</td></tr>
-<tr><td style="padding:4px 12px;font-weight:bold;">Vendor:</td><td>{t.get("calibrating_entity","")}</td></tr>
-<tr><td style="padding:4px 12px;font-weight:bold;">Due Date:</td><td>{t.get("next_due_date","")}</td></tr>
-</table>
-{signature}
-</div>"""
             to = notify.get("notify_critical_to", "") if days <= 7 else notify.get("notify_warning_to", "")
             cc = notify.get("notify_critical_cc", "") if days <= 7 else notify.get("notify_warning_cc", "")
-            if to:
-                sent = _send_mailgun(sender, to, subj, body, cc)
-                _log_email(cid, sender, to, subj, body, "sent" if sent else "failed")
-                if sent:
-                    total_emails += 1
-                    _mark_tool_alerted(t["id"], f"milestone-d{days}")
-
-    logger.info(f"[CRON] enforcement_scan: sent {total_emails} emails")
-    return total_emails
-
-def weekly_summary():
-    """Send weekly compliance summary to quality managers."""
-    companies = sb_get("companies", {"select": "id,name,slug"})
-    today = date.today()
-    total_emails = 0
+            if to and days in MILESTONE_STYLES:
+                groups.setdefault((days, to, cc), []).append(t)
+
+        milestone_rows = []
+        for (days, to, cc), hits in groups.items():
+            label, when, color, phrase = MILESTONE_STYLES[days]
+            level = f"milestone-d{days}"
+            if digest and len(hits) > 1:
+                subj = f"[{label}] {len(hits)} Calibrations Due {when}"
+                body = milestone_digest_body(
+                    color=color, subject=subj, urgency=f"{len(hits)} calibrations are due {phrase}.",
+                    table=_build_tool_table_html(hits), signature=signature,
+                )
+                milestone_rows.append(_outbox_row(cid, sender, to, subj, body, cc, category="milestone",
+                                                  on_delivered=_mark_alerted_action(hits, level)))
+                continue
+            for t in hits:
+                tag = t.get("asset_tag", "?")
+                name = t.get("tool_name", "Unknown")
+                subj = f"[{label}] Calibration Due {when}: {tag} — {name}"
+                body = milestone_body(
+                    color=color, subject=subj, urgency=f"Calibration is due {phrase}.", tag=tag, name=name,
+                    tool_type=t.get("tool_type", ""), method=t.get("calibration_method", ""),
+                    vendor=t.get("calibrating_entity", ""), due=t.get("next_due_date", ""),
+                    signature=signature,
+                )
+                milestone_rows.append(_outbox_row(cid, sender, to, subj, body, cc, category="milestone",
+                                                  on_delivered=_mark_alerted_action([t], level)))
+        total_emails += _enqueue_emails(milestone_rows)
 
-    for co in companies:
-        cid, co_name, slug = co["id"], co["name"], co["slug"]
-        sender = f"Cal - {co_name} <cal@{slug}.gp3.app>"
+        _advance_transition_dates(cid, today)
+        _job_checkpoint(run, cid, emails_sent=total_emails - emails_before)
 
-        kernel_path = Path(f"/app/kernels/tenants/{slug}.ttc.md")
-        if not kernel_path.exists():
-            continue
+    logger.info(f"[CRON] enforcement_scan: queued {total_emails} emails")
+    return total_emails
 
-        notify = _get_company_settings(cid)
-        signature = _build_email_signature(cid)
+WEEKLY_BATCH_SIZE = 100     # tenants per weekly_summary_batch RPC
 
-        tools = sb_get("tools", {
-            "select": "id,calibration_status,next_due_date,tool_type",
-            "company_id": f"eq.{cid}",
-            "active": "eq.true",
-        })
 
-        total = len(tools)
-        counts = {"current": 0, "expiring_soon": 0, "critical": 0, "overdue": 0, "unknown": 0}
-        for t in tools:
-            s = t.get("calibration_status") or "unknown"
-            counts[s] = counts.get(s, 0) + 1
+def _render_weekly_summary(co_name: str, report: dict, signature: str, today: date) -> tuple[str, float]:
+    """Build the weekly summary HTML from a weekly_summary_batch entry.
+    Returns (body, compliance_pct)."""
+    total = report.get("total", 0)
+    counts = {"current": 0, "expiring_soon": 0, "critical": 0, "overdue": 0, "unknown": 0}
+    counts.update(report.get("status_counts") or {})
 
-        compliant = counts.get("current", 0)
-        compliance_pct = round(compliant * 100.0 / max(total, 1), 1)
+    compliant = counts.get("current", 0)
+    compliance_pct = round(compliant * 100.0 / max(total, 1), 1)
 
-        # Type breakdown
-        type_counts = {}
-        for t in tools:
-            tt = t.get("tool_type") or "Uncategorized"
-            type_counts[tt] = type_counts.get(tt, 0) + 1
-        type_rows = "".join(f"<tr><td>{k}</td><td>{v}</td></tr>" for k, v in sorted(type_counts.items(), key=lambda x: -x[1]))
+    # Type breakdown
+    type_counts = report.get("type_counts") or {}
+    type_rows = "".join(f"<tr><td>{k}</td><td>{v}</td></tr>" for k, v in sorted(type_counts.items(), key=lambda x: -x[1]))
 
-        body = f"""<div style="font-family:Helvetica,sans-serif;">
+    body = f"""<div style="font-family:Helvetica,sans-serif;">
 <h2 style="color:#003366;">Weekly Calibration Summary — {co_name}</h2>
 <p><strong>Week of {today.isoformat()}</strong></p>
 
@@ -2926,43 +4329,43 @@ def weekly_summary():
 {type_rows}
 </table>
 """
-        # --- Analytics: failure rates ---
-        fail_rates = failure_rate_by_type(cid)
-        flagged_types = [r for r in fail_rates if r["flagged"]]
-        if flagged_types:
-            fail_rows = "".join(
-                f"<tr style='color:red;'><td>{r['tool_type']}</td><td>{r['failure_pct']}%</td><td>{r['failures']}/{r['total']}</td></tr>"
-                for r in flagged_types
-            )
-            body += f"""<h3 style="color:#CC0000;">⚠ High Failure Rate Alert</h3>
+    # --- Analytics: failure rates ---
+    fail_rates = report.get("failure_rates") or []
+    flagged_types = [r for r in fail_rates if r["flagged"]]
+    if flagged_types:
+        fail_rows = "".join(
+            f"<tr style='color:red;'><td>{r['tool_type']}</td><td>{r['failure_pct']}%</td><td>{r['failures']}/{r['total']}</td></tr>"
+            for r in flagged_types
+        )
+        body += f"""<h3 style="color:#CC0000;">⚠ High Failure Rate Alert</h3>
 <table border="1" cellpadding="6" cellspacing="0" style="border-collapse:collapse;font-size:13px;">
 <tr style="background:#CC0000;color:white;"><th>Tool Type</th><th>Failure Rate</th><th>Failures/Total</th></tr>
 {fail_rows}
 </table>
 <p style="font-size:12px;">Tools in these categories have fail/OOT rates above 10%. Review calibration procedures or reduce intervals.</p>
 """
-        # --- Analytics: vendor turnaround ---
-        turnaround = vendor_turnaround_report(cid)
-        exceeded = [v for v in turnaround if v["sla_exceeded"]]
-        if exceeded:
-            ta_rows = "".join(
-                f"<tr style='color:orange;'><td>{v['vendor']}</td><td>{v['avg_turnaround_days']}d</td><td>{v['sla_days']}d</td><td>{v['sample_size']}</td></tr>"
-                for v in exceeded
-            )
-            body += f"""<h3 style="color:#CC6600;">⚠ Vendor SLA Violations</h3>
+    # --- Analytics: vendor turnaround ---
+    turnaround = report.get("vendor_turnaround") or []
+    exceeded = [v for v in turnaround if v["sla_exceeded"]]
+    if exceeded:
+        ta_rows = "".join(
+            f"<tr style='color:orange;'><td>{v['vendor']}</td><td>{v['avg_turnaround_days']}d</td><td>{v['sla_days']}d</td><td>{v['sample_size']}</td></tr>"
+            for v in exceeded
+        )
+        body += f"""<h3 style="color:#CC6600;">⚠ Vendor SLA Violations</h3>
 <table border="1" cellpadding="6" cellspacing="0" style="border-collapse:collapse;font-size:13px;">
 <tr style="background:#CC6600;color:white;"><th>Vendor</th><th>Avg Turnaround</th><th>SLA</th><th>Samples</th></tr>
 {ta_rows}
 </table>
 """
-        # --- Analytics: cost projection ---
-        proj = cost_projection(cid, days=90)
-        if proj["total_estimated"] > 0:
-            cost_rows = "".join(
-                f"<tr><td>{b['tool_type']}</td><td>{b['upcoming_count']}</td><td>${b['avg_historical_cost']:.2f}</td><td><strong>${b['estimated']:.2f}</strong></td></tr>"
-                for b in proj["by_type"]
-            )
-            body += f"""<h3>90-Day Cost Projection</h3>
+    # --- Analytics: cost projection ---
+    proj = report.get("cost_projection") or {"total_estimated": 0, "by_type": [], "confidence": "low"}
+    if proj["total_estimated"] > 0:
+        cost_rows = "".join(
+            f"<tr><td>{b['tool_type']}</td><td>{b['upcoming_count']}</td><td>${b['avg_historical_cost']:.2f}</td><td><strong>${b['estimated']:.2f}</strong></td></tr>"
+            for b in proj["by_type"]
+        )
+        body += f"""<h3>90-Day Cost Projection</h3>
 <table border="1" cellpadding="6" cellspacing="0" style="border-collapse:collapse;font-size:13px;">
 <tr style="background:#003366;color:white;"><th>Type</th><th>Count Due</th><th>Avg Cost</th><th>Estimated</th></tr>
 {cost_rows}
@@ -2970,20 +4373,156 @@ def weekly_summary():
 </table>
 <p style="font-size:11px;color:#666;">Confidence: {proj['confidence']} (based on historical records)</p>
 """
-        body += f'{signature}\n</div>'
-        to = notify.get("notify_summary_to", "")
-        cc = notify.get("notify_summary_cc", "")
+    body += f'{signature}\n</div>'
+    return body, compliance_pct
+
+
+def weekly_summary(run: dict | None = None):
+    """Send weekly compliance summary to quality managers.
+
+    Batched across tenants: per WEEKLY_BATCH_SIZE tenants, one settings query for
+    recipients and one weekly_summary_batch RPC for counts and analytics; all
+    emails are rendered, then queued to the email outbox in one insert."""
+    companies = sb_get("companies", {"select": "id,name,slug", "order": "id.asc"})
+    _job_set_total(run, len(companies))
+    today = date.today()
+
+    pending = []
+    for co in companies:
+        if _job_is_done(run, co["id"]):
+            continue
+        if not Path(f"/app/kernels/tenants/{co['slug']}.ttc.md").exists():
+            _job_checkpoint(run, co["id"], emails_sent=0)
+            continue
+        pending.append(co)
+
+    recipients: dict = {}
+    reports: dict = {}
+    for i in range(0, len(pending), WEEKLY_BATCH_SIZE):
+        ids = [co["id"] for co in pending[i:i + WEEKLY_BATCH_SIZE]]
+        try:
+            # At most 2 rows per tenant, so a batch stays well under PostgREST max-rows.
+            batch_recipients: dict = {}
+            for r in sb_get("settings", {
+                "select": "company_id,key,value",
+                "company_id": f"in.({','.join(str(c) for c in ids)})",
+                "key": "in.(notify_summary_to,notify_summary_cc)",
+            }):
+                batch_recipients.setdefault(r["company_id"], {})[r["key"]] = r["value"]
+            batch_reports = {rep["company_id"]: rep for rep in cal_rpc("weekly_summary_batch", {"p_company_ids": ids}) or []}
+            recipients.update(batch_recipients)
+            reports.update(batch_reports)
+        except Exception as e:
+            logger.error(f"[CRON] weekly_summary batch {ids[0]}..{ids[-1]} failed: {e}")
+
+    outbox = []
+    for co in pending:
+        cid, co_name, slug = co["id"], co["name"], co["slug"]
+        if cid not in reports:
+            continue  # batch failed — left uncheckpointed so a rerun retries it
+        to = recipients.get(cid, {}).get("notify_summary_to", "")
+        cc = recipients.get(cid, {}).get("notify_summary_cc", "")
         if not to:
             logger.warning(f"[CRON] notify_summary_to not set for company {cid} — skipping weekly summary")
-        else:
-            sent = _send_mailgun(sender, to, f"Weekly Calibration Summary — {compliance_pct}% Compliant", body, cc)
-            _log_email(cid, sender, to, f"Weekly Calibration Summary", body, "sent" if sent else "failed")
-            if sent:
-                total_emails += 1
+            _job_checkpoint(run, cid, emails_sent=0)
+            continue
+        body, compliance_pct = _render_weekly_summary(
+            co_name, reports[cid], _build_email_signature(cid, company=co), today)
+        sender = f"Cal - {co_name} <cal@{slug}.gp3.app>"
+        outbox.append(_outbox_row(cid, sender, to, f"Weekly Calibration Summary — {compliance_pct}% Compliant", body, cc,
+                                  log_subject="Weekly Calibration Summary", category="weekly_summary"))
+
+    total_emails = 0
+    for row, ok in zip(outbox, _enqueue_emails_each(outbox)):
+        if ok:  # failed rows stay uncheckpointed so a rerun retries them
+            _job_checkpoint(run, row["company_id"], emails_sent=1)
+            total_emails += 1
 
-    logger.info(f"[CRON] weekly_summary: sent {total_emails} emails")
+    logger.info(f"[CRON] weekly_summary: queued {total_emails} emails")
     return total_emails
 
+# ============================================================
+# INTERVAL OPTIMIZATION (reliability models, weekly)
+# ============================================================
+
+RELIABILITY_TARGET = 0.95             # default P(in tolerance at due date); settings key reliability_target
+RELIABILITY_MIN_INTERVALS = 10        # observed intervals per tool_type before recommending
+RELIABILITY_BUDGET = timedelta(minutes=15)
+
+
+def _load_calibration_history(company_id: int):
+    from analytics_core import CalibrationHistory
+    tools = sb_get("tools", {
+        "select": "id,tool_type,cal_interval_days",
+        "company_id": f"eq.{company_id}", "active": "eq.true",
+    })
+    if not tools:
+        return None
+    cals = []
+    for page in _iter_table_pages("calibrations", extra={
+        "select": "id,tool_id,calibration_date,result,tools!inner(company_id)",
+        "tools.company_id": f"eq.{company_id}",
+    }):
+        cals.extend(page)
+    return CalibrationHistory.from_rows(cals, tools)
+
+
+def _reliability_target(company_id: int) -> float:
+    """Tenant's reliability_target setting if it is a probability strictly between 0 and 1,
+    otherwise RELIABILITY_TARGET (1.0/0 would pin every interval to a clamp limit)."""
+    raw = _get_company_settings(company_id).get("reliability_target")
+    if not raw:
+        return RELIABILITY_TARGET
+    try:
+        target = float(raw)
+    except (TypeError, ValueError):
+        target = None
+    if target is None or not 0 < target < 1:
+        logger.warning(f"[RELIABILITY] company {company_id}: reliability_target {raw!r} not in (0, 1) — using {RELIABILITY_TARGET}")
+        return RELIABILITY_TARGET
+    return target
+
+
+def interval_optimization(run: dict | None = None):
+    """Fit per-tool_type time-to-OOT models for every tenant and store recommended
+    intervals. Tenants whose recommendations are oldest go first; work stops at
+    RELIABILITY_BUDGET and the rest are picked up next week."""
+    from analytics_core import recommend_intervals
+    t0 = time.perf_counter()
+    companies = sb_get("companies", {"select": "id", "order": "id.asc"})
+    last_run = {r["company_id"]: r["computed_at"] for r in cal_rpc("interval_recommendations_last_run") or []}
+    companies.sort(key=lambda co: last_run.get(co["id"], ""))
+    _job_set_total(run, len(companies))
+
+    done = deferred = 0
+    for co in companies:
+        cid = co["id"]
+        if _job_is_done(run, cid):
+            continue
+        if time.perf_counter() - t0 > RELIABILITY_BUDGET.total_seconds():
+            deferred += 1
+            continue
+        try:
+            hist = _load_calibration_history(cid)
+            target = _reliability_target(cid)
+            recs = recommend_intervals(hist, target=target, min_intervals=RELIABILITY_MIN_INTERVALS) if hist else []
+            now = datetime.utcnow().isoformat()
+            if recs:
+                sb_upsert("interval_recommendations",
+                          [{"company_id": cid, "computed_at": now, **r} for r in recs],
+                          on_conflict="company_id,tool_type")
+            # Tool types that no longer qualify (or a tenant with no recs) keep no stale rows
+            with _observe_supabase("delete", "interval_recommendations"):
+                cal_table("interval_recommendations").delete().eq("company_id", cid).lt("computed_at", now).execute()
+        except Exception as e:
+            logger.warning(f"[RELIABILITY] company {cid} failed: {e}")
+            continue
+        done += 1
+        _job_checkpoint(run, cid, tool_types=len(recs))
+    logger.info(f"[RELIABILITY] interval_optimization: {done} tenants in "
+                f"{time.perf_counter() - t0:.1f}s, {deferred} deferred by time budget")
+    return done
+
 # --- Scheduler setup ---
 # ============================================================
 # UPTIME MONITOR (GAP_02) + BACKUP (GAP_05)
@@ -3012,74 +4551,617 @@ def _uptime_check():
     except Exception as e:
         logger.warning(f"[UPTIME] Failed to log: {e}")
 
-def _backup_cal_data():
-    """Export all cal schema tables to JSON backup files."""
-    backup_dir = Path(f"/app/backups/{date.today().isoformat()}")
-    backup_dir.mkdir(parents=True, exist_ok=True)
+BACKUP_ROOT = Path("/app/backups")
+BACKUP_PAGE_SIZE = 1000      # PostgREST max-rows on Supabase; each page is one keyset query
+BACKUP_WORKERS = 4           # tables exported in parallel
+BACKUP_RETENTION_DAYS = 30
+BACKUP_FULL_WEEKDAY = 6      # Sunday: full base. Other nights export only rows changed since the last watermark.
+BACKUP_DELTA_OVERLAP = timedelta(minutes=10)  # re-read this much before the watermark (in-flight commits, clock skew)
+# Export order doubles as FK order for restore (parents before children).
+BACKUP_TABLES = [
+    "companies", "users", "settings", "vendors", "tools", "calibrations", "attachments",
+    "email_log", "usage_log", "conversation_memory", "kernel_versions",
+]
+BACKUP_TOMBSTONES = "row_tombstones"  # delete log (migration 015), exported with every delta
+
+
+def _iter_table_pages(table: str, key: str = "id", page_size: int = BACKUP_PAGE_SIZE, extra: dict = None):
+    """Yield pages of rows ordered by `key`, using keyset pagination (key > last seen)."""
+    last = None
+    while True:
+        params = {"select": "*", "order": f"{key}.asc", "limit": str(page_size), **(extra or {})}
+        if last is not None:
+            params[key] = f"gt.{last}"
+        rows = sb_get(table, params)
+        if not rows:
+            return
+        yield rows
+        if len(rows) < page_size:
+            return
+        last = rows[-1][key]
+
+
+def _write_ndjson_gz(out_dir: Path, table: str, pages) -> dict:
+    """Write an iterable of row lists to {table}.ndjson.gz (atomic rename).
+    Returns the manifest entry: rows, sha256 of the uncompressed NDJSON, bytes on disk."""
+    import gzip, hashlib
+    final = out_dir / f"{table}.ndjson.gz"
+    tmp = out_dir / f".{table}.ndjson.gz.tmp"
+    digest = hashlib.sha256()
+    rows_written = 0
+    max_id = None
+    with gzip.open(tmp, "wb", compresslevel=6) as f:
+        for page in pages:
+            if not page:
+                continue
+            chunk = "".join(json.dumps(r, default=str, separators=(",", ":")) + "\n" for r in page).encode()
+            digest.update(chunk)
+            f.write(chunk)
+            rows_written += len(page)
+            max_id = page[-1].get("id", max_id)
+    tmp.replace(final)
+    return {
+        "file": final.name,
+        "rows": rows_written,
+        "sha256": digest.hexdigest(),
+        "bytes": final.stat().st_size,
+        "max_id": max_id,
+    }
+
+
+def _delta_filter(table: str, since: str | None) -> dict | None:
+    if not since:
+        return None
+    col = "deleted_at" if table == BACKUP_TOMBSTONES else "updated_at"
+    return {col: f"gte.{since}"}
+
+
+def _export_table_ndjson(table: str, out_dir: Path, since: str | None = None) -> dict:
+    """Stream one table (or, with `since`, only rows changed since then) to gzip NDJSON.
+    Memory is bounded by one page."""
+    return _write_ndjson_gz(out_dir, table, _iter_table_pages(table, extra=_delta_filter(table, since)))
 
-    tables = ["companies", "users", "tools", "calibrations", "attachments", "settings", "email_log"]
-    for table in tables:
-        try:
-            rows = sb_get(table, {"select": "*", "limit": "10000"})
-            if rows:
-                with open(backup_dir / f"{table}.json", "w") as f:
-                    json.dump(rows, f, indent=2, default=str)
-        except Exception as e:
-            logger.warning(f"[BACKUP] Failed to export {table}: {e}")
 
-    # Prune backups older than 30 days
-    backups_root = Path("/app/backups")
-    if backups_root.exists():
-        cutoff = date.today() - timedelta(days=30)
-        for d in backups_root.iterdir():
+def _read_backup_manifest(backup_dir: Path) -> dict | None:
+    path = backup_dir / "manifest.json"
+    try:
+        return json.loads(path.read_text()) if path.exists() else None
+    except (ValueError, OSError):
+        return None
+
+
+def _write_backup_manifest(backup_dir: Path, tables: dict, **extra):
+    """Merge table entries into backup_dir/manifest.json (kept across resumed runs)."""
+    path = backup_dir / "manifest.json"
+    manifest = _read_backup_manifest(backup_dir) or {"format": "ndjson.gz", "tables": {}}
+    manifest["tables"].update(tables)
+    manifest.update(extra)
+    manifest["updated_at"] = datetime.utcnow().isoformat()
+    tmp = backup_dir / ".manifest.json.tmp"
+    tmp.write_text(json.dumps(manifest, indent=2, default=str))
+    tmp.replace(path)
+    return manifest
+
+
+def _backup_history(complete_only: bool = True) -> list[tuple[date, dict]]:
+    """Dated backup dirs and their manifests, oldest first."""
+    history = []
+    if not BACKUP_ROOT.exists():
+        return history
+    for d in BACKUP_ROOT.iterdir():
+        try:
+            day = date.fromisoformat(d.name)
+        except ValueError:
+            continue
+        manifest = _read_backup_manifest(d) or {}
+        if complete_only and not manifest.get("complete"):
+            continue
+        history.append((day, manifest))
+    return sorted(history, key=lambda x: x[0])
+
+
+def _plan_backup(today: date) -> dict:
+    """Full base on BACKUP_FULL_WEEKDAY, when no usable base exists, or when the base is a week old;
+    otherwise a delta from the previous complete backup's watermark."""
+    history = [(d, m) for d, m in _backup_history() if d < today and m.get("watermark")]
+    if history:
+        _, last = history[-1]
+        base = date.fromisoformat(last["base"])
+        if today.weekday() != BACKUP_FULL_WEEKDAY and (today - base).days < 7:
+            since = datetime.fromisoformat(last["watermark"]) - BACKUP_DELTA_OVERLAP
+            return {"kind": "delta", "base": last["base"], "since": since.isoformat()}
+    return {"kind": "full", "base": today.isoformat(), "since": None}
+
+
+def _prune_backups(keep_days: int = BACKUP_RETENTION_DAYS):
+    """Delete dated backup dirs older than keep_days, but never the full base
+    a retained delta still depends on. Materialized snapshots follow the same cutoff."""
+    import shutil
+    if not BACKUP_ROOT.exists():
+        return
+    cutoff = date.today() - timedelta(days=keep_days)
+    keep_from = cutoff
+    for day, manifest in _backup_history(complete_only=False):
+        if day >= cutoff and manifest.get("base"):
+            try:
+                keep_from = min(keep_from, date.fromisoformat(manifest["base"]))
+            except ValueError:
+                pass
+    for root, limit in ((BACKUP_ROOT, keep_from), (BACKUP_ROOT / "snapshots", cutoff)):
+        if not root.exists():
+            continue
+        for d in root.iterdir():
             if d.is_dir():
                 try:
-                    dir_date = date.fromisoformat(d.name)
-                    if dir_date < cutoff:
-                        import shutil
+                    if date.fromisoformat(d.name) < limit:
                         shutil.rmtree(d)
                 except (ValueError, OSError):
                     pass
 
-    logger.info(f"[BACKUP] Exported {len(tables)} tables to {backup_dir}")
 
+def _backup_cal_data(run: dict | None = None):
+    """Nightly backup. Weekly full base plus nightly deltas keyed on updated_at,
+    so I/O and storage track churn rather than table size. Tables export in parallel
+    as gzip NDJSON; each finished table is checkpointed for resume."""
+    import threading
+    from concurrent.futures import ThreadPoolExecutor, as_completed
+
+    today = date.today()
+    backup_dir = BACKUP_ROOT / today.isoformat()
+    backup_dir.mkdir(parents=True, exist_ok=True)
+
+    # A resumed attempt keeps the plan (kind, since, watermark) of the first attempt.
+    manifest = _read_backup_manifest(backup_dir) or {}
+    if manifest.get("kind") and manifest.get("watermark"):
+        plan = {k: manifest.get(k) for k in ("kind", "base", "since", "watermark")}
+    else:
+        plan = {**_plan_backup(today), "watermark": datetime.utcnow().isoformat()}
+        _write_backup_manifest(backup_dir, {}, date=today.isoformat(), complete=False, **plan)
+
+    tables = BACKUP_TABLES + ([BACKUP_TOMBSTONES] if plan["kind"] == "delta" else [])
+    _job_set_total(run, len(tables))
+    lock = threading.Lock()
+    failed = []
+
+    pending = [t for t in tables if not _job_is_done(run, t)]
+    with ThreadPoolExecutor(max_workers=BACKUP_WORKERS) as pool:
+        futures = {pool.submit(_export_table_ndjson, t, backup_dir, plan["since"]): t for t in pending}
+        for fut in as_completed(futures):
+            table = futures[fut]
+            try:
+                entry = fut.result()
+            except Exception as e:
+                logger.warning(f"[BACKUP] Failed to export {table}: {e}")
+                failed.append(table)
+                continue
+            with lock:
+                _write_backup_manifest(backup_dir, {table: entry})
+                _job_checkpoint(run, table, rows=entry["rows"])
+
+    if failed:
+        raise RuntimeError(f"backup incomplete, failed tables: {', '.join(failed)}")
+    manifest = _write_backup_manifest(backup_dir, {}, complete=True)
+    _prune_backups()
+
+    total_rows = sum(t.get("rows", 0) for t in manifest["tables"].values())
+    logger.info(f"[BACKUP] {plan['kind']} backup: {len(pending)} tables, {total_rows} rows → {backup_dir}")
+
+
+def _materialize_snapshot(target: date) -> Path:
+    """Compact the latest full base on/before `target` plus its deltas up to `target`
+    into a standalone snapshot under /app/backups/snapshots/{target}/ (same format as a full backup).
+    Memory is bounded by the churn in the deltas, not by table size."""
+    chain = [(d, m) for d, m in _backup_history() if d <= target]
+    fulls = [i for i, (_, m) in enumerate(chain) if m.get("kind") == "full"]
+    if not fulls:
+        raise FileNotFoundError(f"No complete full backup on or before {target}")
+    base_day, _ = chain[fulls[-1]]
+    deltas = [d for d, m in chain[fulls[-1] + 1:] if m.get("kind") == "delta" and m.get("base") == base_day.isoformat()]
+
+    out_dir = BACKUP_ROOT / "snapshots" / target.isoformat()
+    out_dir.mkdir(parents=True, exist_ok=True)
+    base_dir = BACKUP_ROOT / base_day.isoformat()
+
+    tombstones = {}  # delta day -> {table: {row_id, ...}}
+    for day in deltas:
+        per_table = {}
+        for t in _iter_backup_rows(BACKUP_ROOT / day.isoformat(), BACKUP_TOMBSTONES):
+            per_table.setdefault(t["table_name"], set()).add(t["row_id"])
+        tombstones[day] = per_table
+
+    entries = {}
+    for table in BACKUP_TABLES:
+        changed, deleted = {}, set()
+        for day in deltas:
+            for row in _iter_backup_rows(BACKUP_ROOT / day.isoformat(), table):
+                changed[row["id"]] = row
+                deleted.discard(row["id"])
+            for rid in tombstones[day].get(table, ()):
+                changed.pop(rid, None)
+                deleted.add(rid)
+
+        def merged(changed=changed, deleted=deleted, base_dir=base_dir, table=table):
+            page = []
+            for row in _iter_backup_rows(base_dir, table):
+                rid = row.get("id")
+                if rid in deleted:
+                    continue
+                page.append(changed.pop(rid, row))
+                if len(page) >= BACKUP_PAGE_SIZE:
+                    yield page
+                    page = []
+            yield page
+            yield list(changed.values())  # rows created after the base
+
+        entries[table] = _write_ndjson_gz(out_dir, table, merged())
+
+    _write_backup_manifest(out_dir, entries, kind="snapshot", date=target.isoformat(),
+                           base=base_day.isoformat(), deltas=[d.isoformat() for d in deltas], complete=True)
+    logger.info(f"[BACKUP] Materialized snapshot {target} from base {base_day} + {len(deltas)} deltas")
+    return out_dir
+
+
+def _iter_backup_rows(backup_dir: Path, table: str):
+    """Yield rows for a table from a backup dir (ndjson.gz, or legacy pretty JSON)."""
+    import gzip
+    ndjson = backup_dir / f"{table}.ndjson.gz"
+    legacy = backup_dir / f"{table}.json"
+    if ndjson.exists():
+        with gzip.open(ndjson, "rt") as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+    elif legacy.exists():
+        with open(legacy) as f:
+            yield from json.load(f)
+
+
+RESTORE_BATCH_SIZE = 500    # rows per multi-row upsert
+RESTORE_WORKERS = 4         # concurrent batches within one table (tables stay in FK order)
+RESTORE_GENERATED_COLUMNS = {"conversation_memory": {"question_hash"}}  # GENERATED ALWAYS — cannot be written
+
+
+def _restore_row_in_scope(table: str, row: dict, company_id: int | None, tenant_tools: set) -> bool:
+    """Tenant filter for single-tenant restores. calibrations/attachments scope through tool_id."""
+    if company_id is None:
+        return True
+    if table == "companies":
+        return row.get("id") == company_id
+    if table in ("calibrations", "attachments"):
+        return row.get("tool_id") in tenant_tools
+    return row.get("company_id") == company_id
+
+
+def _restore_batch(table: str, rows: list) -> tuple[int, int, list]:
+    """Upsert one batch. If the batch is rejected, retry row by row to isolate bad rows.
+    Returns (restored, errors, error_samples)."""
+    try:
+        sb_upsert(table, rows)
+        return len(rows), 0, []
+    except Exception as batch_error:
+        logger.warning(f"[RESTORE] {table} batch of {len(rows)} rejected ({batch_error}) — retrying per row")
+    restored, errors, samples = 0, 0, []
+    for row in rows:
+        try:
+            sb_upsert(table, [row])
+            restored += 1
+        except Exception as e:
+            errors += 1
+            if len(samples) < 5:
+                samples.append({"id": row.get("id"), "error": str(e)[:200]})
+    return restored, errors, samples
 
-def _restore_from_backup(backup_dir_path: str) -> dict:
-    """Restore cal schema tables from JSON backup files. Returns summary."""
-    from pathlib import Path as P
-    backup_dir = P(backup_dir_path)
+
+def _restore_from_backup(backup_dir_path: str, company_id: int | None = None, run: dict | None = None) -> dict:
+    """Restore cal schema tables from a backup dir (ndjson.gz or legacy JSON).
+
+    Streams each file and upserts RESTORE_BATCH_SIZE rows per call in FK order, so
+    rerunning over partially restored state converges instead of failing on duplicates.
+    With company_id, only that tenant's rows are restored. Returns a report with per-table
+    throughput and divergences (checksum/row-count mismatches vs the manifest, live row
+    counts that differ from the backup)."""
+    import hashlib
+    from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+    backup_dir = Path(backup_dir_path)
     if not backup_dir.exists():
         return {"error": f"Backup directory not found: {backup_dir_path}"}
+    manifest = _read_backup_manifest(backup_dir) or {}
+    if manifest.get("kind") == "delta":
+        backup_dir = _materialize_snapshot(date.fromisoformat(manifest["date"]))
+        manifest = _read_backup_manifest(backup_dir) or {}
+
+    report = {"backup": str(backup_dir), "company_id": company_id, "tables": {}, "divergences": []}
+    tenant_tools: set = set()
+    t_all = time.perf_counter()
+    total_restored = 0
+    _job_set_total(run, len(BACKUP_TABLES))
+
+    with ThreadPoolExecutor(max_workers=RESTORE_WORKERS) as pool:
+        for table in BACKUP_TABLES:
+            if _job_is_done(run, table):
+                continue
+            if not (backup_dir / f"{table}.ndjson.gz").exists() and not (backup_dir / f"{table}.json").exists():
+                report["tables"][table] = {"status": "skipped (no file)"}
+                _job_checkpoint(run, table, rows=0)
+                continue
 
-    restore_order = ["companies", "users", "settings", "tools", "calibrations", "attachments", "email_log"]
-    results = {}
+            t0 = time.perf_counter()
+            drop = RESTORE_GENERATED_COLUMNS.get(table, set())
+            digest = hashlib.sha256()
+            read = in_scope = restored = errors = batches = 0
+            samples: list = []
+            pending: set = set()
+
+            def collect(done):
+                nonlocal restored, errors
+                for fut in done:
+                    ok, bad, errs = fut.result()
+                    restored += ok
+                    errors += bad
+                    samples.extend(errs[:5 - len(samples)])
+
+            batch = []
+            for row in _iter_backup_rows(backup_dir, table):
+                digest.update((json.dumps(row, default=str, separators=(",", ":")) + "\n").encode())
+                read += 1
+                if not _restore_row_in_scope(table, row, company_id, tenant_tools):
+                    continue
+                if table == "tools":
+                    tenant_tools.add(row.get("id"))
+                in_scope += 1
+                batch.append({k: v for k, v in row.items() if k not in drop})
+                if len(batch) >= RESTORE_BATCH_SIZE:
+                    pending.add(pool.submit(_restore_batch, table, batch))
+                    batches += 1
+                    batch = []
+                    if len(pending) >= RESTORE_WORKERS * 2:
+                        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                        collect(done)
+            if batch:
+                pending.add(pool.submit(_restore_batch, table, batch))
+                batches += 1
+            collect(wait(pending)[0])
+
+            elapsed = time.perf_counter() - t0
+            report["tables"][table] = {
+                "rows_read": read, "rows_in_scope": in_scope, "restored": restored, "errors": errors,
+                "batches": batches, "seconds": round(elapsed, 2),
+                "rows_per_sec": round(restored / elapsed, 1) if elapsed > 0 else None,
+                "error_samples": samples,
+            }
+            total_restored += restored
+
+            expected = (manifest.get("tables") or {}).get(table)
+            if expected:
+                if expected.get("rows") != read:
+                    report["divergences"].append({"table": table, "kind": "manifest_rows", "manifest": expected.get("rows"), "file": read})
+                if expected.get("sha256") and expected["sha256"] != digest.hexdigest():
+                    report["divergences"].append({"table": table, "kind": "checksum", "manifest": expected["sha256"], "file": digest.hexdigest()})
+            if company_id is None or table not in ("calibrations", "attachments"):
+                try:
+                    if company_id is None:
+                        live = sb_count(table)
+                    elif table == "companies":
+                        live = sb_count(table, {"id": f"eq.{company_id}"})
+                    else:
+                        live = sb_count(table, {"company_id": f"eq.{company_id}"})
+                    if live != in_scope:
+                        report["divergences"].append({"table": table, "kind": "live_rows", "backup": in_scope, "live": live})
+                except Exception as e:
+                    logger.warning(f"[RESTORE] live count for {table} failed: {e}")
+            logger.info(f"[RESTORE] {table}: {restored}/{in_scope} rows in {elapsed:.1f}s ({errors} errors)")
+            _job_checkpoint(run, table, rows=restored, errors=errors)
+
+    # Explicit ids were written; move sequences past them so new inserts don't collide.
+    try:
+        cal_rpc("sync_id_sequences")
+    except Exception as e:
+        report["divergences"].append({"kind": "sequences", "error": str(e)[:200]})
 
-    for table in restore_order:
-        filepath = backup_dir / f"{table}.json"
-        if not filepath.exists():
-            results[table] = "skipped (no file)"
-            continue
+    elapsed = time.perf_counter() - t_all
+    report["seconds"] = round(elapsed, 2)
+    report["rows_restored"] = total_restored
+    report["rows_per_sec"] = round(total_restored / elapsed, 1) if elapsed > 0 else None
+    return report
+
+
+# ============================================================
+# JOB RUN LEDGER — cal.job_runs (timings, checkpoints, resume)
+# ============================================================
+
+JOB_STALE_AFTER = timedelta(minutes=30)  # "running" with no heartbeat this long = crashed worker
+JOB_HEARTBEAT_EVERY = 300                # seconds between heartbeats while a job runs
+JOB_QUEUED_EXPIRE = timedelta(hours=6)   # "queued" this long = the worker that queued it restarted
+
+
+def _job_run_active(job_name: str) -> dict | None:
+    """Return the live running row for a job, marking stale ones abandoned
+    (and queued ones that were never picked up)."""
+    rows = sb_get("job_runs", {
+        "select": "id,status,started_at,heartbeat_at",
+        "job_name": f"eq.{job_name}",
+        "status": "in.(running,queued)",
+    })
+    active = None
+    for r in rows:
+        queued = r["status"] == "queued"
+        try:
+            beat = datetime.fromisoformat(str(r["started_at" if queued else "heartbeat_at"]).replace("Z", "+00:00")).replace(tzinfo=None)
+        except (ValueError, TypeError):
+            beat = datetime.min
+        if datetime.utcnow() - beat > (JOB_QUEUED_EXPIRE if queued else JOB_STALE_AFTER):
+            sb_patch("job_runs", {"id": f"eq.{r['id']}", "status": f"eq.{r['status']}"}, {
+                "status": "abandoned",
+                "error": "queued but never started" if queued else "no heartbeat — worker died mid-run",
+                "finished_at": datetime.utcnow().isoformat(),
+            })
+        elif not queued and active is None:
+            active = r
+    return active
+
+
+def _job_run_start(job_name: str, trigger: str = "scheduled", status: str = "running") -> dict | None:
+    """Open a cal.job_runs row. Returns None if the job is already running elsewhere.
+    If today's last run of this job failed or was abandoned, its checkpoints carry over."""
+    if _job_run_active(job_name):
+        return None
+
+    today = date.today().isoformat()
+    last = sb_get("job_runs", {
+        "select": "id,status,checkpoints,counts",
+        "job_name": f"eq.{job_name}",
+        "run_date": f"eq.{today}",
+        "order": "id.desc",
+        "limit": "1",
+    })
+    resumed_from, checkpoints = None, []
+    if last and last[0]["status"] in ("failed", "abandoned"):
+        resumed_from = last[0]["id"]
+        checkpoints = list(last[0].get("checkpoints") or [])
+
+    try:
+        row = sb_post("job_runs", {
+            "job_name": job_name,
+            "run_date": today,
+            "trigger": trigger,
+            "status": status,
+            "resumed_from": resumed_from,
+            "checkpoints": checkpoints,
+            "progress_done": len(checkpoints),
+        })
+    except Exception as e:
+        if "duplicate" in str(e).lower() or "23505" in str(e):
+            return None  # another worker won the race
+        raise
+    if resumed_from:
+        logger.info(f"[JOB] {job_name} run {row['id']} resuming from run {resumed_from} ({len(checkpoints)} done)")
+    return {
+        "id": row["id"],
+        "job_name": job_name,
+        "checkpoints": checkpoints,
+        "counts": {},
+        "t0": time.perf_counter(),
+    }
+
+
+def _job_is_done(run: dict | None, key) -> bool:
+    """True if a previous attempt of this run already finished `key`."""
+    return run is not None and str(key) in run["checkpoints"]
+
+
+def _job_set_total(run: dict | None, total: int):
+    if run is None:
+        return
+    try:
+        sb_patch("job_runs", {"id": f"eq.{run['id']}"}, {"progress_total": total})
+    except Exception as e:
+        logger.warning(f"[JOB] {run['job_name']} progress_total update failed: {e}")
+
+
+def _job_checkpoint(run: dict | None, key, **counts):
+    """Record `key` (company id / table name) as finished and add its counts."""
+    if run is None:
+        return
+    run["checkpoints"].append(str(key))
+    for k, v in counts.items():
+        run["counts"][k] = run["counts"].get(k, 0) + v
+    try:
+        sb_patch("job_runs", {"id": f"eq.{run['id']}"}, {
+            "checkpoints": run["checkpoints"],
+            "progress_done": len(run["checkpoints"]),
+            "counts": run["counts"],
+            "heartbeat_at": datetime.utcnow().isoformat(),
+        })
+    except Exception as e:
+        logger.warning(f"[JOB] {run['job_name']} checkpoint {key} not persisted: {e}")
+
+
+def _job_run_finish(run: dict, status: str, error: str | None = None, result: dict | None = None):
+    data = {
+        "status": status,
+        "error": error,
+        "counts": run["counts"],
+        "finished_at": datetime.utcnow().isoformat(),
+        "duration_ms": int((time.perf_counter() - run["t0"]) * 1000),
+    }
+    if result is not None:
+        data["result"] = result
+    try:
+        sb_patch("job_runs", {"id": f"eq.{run['id']}"}, data)
+    except Exception as e:
+        logger.warning(f"[JOB] {run['job_name']} run {run['id']} finish not persisted: {e}")
+
+
+class _JobHeartbeat(threading.Thread):
+    """Bumps heartbeat_at every JOB_HEARTBEAT_EVERY seconds while a run executes,
+    so a long tenant or table between checkpoints isn't mistaken for a dead worker."""
 
-        with open(filepath) as f:
-            rows = json.load(f)
+    def __init__(self, run: dict):
+        super().__init__(name=f"heartbeat-{run['job_name']}-{run['id']}", daemon=True)
+        self.run_row = run
+        self.stopped = threading.Event()
 
-        restored = 0
-        errors = 0
-        for row in rows:
-            row.pop("created_at", None)
-            row.pop("updated_at", None)
+    def run(self):
+        while not self.stopped.wait(JOB_HEARTBEAT_EVERY):
             try:
-                sb_post(table, row)
-                restored += 1
+                sb_patch("job_runs", {"id": f"eq.{self.run_row['id']}", "status": "eq.running"},
+                         {"heartbeat_at": datetime.utcnow().isoformat()})
             except Exception as e:
-                if "duplicate" in str(e).lower() or "already exists" in str(e).lower():
-                    restored += 1  # already there
-                else:
-                    errors += 1
-                    logger.warning(f"[RESTORE] {table} id={row.get('id')}: {e}")
-        results[table] = f"{restored} restored, {errors} errors"
+                logger.warning(f"[JOB] {self.run_row['job_name']} heartbeat failed: {e}")
 
-    return results
+    def stop(self):
+        self.stopped.set()
+
+
+def _run_ledgered(job_name: str, fn, trigger: str = "scheduled", run: dict | None = None):
+    """Execute fn(run) inside a ledger row. Pass `run` to execute one opened (or queued) earlier."""
+    if run is None:
+        run = _job_run_start(job_name, trigger)
+        if run is None:
+            logger.info(f"[JOB] {job_name} already running — skipped")
+            JOB_RUNS.labels(job_name, "skipped").inc()
+            return None
+    else:
+        try:
+            started = sb_patch("job_runs", {"id": f"eq.{run['id']}", "status": "eq.queued"}, {
+                "status": "running",
+                "heartbeat_at": datetime.utcnow().isoformat(),
+            })
+        except Exception as e:
+            _job_run_finish(run, "skipped", f"could not start: {str(e)[:200]}")
+            JOB_RUNS.labels(job_name, "skipped").inc()
+            return None
+        if not started:
+            logger.info(f"[JOB] {job_name} run {run['id']} expired while queued — skipped")
+            JOB_RUNS.labels(job_name, "skipped").inc()
+            return None
+        run["t0"] = time.perf_counter()
+
+    t0 = time.perf_counter()
+    heartbeat = _JobHeartbeat(run)
+    heartbeat.start()
+    try:
+        result = fn(run)
+    except Exception as e:
+        logger.error(f"[JOB] {job_name} run {run['id']} failed: {e}")
+        _job_run_finish(run, "failed", str(e)[:1000])
+        JOB_RUNS.labels(job_name, "error").inc()
+        raise
+    finally:
+        heartbeat.stop()
+        JOB_DURATION.labels(job_name).observe(time.perf_counter() - t0)
+    _job_run_finish(run, "completed", result=result if isinstance(result, dict) else None)
+    JOB_RUNS.labels(job_name, "ok").inc()
+    return result
+
+
+def _ledgered_job(job_name: str, fn):
+    """Scheduler entry point: run `fn` through the ledger."""
+    def scheduled():
+        return _run_ledgered(job_name, fn)
+    scheduled.__name__ = job_name
+    return scheduled
 
 
 from apscheduler.schedulers.background import BackgroundScheduler
@@ -3090,20 +5172,43 @@ scheduler = BackgroundScheduler(timezone="America/Chicago")
 @asynccontextmanager
 async def lifespan(app):
     # Startup: schedule autonomous jobs
-    scheduler.add_job(refresh_statuses, "cron", hour=5, minute=0, id="refresh_statuses", replace_existing=True)
-    scheduler.add_job(enforcement_scan, "cron", hour=6, minute=0, id="enforcement_scan", replace_existing=True)
-    scheduler.add_job(weekly_summary, "cron", day_of_week="mon", hour=7, minute=0, id="weekly_summary", replace_existing=True)
-    scheduler.add_job(_uptime_check, "interval", minutes=5, id="uptime_check", replace_existing=True)
-    scheduler.add_job(_backup_cal_data, "cron", hour=2, minute=0, id="backup_cal", replace_existing=True)
+    scheduler.add_job(_ledgered_job("refresh_statuses", refresh_statuses), "cron", hour=5, minute=0, id="refresh_statuses", replace_existing=True)
+    scheduler.add_job(_ledgered_job("enforcement_scan", enforcement_scan), "cron", hour=6, minute=0, id="enforcement_scan", replace_existing=True)
+    scheduler.add_job(_ledgered_job("weekly_summary", weekly_summary), "cron", day_of_week="mon", hour=7, minute=0, id="weekly_summary", replace_existing=True)
+    scheduler.add_job(_ledgered_job("interval_optimization", interval_optimization), "cron", day_of_week="mon", hour=6, minute=30, id="interval_optimization", replace_existing=True)
+    scheduler.add_job(_timed_job("uptime_check", _uptime_check), "interval", minutes=5, id="uptime_check", replace_existing=True)
+    scheduler.add_job(_ledgered_job("backup_cal", _backup_cal_data), "cron", hour=2, minute=0, id="backup_cal", replace_existing=True)
     scheduler.start()
-    logger.info("[SCHEDULER] Started — refresh@05:00, enforce@06:00, summary@Mon07:00, uptime@5min, backup@02:00 CT")
+    outbox_task = asyncio.create_task(_outbox_sender_loop())
+    logger.info("[SCHEDULER] Started — refresh@05:00, enforce@06:00, intervals@Mon06:30, summary@Mon07:00, uptime@5min, backup@02:00 CT")
     yield
     # Shutdown
     scheduler.shutdown(wait=False)
+    outbox_task.cancel()
+    if PROMETHEUS_MULTIPROC_DIR:
+        multiprocess.mark_process_dead(os.getpid())
 
 app.router.lifespan_context = lifespan
 
-# --- Manual trigger endpoint (service-key auth) ---
+# --- Manual trigger endpoints (service-key auth) ---
+# Jobs run in the scheduler's thread pool; the response carries run IDs to poll
+# via GET /api/cron/runs/{run_id} instead of holding the request open for minutes.
+
+def _daily_chain(refresh_run: dict, enforce_run: dict):
+    """refresh_statuses then enforcement_scan, each under its own ledger row."""
+    try:
+        _run_ledgered("refresh_statuses", refresh_statuses, run=refresh_run)
+    except Exception as e:
+        _job_run_finish(enforce_run, "skipped", f"refresh_statuses failed: {str(e)[:200]}")
+        return
+    _run_ledgered("enforcement_scan", enforcement_scan, run=enforce_run)
+
+
+def _already_running(job_name: str) -> dict:
+    active = _job_run_active(job_name)
+    return {"status": "already_running", "job": job_name, "run_id": active["id"] if active else None}
+
+
 @app.post("/api/cron/daily")
 async def cron_daily(req: dict = {}):
     """Manual trigger for daily enforcement. Auth via service key in body."""
@@ -3111,12 +5216,20 @@ async def cron_daily(req: dict = {}):
     if key != CAL_SERVICE_KEY:
         raise HTTPException(status_code=403, detail="Invalid service key")
 
-    statuses_updated = refresh_statuses()
-    emails_sent = enforcement_scan()
+    refresh_run = _job_run_start("refresh_statuses", trigger="manual", status="queued")
+    if refresh_run is None:
+        return _already_running("refresh_statuses")
+    enforce_run = _job_run_start("enforcement_scan", trigger="manual", status="queued")
+    if enforce_run is None:
+        _job_run_finish(refresh_run, "skipped", "enforcement_scan already running")
+        return _already_running("enforcement_scan")
+
+    scheduler.add_job(_daily_chain, args=[refresh_run, enforce_run], id=f"manual-daily-{refresh_run['id']}")
     return {
-        "status": "completed",
-        "statuses_updated": statuses_updated,
-        "emails_sent": emails_sent,
+        "status": "started",
+        "run_id": enforce_run["id"],
+        "refresh_run_id": refresh_run["id"],
+        "poll": f"/api/cron/runs/{enforce_run['id']}",
         "timestamp": datetime.utcnow().isoformat(),
     }
 
@@ -3127,8 +5240,64 @@ async def cron_weekly(req: dict = {}):
     if key != CAL_SERVICE_KEY:
         raise HTTPException(status_code=403, detail="Invalid service key")
 
-    emails_sent = weekly_summary()
-    return {"status": "completed", "emails_sent": emails_sent}
+    run = _job_run_start("weekly_summary", trigger="manual", status="queued")
+    if run is None:
+        return _already_running("weekly_summary")
+    scheduler.add_job(_run_ledgered, args=["weekly_summary", weekly_summary], kwargs={"run": run},
+                      id=f"manual-weekly-{run['id']}")
+    return {"status": "started", "run_id": run["id"], "poll": f"/api/cron/runs/{run['id']}"}
+
+@app.get("/api/cron/runs")
+async def list_job_runs(request: Request, job: str = "", limit: int = 20):
+    """Recent job runs from the ledger. Auth: X-Service-Key header."""
+    if request.headers.get("x-service-key", "") != CAL_SERVICE_KEY:
+        raise HTTPException(status_code=403, detail="Invalid service key")
+    params = {
+        "select": "id,job_name,run_date,trigger,status,resumed_from,progress_total,progress_done,counts,error,started_at,finished_at,duration_ms",
+        "order": "id.desc",
+        "limit": str(min(limit, 200)),
+    }
+    if job:
+        params["job_name"] = f"eq.{job}"
+    return {"runs": sb_get("job_runs", params)}
+
+@app.get("/api/cron/runs/{run_id}")
+async def get_job_run(run_id: int, request: Request):
+    """Poll a single job run. Auth: X-Service-Key header."""
+    if request.headers.get("x-service-key", "") != CAL_SERVICE_KEY:
+        raise HTTPException(status_code=403, detail="Invalid service key")
+    rows = sb_get("job_runs", {"select": "*", "id": f"eq.{run_id}"})
+    if not rows:
+        raise HTTPException(status_code=404, detail="Run not found")
+    return rows[0]
+
+@app.post("/api/backup/restore")
+async def restore_backup(req: dict = {}):
+    """Queue a restore from /app/backups/{backup} (a dated dir or snapshots/{date}).
+    Body: {"service_key", "backup": "2026-10-18", "company_id": 3 (optional — single tenant)}.
+    Returns a run ID; the report lands in the job run's `result`."""
+    if req.get("service_key", "") != CAL_SERVICE_KEY:
+        raise HTTPException(status_code=403, detail="Invalid service key")
+    backup = str(req.get("backup", ""))
+    name = backup.removeprefix("snapshots/")
+    try:
+        date.fromisoformat(name)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="backup must be YYYY-MM-DD or snapshots/YYYY-MM-DD")
+    backup_dir = BACKUP_ROOT / backup
+    if not backup_dir.exists():
+        raise HTTPException(status_code=404, detail=f"Backup not found: {backup}")
+    company_id = int(req["company_id"]) if req.get("company_id") is not None else None
+
+    run = _job_run_start("restore", trigger="manual", status="queued")
+    if run is None:
+        return _already_running("restore")
+    scheduler.add_job(
+        _run_ledgered,
+        args=["restore", lambda r: _restore_from_backup(str(backup_dir), company_id=company_id, run=r)],
+        kwargs={"run": run}, id=f"manual-restore-{run['id']}",
+    )
+    return {"status": "started", "run_id": run["id"], "poll": f"/api/cron/runs/{run['id']}"}
 
 # ============================================================
 # TTS PROXY (ElevenLabs)
@@ -3176,11 +5345,14 @@ _ws_connections: dict[str, list[WebSocket]] = {}
 async def agent_events(ws: WebSocket, agent_id: str = "cal"):
     await ws.accept()
     _ws_connections.setdefault(agent_id, []).append(ws)
+    WS_CONNECTIONS.inc()
     try:
         while True:
             await ws.receive_text()  # Keep-alive, client can send pings
     except WebSocketDisconnect:
         _ws_connections[agent_id].remove(ws)
+    finally:
+        WS_CONNECTIONS.dec()
 
 async def push_agent_event(agent_id: str, event: dict):
     """Push a proactive event to all connected clients for an agent."""
@@ -3329,11 +5501,11 @@ async def ingest_email(payload: EmailWebhook):
         return {"status": "ignored", "reason": f"Unrecognized recipient: {payload.to_address}"}
 
     # Look up company via REST
-    companies = sb_get("companies", {"select": "id", "slug": f"eq.{tenant_slug}", "is_active": "eq.true"})
-    if not companies:
+    company = get_company_by_slug(tenant_slug)
+    if not company or not company["is_active"]:
         return {"status": "ignored", "reason": f"Unknown tenant: {tenant_slug}"}
 
-    company_id = companies[0]["id"]
+    company_id = company["id"]
 
     # Dedup check by Message-ID via REST
     if payload.message_id:
@@ -3425,18 +5597,20 @@ Return ONLY a JSON object: {"category": "CATEGORY", "summary": "1-sentence summa
                                        f"{cert_result['data'].get('tool_number', 'your tool')} and updated "
                                        f"the record. Next calibration due: {cert_result['data'].get('next_due_date', 'unknown')}.\n\n"
                                        f"— Cal, {slug.title()} Calibration Agent")
-                        _send_mailgun(sender_addr, payload.from_address,
-                                     f"Re: {payload.subject} — Record Updated", confirm_body)
+                        _enqueue_email(company_id, sender_addr, payload.from_address,
+                                       f"Re: {payload.subject} — Record Updated", confirm_body,
+                                       category="reply", is_html=False)
                 elif cert_result["status"] == "unmatched":
                     actions_taken.append(f"Cert '{filename}' — tool '{cert_result.get('extracted_data', {}).get('tool_number')}' not in registry")
                     if MAILGUN_API_KEY:
                         slug = tenant_slug
-                        _send_mailgun(
-                            f"Cal <cal@{slug}.gp3.app>", payload.from_address,
+                        _enqueue_email(
+                            company_id, f"Cal <cal@{slug}.gp3.app>", payload.from_address,
                             f"Re: {payload.subject} — Tool Not Found",
                             f"Hi,\n\nI received a cert for tool '{cert_result.get('extracted_data', {}).get('tool_number')}' "
                             f"but it's not in the equipment registry. Please add the tool first at cal.gp3.app, "
-                            f"then resend this certificate.\n\n— Cal"
+                            f"then resend this certificate.\n\n— Cal",
+                            category="reply", is_html=False,
                         )
                 else:
                     actions_taken.append(f"Cert '{filename}' extraction error: {cert_result.get('message')}")
@@ -3480,11 +5654,11 @@ async def send_email(
     company_id = auth["company_id"]
 
     # Get company slug for sender address via REST
-    companies = sb_get("companies", {"select": "slug,name", "id": f"eq.{company_id}"})
-    if not companies:
+    company = get_company(company_id)
+    if not company:
         raise HTTPException(status_code=404, detail="Company not found")
 
-    slug, company_name = companies[0]["slug"], companies[0]["name"]
+    slug, company_name = company["slug"], company["name"]
     sender = f"Cal - {company_name} <cal@{slug}.gp3.app>"
     to_address = req.get("to", "")
     subject = req.get("subject", "")
@@ -3517,6 +5691,7 @@ async def send_email(
             data=data,
             timeout=15.0,
         )
+    MAILGUN_SENDS.labels("sent" if resp.status_code == 200 else "failed").inc()
 
     # Log the outbound email via REST
     try:
@@ -3592,6 +5767,14 @@ async def api_cost_projection(days: int = 90, auth: dict = Depends(verify_token)
     """Projected calibration cost for next {days} days."""
     return cost_projection(auth["company_id"], days=days)
 
+@app.get("/cal/analytics/interval-recommendations")
+async def api_interval_recommendations(auth: dict = Depends(verify_token)):
+    """Reliability-based interval per tool_type (refreshed weekly)."""
+    rows = sb_get("interval_recommendations", {
+        "select": "*", "company_id": f"eq.{auth['company_id']}", "order": "reliability_at_current.asc",
+    })
+    return {"interval_recommendations": rows}
+
 @app.get("/cal/analytics/seasonal")
 async def api_seasonal(auth: dict = Depends(verify_token)):
     """Monthly calibration volume with peak month detection."""
@@ -3626,17 +5809,14 @@ async def provision_tenant(req: ProvisionRequest, request: Request):
         raise HTTPException(status_code=409, detail=f"Company slug '{req.slug}' already exists")
 
     # 1. Create company (columns: id, name, slug, subscription_plan, max_users, max_tools, is_active)
-    # id has no auto-increment default — generate next id manually
+    # id comes from cal.companies_id_seq (migration 025)
     plan_limits = {
         "basic": {"max_users": 3, "max_tools": 50},
         "professional": {"max_users": 10, "max_tools": 200},
         "enterprise": {"max_users": 50, "max_tools": 1000},
     }
     limits = plan_limits.get(req.plan, plan_limits["professional"])
-    all_companies = sb_get("companies", {"select": "id", "order": "id.desc", "limit": "1"})
-    next_company_id = (all_companies[0]["id"] + 1) if all_companies else 1
     company = sb_post("companies", {
-        "id": next_company_id,
         "name": req.company_name,
         "slug": req.slug,
         "subscription_plan": req.plan,
@@ -3646,17 +5826,14 @@ async def provision_tenant(req: ProvisionRequest, request: Request):
     })
     company_id = company["id"]
 
-    # 2. Create admin user with generated password (id also has no auto-increment)
+    # 2. Create admin user with generated password
     temp_password = uuid.uuid4().hex[:12]
     name_parts = req.admin_name.strip().split(" ", 1)
     first_name = name_parts[0]
     last_name = name_parts[1] if len(name_parts) > 1 else ""
-    all_users = sb_get("users", {"select": "id", "order": "id.desc", "limit": "1"})
-    next_user_id = (all_users[0]["id"] + 1) if all_users else 1
     admin_user = sb_post("users", {
-        "id": next_user_id,
         "email": req.admin_email,
-        "password_hash": pwd_context.hash(temp_password),
+        "password_hash": await hash_password(temp_password),
         "first_name": first_name,
         "last_name": last_name,
         "role": "company_admin",
@@ -3665,18 +5842,17 @@ async def provision_tenant(req: ProvisionRequest, request: Request):
     })
 
     # 3. Seed default settings for the company
-    default_settings = [
-        {"company_id": company_id, "key": "cal_interval_default", "value": "365"},
-        {"company_id": company_id, "key": "alert_days_before_due", "value": "30"},
-        {"company_id": company_id, "key": "max_tools_limit", "value": str(limits["max_tools"])},
-        {"company_id": company_id, "key": "ai_analysis_enabled", "value": "true"},
-    ]
-    for setting in default_settings:
-        try:
-            sb_post("settings", setting)
-        except Exception:
-            pass  # non-critical if settings seed fails
+    try:
+        save_company_settings(company_id, {
+            "cal_interval_default": "365",
+            "alert_days_before_due": "30",
+            "max_tools_limit": str(limits["max_tools"]),
+            "ai_analysis_enabled": "true",
+        })
+    except Exception:
+        pass  # non-critical if settings seed fails
 
+    invalidate_tenant(company_id)
     logger.info(f"Provisioned tenant: {req.company_name} (id={company_id}, slug={req.slug})")
 
     return {
@@ -3716,10 +5892,9 @@ def require_kernel_access(request: Request, credentials: HTTPAuthorizationCreden
 @app.get("/cal/kernel/{company_slug}")
 async def get_kernel(company_slug: str, access: dict = Depends(require_kernel_access)):
     """Get tenant kernel content by company slug."""
-    companies = sb_get("companies", {"select": "id,name,slug", "slug": f"eq.{company_slug}"})
-    if not companies:
+    company = get_company_by_slug(company_slug)
+    if not company:
         raise HTTPException(status_code=404, detail=f"Company '{company_slug}' not found")
-    company = companies[0]
     if not access["is_super"] and company["id"] != access["company_id"]:
         raise HTTPException(status_code=403, detail="Access denied to this company's kernel")
     kernel_path = Path(f"/app/kernels/tenants/{company_slug}.ttc.md")
@@ -3734,16 +5909,17 @@ async def get_kernel(company_slug: str, access: dict = Depends(require_kernel_ac
 @app.put("/cal/kernel/{company_slug}")
 async def update_kernel(company_slug: str, req: KernelUpdateRequest, request: Request, access: dict = Depends(require_kernel_access)):
     """Update tenant kernel content. Saves to disk and logs version to Supabase."""
-    companies = sb_get("companies", {"select": "id,name,slug", "slug": f"eq.{company_slug}"})
-    if not companies:
+    company = get_company_by_slug(company_slug)
+    if not company:
         raise HTTPException(status_code=404, detail=f"Company '{company_slug}' not found")
-    company = companies[0]
     if not access["is_super"] and company["id"] != access["company_id"]:
         raise HTTPException(status_code=403, detail="Access denied to this company's kernel")
     kernel_path = Path(f"/app/kernels/tenants/{company_slug}.ttc.md")
     previous = kernel_path.read_text() if kernel_path.exists() else None
     kernel_path.parent.mkdir(parents=True, exist_ok=True)
     kernel_path.write_text(req.content)
+    invalidate_tenant_branding(company["id"])
+    invalidate_tenant(company["id"])
     try:
         sb_post("kernel_versions", {
             "company_id": company["id"],
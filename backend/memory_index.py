@@ -0,0 +1,145 @@
+"""
+Per-tenant lexical index over conversation_memory for prompt retrieval.
+
+Okapi BM25 over past questions and answers, kept as an in-memory inverted
+index (term -> {key: weighted term frequency}) so rows can be added or
+replaced one at a time as the agent stores new Q&As — no rebuild. Question
+terms count double: a past question phrased like the new one is the best
+signal that its answer is relevant.
+
+    from memory_index import MemoryIndex
+    idx = MemoryIndex()
+    idx.upsert(question, answer, feedback=None, used_count=3)
+    idx.search("which calipers are overdue?", k=6, token_budget=1200)
+
+search() returns the k best-scoring memories that fit in the token budget
+(estimated at ~4 characters per token), best first. Rows sharing no term
+with the question are never returned. Keys follow the table's
+question_hash: lower(trim(question)).
+"""
+
+import math
+import re
+from dataclasses import dataclass
+
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+STOPWORDS = frozenset("""
+a about all an and any are as at be been but by can could did do does for from
+had has have how i if in is it its me my no not of on or our so than that the
+their them then there these they this to us was we were what when where which
+who why will with would you your cal please show tell give list
+""".split())
+
+QUESTION_WEIGHT = 2
+CHARS_PER_TOKEN = 4
+
+
+def tokenize(text: str) -> list[str]:
+    """Lowercase alphanumeric terms without stopwords ("GP-0012" -> ["gp", "0012"])."""
+    return [t for t in TOKEN_RE.findall((text or "").lower()) if t not in STOPWORDS]
+
+
+def memory_key(question: str) -> str:
+    """Same identity as conversation_memory.question_hash (md5 of lower(trim(question)))."""
+    return (question or "").strip().lower()
+
+
+def estimate_tokens(text: str) -> int:
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+@dataclass
+class Memory:
+    question: str
+    answer: str
+    feedback: str | None
+    used_count: int
+    length: int          # weighted term count (document length for BM25)
+    terms: tuple         # distinct terms, for removal
+
+    def render(self) -> str:
+        """Prompt line for this memory (same format ask_question has always used)."""
+        return f"Previous Q: {self.question}\nA: {self.answer}" + (f" (feedback: {self.feedback})" if self.feedback else "")
+
+
+class MemoryIndex:
+    """Incremental BM25 index over one tenant's conversation memories. Not thread-safe."""
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.docs: dict[str, Memory] = {}
+        self.postings: dict[str, dict[str, int]] = {}
+        self.total_length = 0
+
+    def __len__(self) -> int:
+        return len(self.docs)
+
+    def upsert(self, question: str, answer: str | None, feedback: str | None = None, used_count: int = 1):
+        """Add a memory, or replace the one with the same question."""
+        key = memory_key(question)
+        if not key:
+            return
+        self.remove(key)
+        tf: dict[str, int] = {}
+        for term in tokenize(question):
+            tf[term] = tf.get(term, 0) + QUESTION_WEIGHT
+        for term in tokenize(answer):
+            tf[term] = tf.get(term, 0) + 1
+        length = sum(tf.values())
+        self.docs[key] = Memory(question, answer or "", feedback, used_count or 1, length, tuple(tf))
+        self.total_length += length
+        for term, n in tf.items():
+            self.postings.setdefault(term, {})[key] = n
+
+    def remove(self, key: str):
+        doc = self.docs.pop(key, None)
+        if doc is None:
+            return
+        self.total_length -= doc.length
+        for term in doc.terms:
+            plist = self.postings[term]
+            del plist[key]
+            if not plist:
+                del self.postings[term]
+
+    def get(self, question: str) -> Memory | None:
+        return self.docs.get(memory_key(question))
+
+    def scores(self, query: str) -> dict[str, float]:
+        """BM25 score per memory sharing at least one term with the query."""
+        n = len(self.docs)
+        if not n:
+            return {}
+        avg_len = self.total_length / n or 1.0
+        out: dict[str, float] = {}
+        for term in set(tokenize(query)):
+            plist = self.postings.get(term)
+            if not plist:
+                continue
+            idf = math.log(1 + (n - len(plist) + 0.5) / (len(plist) + 0.5))
+            for key, tf in plist.items():
+                norm = tf + self.k1 * (1 - self.b + self.b * self.docs[key].length / avg_len)
+                out[key] = out.get(key, 0.0) + idf * tf * (self.k1 + 1) / norm
+        return out
+
+    def search(self, query: str, k: int = 6, token_budget: int = 1200) -> list[Memory]:
+        """Top-k relevant memories whose rendered text fits in token_budget, best first.
+        Ties (and near-ties) favour memories that have been asked more often."""
+        ranked = sorted(
+            self.scores(query).items(),
+            key=lambda kv: kv[1] * (1 + 0.05 * math.log1p(self.docs[kv[0]].used_count)),
+            reverse=True,
+        )
+        picked, spent = [], 0
+        for key, _ in ranked:
+            doc = self.docs[key]
+            cost = estimate_tokens(doc.render())
+            if spent + cost > token_budget:
+                continue
+            picked.append(doc)
+            spent += cost
+            if len(picked) >= k:
+                break
+        return picked
@@ -0,0 +1,59 @@
+-- ============================================================
+-- Migration 014: Scheduler job run ledger
+-- Project: ezlmmegowggujpcnzoda (GP3 / zoda)
+-- Run in: SQL Editor → https://supabase.com/dashboard/project/ezlmmegowggujpcnzoda/sql
+--
+-- One row per execution of refresh_statuses / enforcement_scan /
+-- weekly_summary / backup_cal. Jobs checkpoint each finished tenant
+-- (or backup table) into `checkpoints`; a rerun on the same run_date
+-- after a failed/abandoned run skips those keys instead of starting
+-- over from tenant #1.
+-- ============================================================
+
+BEGIN;
+
+CREATE TABLE IF NOT EXISTS cal.job_runs (
+  id BIGSERIAL PRIMARY KEY,
+  job_name VARCHAR(100) NOT NULL,
+  run_date DATE NOT NULL DEFAULT CURRENT_DATE,
+  trigger VARCHAR(20) NOT NULL DEFAULT 'scheduled',   -- scheduled | manual
+  status VARCHAR(20) NOT NULL DEFAULT 'running',      -- queued | running | completed | failed | abandoned | skipped
+  resumed_from BIGINT REFERENCES cal.job_runs(id),
+  progress_total INTEGER,
+  progress_done INTEGER NOT NULL DEFAULT 0,
+  checkpoints JSONB NOT NULL DEFAULT '[]'::jsonb,     -- finished keys (company ids / table names)
+  counts JSONB NOT NULL DEFAULT '{}'::jsonb,          -- e.g. {"emails_sent": 12, "tools_updated": 40}
+  error TEXT,
+  started_at TIMESTAMPTZ DEFAULT NOW(),
+  heartbeat_at TIMESTAMPTZ DEFAULT NOW(),
+  finished_at TIMESTAMPTZ,
+  duration_ms INTEGER
+);
+
+CREATE INDEX IF NOT EXISTS idx_job_runs_job_date ON cal.job_runs(job_name, run_date DESC, id DESC);
+
+-- At most one running execution per job across all workers/containers.
+-- The backend treats a unique violation on insert as "already running".
+CREATE UNIQUE INDEX IF NOT EXISTS uq_job_runs_one_running
+  ON cal.job_runs(job_name) WHERE status = 'running';
+
+ALTER TABLE cal.job_runs ENABLE ROW LEVEL SECURITY;
+
+DO $$
+BEGIN
+  IF NOT EXISTS (
+    SELECT 1 FROM pg_policies
+    WHERE tablename='job_runs' AND schemaname='cal'
+      AND policyname='service_role_job_runs'
+  ) THEN
+    CREATE POLICY "service_role_job_runs" ON cal.job_runs
+      FOR ALL TO service_role USING (true) WITH CHECK (true);
+  END IF;
+END $$;
+
+GRANT ALL ON cal.job_runs TO service_role;
+GRANT ALL ON cal.job_runs TO authenticator;
+GRANT USAGE ON SEQUENCE cal.job_runs_id_seq TO service_role;
+GRANT USAGE ON SEQUENCE cal.job_runs_id_seq TO authenticator;
+
+COMMIT;
@@ -0,0 +1,115 @@
+-- ============================================================
+-- Migration 015: Change tracking for incremental (delta) backups
+-- Project: ezlmmegowggujpcnzoda (GP3 / zoda)
+-- Run in: SQL Editor → https://supabase.com/dashboard/project/ezlmmegowggujpcnzoda/sql
+--
+-- Nightly backups export only rows with updated_at >= last watermark,
+-- plus a weekly full base (see _backup_cal_data). That needs:
+--   1. updated_at on every backed-up table, maintained on UPDATE
+--   2. an index on updated_at so the delta scan is proportional to churn
+--   3. a tombstone log so deletes survive into materialized snapshots
+--
+-- NOTE: adding updated_at stamps existing rows with NOW(); the first
+-- backup after this migration should be a full one (delete the current
+-- week's dirs or wait for Sunday).
+-- ============================================================
+
+BEGIN;
+
+-- ============================================================
+-- 1. updated_at columns
+-- ============================================================
+
+ALTER TABLE cal.companies           ADD COLUMN IF NOT EXISTS updated_at TIMESTAMPTZ DEFAULT NOW();
+ALTER TABLE cal.users               ADD COLUMN IF NOT EXISTS updated_at TIMESTAMPTZ DEFAULT NOW();
+ALTER TABLE cal.settings            ADD COLUMN IF NOT EXISTS updated_at TIMESTAMPTZ DEFAULT NOW();
+ALTER TABLE cal.vendors             ADD COLUMN IF NOT EXISTS updated_at TIMESTAMPTZ DEFAULT NOW();
+ALTER TABLE cal.tools               ADD COLUMN IF NOT EXISTS updated_at TIMESTAMPTZ DEFAULT NOW();
+ALTER TABLE cal.calibrations        ADD COLUMN IF NOT EXISTS updated_at TIMESTAMPTZ DEFAULT NOW();
+ALTER TABLE cal.attachments         ADD COLUMN IF NOT EXISTS updated_at TIMESTAMPTZ DEFAULT NOW();
+ALTER TABLE cal.email_log           ADD COLUMN IF NOT EXISTS updated_at TIMESTAMPTZ DEFAULT NOW();
+ALTER TABLE cal.usage_log           ADD COLUMN IF NOT EXISTS updated_at TIMESTAMPTZ DEFAULT NOW();
+ALTER TABLE cal.conversation_memory ADD COLUMN IF NOT EXISTS updated_at TIMESTAMPTZ DEFAULT NOW();
+ALTER TABLE cal.kernel_versions     ADD COLUMN IF NOT EXISTS updated_at TIMESTAMPTZ DEFAULT NOW();
+
+-- ============================================================
+-- 2. Tombstone log for deletes
+-- ============================================================
+
+CREATE TABLE IF NOT EXISTS cal.row_tombstones (
+  id BIGSERIAL PRIMARY KEY,
+  table_name VARCHAR(100) NOT NULL,
+  row_id BIGINT NOT NULL,
+  deleted_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS idx_row_tombstones_deleted ON cal.row_tombstones(deleted_at);
+
+ALTER TABLE cal.row_tombstones ENABLE ROW LEVEL SECURITY;
+
+DO $$
+BEGIN
+  IF NOT EXISTS (
+    SELECT 1 FROM pg_policies
+    WHERE tablename='row_tombstones' AND schemaname='cal'
+      AND policyname='service_role_row_tombstones'
+  ) THEN
+    CREATE POLICY "service_role_row_tombstones" ON cal.row_tombstones
+      FOR ALL TO service_role USING (true) WITH CHECK (true);
+  END IF;
+END $$;
+
+GRANT ALL ON cal.row_tombstones TO service_role;
+GRANT ALL ON cal.row_tombstones TO authenticator;
+GRANT USAGE ON SEQUENCE cal.row_tombstones_id_seq TO service_role;
+GRANT USAGE ON SEQUENCE cal.row_tombstones_id_seq TO authenticator;
+
+-- ============================================================
+-- 3. Trigger functions
+-- ============================================================
+
+CREATE OR REPLACE FUNCTION cal.touch_updated_at()
+RETURNS trigger
+LANGUAGE plpgsql
+AS $$
+BEGIN
+  NEW.updated_at := NOW();
+  RETURN NEW;
+END;
+$$;
+
+CREATE OR REPLACE FUNCTION cal.log_row_tombstone()
+RETURNS trigger
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = cal, public
+AS $$
+BEGIN
+  INSERT INTO cal.row_tombstones (table_name, row_id) VALUES (TG_TABLE_NAME, OLD.id);
+  RETURN OLD;
+END;
+$$;
+
+-- ============================================================
+-- 4. Triggers + updated_at indexes on every backed-up table
+-- ============================================================
+
+DO $$
+DECLARE
+  t TEXT;
+BEGIN
+  FOREACH t IN ARRAY ARRAY[
+    'companies', 'users', 'settings', 'vendors', 'tools', 'calibrations', 'attachments',
+    'email_log', 'usage_log', 'conversation_memory', 'kernel_versions'
+  ] LOOP
+    EXECUTE format('DROP TRIGGER IF EXISTS trg_%1$s_touch ON cal.%1$I', t);
+    EXECUTE format('CREATE TRIGGER trg_%1$s_touch BEFORE UPDATE ON cal.%1$I
+                    FOR EACH ROW EXECUTE FUNCTION cal.touch_updated_at()', t);
+    EXECUTE format('DROP TRIGGER IF EXISTS trg_%1$s_tombstone ON cal.%1$I', t);
+    EXECUTE format('CREATE TRIGGER trg_%1$s_tombstone AFTER DELETE ON cal.%1$I
+                    FOR EACH ROW EXECUTE FUNCTION cal.log_row_tombstone()', t);
+    EXECUTE format('CREATE INDEX IF NOT EXISTS idx_%1$s_updated_at ON cal.%1$I(updated_at)', t);
+  END LOOP;
+END $$;
+
+COMMIT;
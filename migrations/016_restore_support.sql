@@ -0,0 +1,47 @@
+-- ============================================================
+-- Migration 016: Restore support
+-- Project: ezlmmegowggujpcnzoda (GP3 / zoda)
+-- Run in: SQL Editor → https://supabase.com/dashboard/project/ezlmmegowggujpcnzoda/sql
+--
+-- * cal.job_runs.result — JSON report written by jobs that produce one
+--   (restore: per-table throughput + divergences).
+-- * cal.sync_id_sequences() — restores write explicit ids; this moves
+--   each table's id sequence past MAX(id) so later inserts don't collide.
+-- ============================================================
+
+BEGIN;
+
+ALTER TABLE cal.job_runs ADD COLUMN IF NOT EXISTS result JSONB;
+
+CREATE OR REPLACE FUNCTION cal.sync_id_sequences()
+RETURNS JSONB
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = cal, public
+AS $$
+DECLARE
+  t TEXT;
+  seq TEXT;
+  max_id BIGINT;
+  out JSONB := '{}'::jsonb;
+BEGIN
+  FOREACH t IN ARRAY ARRAY[
+    'companies', 'users', 'settings', 'vendors', 'tools', 'calibrations',
+    'attachments', 'email_log', 'usage_log', 'conversation_memory', 'kernel_versions'
+  ] LOOP
+    seq := COALESCE(
+      pg_get_serial_sequence('cal.' || t, 'id'),
+      CASE WHEN to_regclass('cal.' || t || '_id_seq') IS NOT NULL THEN 'cal.' || t || '_id_seq' END
+    );
+    CONTINUE WHEN seq IS NULL;
+    EXECUTE format('SELECT COALESCE(MAX(id), 0) FROM cal.%I', t) INTO max_id;
+    PERFORM setval(seq, GREATEST(max_id, 1), max_id > 0);
+    out := out || jsonb_build_object(t, max_id);
+  END LOOP;
+  RETURN out;
+END;
+$$;
+
+GRANT EXECUTE ON FUNCTION cal.sync_id_sequences() TO service_role;
+
+COMMIT;
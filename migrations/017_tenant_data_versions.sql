@@ -0,0 +1,155 @@
+-- ============================================================
+-- Migration 017: Per-tenant data version for ETags and delta sync
+-- Project: ezlmmegowggujpcnzoda (GP3 / zoda)
+-- Run in: SQL Editor → https://supabase.com/dashboard/project/ezlmmegowggujpcnzoda/sql
+--
+-- cal.tenant_data_versions holds one counter per company, bumped by
+-- trigger on every effective tool or calibration write (no-op updates
+-- don't bump). Each tool row records the version of its last change in
+-- tools.data_version, and tool deletes record it on the tombstone, so
+-- GET /cal/equipment/changes?since=N is two indexed range reads.
+--
+-- The bump is an UPSERT on the tenant's counter row, so concurrent
+-- writers for the same tenant serialize on that row lock and versions
+-- become visible in commit order — a client that synced to N never
+-- misses a change numbered <= N.
+-- ============================================================
+
+BEGIN;
+
+CREATE TABLE IF NOT EXISTS cal.tenant_data_versions (
+  company_id INTEGER PRIMARY KEY REFERENCES cal.companies(id) ON DELETE CASCADE,
+  version BIGINT NOT NULL DEFAULT 0,
+  updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+ALTER TABLE cal.tenant_data_versions ENABLE ROW LEVEL SECURITY;
+
+DO $$
+BEGIN
+  IF NOT EXISTS (
+    SELECT 1 FROM pg_policies
+    WHERE tablename='tenant_data_versions' AND schemaname='cal'
+      AND policyname='service_role_tenant_data_versions'
+  ) THEN
+    CREATE POLICY "service_role_tenant_data_versions" ON cal.tenant_data_versions
+      FOR ALL TO service_role USING (true) WITH CHECK (true);
+  END IF;
+END $$;
+
+GRANT ALL ON cal.tenant_data_versions TO service_role;
+GRANT ALL ON cal.tenant_data_versions TO authenticator;
+
+-- ============================================================
+-- Columns + backfill (touch trigger off so this doesn't look like churn
+-- to the delta backup)
+-- ============================================================
+
+ALTER TABLE cal.tools ADD COLUMN IF NOT EXISTS data_version BIGINT NOT NULL DEFAULT 0;
+ALTER TABLE cal.row_tombstones ADD COLUMN IF NOT EXISTS company_id INTEGER;
+ALTER TABLE cal.row_tombstones ADD COLUMN IF NOT EXISTS data_version BIGINT;
+
+ALTER TABLE cal.tools DISABLE TRIGGER trg_tools_touch;
+UPDATE cal.tools SET data_version = 1 WHERE data_version = 0;
+ALTER TABLE cal.tools ENABLE TRIGGER trg_tools_touch;
+
+INSERT INTO cal.tenant_data_versions (company_id, version)
+SELECT id, 1 FROM cal.companies
+ON CONFLICT (company_id) DO NOTHING;
+
+CREATE INDEX IF NOT EXISTS idx_tools_company_data_version ON cal.tools(company_id, data_version);
+CREATE INDEX IF NOT EXISTS idx_row_tombstones_company_version
+  ON cal.row_tombstones(company_id, table_name, data_version);
+
+-- ============================================================
+-- Trigger functions
+-- ============================================================
+
+CREATE OR REPLACE FUNCTION cal.bump_data_version(p_company_id INTEGER)
+RETURNS BIGINT
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = cal, public
+AS $$
+DECLARE
+  v BIGINT;
+BEGIN
+  IF p_company_id IS NULL THEN
+    RETURN NULL;
+  END IF;
+  INSERT INTO cal.tenant_data_versions (company_id, version, updated_at)
+  VALUES (p_company_id, 1, NOW())
+  ON CONFLICT (company_id) DO UPDATE
+    SET version = cal.tenant_data_versions.version + 1, updated_at = NOW()
+  RETURNING version INTO v;
+  RETURN v;
+END;
+$$;
+
+-- BEFORE INSERT/UPDATE on tools: stamp the row with the new tenant version.
+CREATE OR REPLACE FUNCTION cal.stamp_tool_data_version()
+RETURNS trigger
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = cal, public
+AS $$
+BEGIN
+  IF TG_OP = 'UPDATE' AND NEW IS NOT DISTINCT FROM OLD THEN
+    RETURN NEW;
+  END IF;
+  IF TG_OP = 'UPDATE' AND NEW.company_id IS DISTINCT FROM OLD.company_id THEN
+    PERFORM cal.bump_data_version(OLD.company_id);
+  END IF;
+  NEW.data_version := cal.bump_data_version(NEW.company_id);
+  RETURN NEW;
+END;
+$$;
+
+-- AFTER INSERT/UPDATE/DELETE on calibrations: bump the owning tenant.
+CREATE OR REPLACE FUNCTION cal.bump_calibration_data_version()
+RETURNS trigger
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = cal, public
+AS $$
+BEGIN
+  IF TG_OP = 'UPDATE' AND NEW IS NOT DISTINCT FROM OLD THEN
+    RETURN NULL;
+  END IF;
+  PERFORM cal.bump_data_version(t.company_id)
+  FROM cal.tools t
+  WHERE t.id = CASE WHEN TG_OP = 'DELETE' THEN OLD.tool_id ELSE NEW.tool_id END;
+  RETURN NULL;
+END;
+$$;
+
+-- Tombstones now carry company_id (when the table has one) and, for
+-- tools, the tenant version of the delete.
+CREATE OR REPLACE FUNCTION cal.log_row_tombstone()
+RETURNS trigger
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = cal, public
+AS $$
+DECLARE
+  cid INTEGER := NULLIF(to_jsonb(OLD)->>'company_id', '')::INTEGER;
+  ver BIGINT;
+BEGIN
+  IF TG_TABLE_NAME = 'tools' THEN
+    ver := cal.bump_data_version(cid);
+  END IF;
+  INSERT INTO cal.row_tombstones (table_name, row_id, company_id, data_version)
+  VALUES (TG_TABLE_NAME, OLD.id, cid, ver);
+  RETURN OLD;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS trg_tools_data_version ON cal.tools;
+CREATE TRIGGER trg_tools_data_version BEFORE INSERT OR UPDATE ON cal.tools
+  FOR EACH ROW EXECUTE FUNCTION cal.stamp_tool_data_version();
+
+DROP TRIGGER IF EXISTS trg_calibrations_data_version ON cal.calibrations;
+CREATE TRIGGER trg_calibrations_data_version AFTER INSERT OR UPDATE OR DELETE ON cal.calibrations
+  FOR EACH ROW EXECUTE FUNCTION cal.bump_calibration_data_version();
+
+COMMIT;
@@ -0,0 +1,122 @@
+-- ============================================================
+-- Migration 018: Precomputed per-tenant dashboard snapshot
+-- Project: ezlmmegowggujpcnzoda (GP3 / zoda)
+-- Run in: SQL Editor → https://supabase.com/dashboard/project/ezlmmegowggujpcnzoda/sql
+--
+-- /cal/dashboard used to pull every tool, bucket them in Python and run
+-- a COUNT(*) join on each request. The summary is now kept in
+-- cal.dashboard_snapshots, tagged with the tenant data version
+-- (migration 017) and the date it was bucketed for:
+--   * the backend refreshes it after tool/calibration writes and from
+--     the daily refresh_statuses job
+--   * cal.dashboard_snapshot() returns the stored row, recomputing only
+--     if it is missing, from an older data version, or from yesterday
+-- ============================================================
+
+BEGIN;
+
+CREATE TABLE IF NOT EXISTS cal.dashboard_snapshots (
+  company_id INTEGER PRIMARY KEY REFERENCES cal.companies(id) ON DELETE CASCADE,
+  data_version BIGINT NOT NULL DEFAULT 0,
+  as_of DATE NOT NULL DEFAULT CURRENT_DATE,
+  summary JSONB NOT NULL DEFAULT '{}'::jsonb,
+  refreshed_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+ALTER TABLE cal.dashboard_snapshots ENABLE ROW LEVEL SECURITY;
+
+DO $$
+BEGIN
+  IF NOT EXISTS (
+    SELECT 1 FROM pg_policies
+    WHERE tablename='dashboard_snapshots' AND schemaname='cal'
+      AND policyname='service_role_dashboard_snapshots'
+  ) THEN
+    CREATE POLICY "service_role_dashboard_snapshots" ON cal.dashboard_snapshots
+      FOR ALL TO service_role USING (true) WITH CHECK (true);
+  END IF;
+END $$;
+
+GRANT ALL ON cal.dashboard_snapshots TO service_role;
+GRANT ALL ON cal.dashboard_snapshots TO authenticator;
+
+CREATE INDEX IF NOT EXISTS idx_calibrations_tool_id ON cal.calibrations(tool_id);
+
+-- Recompute and store. Version and buckets are read in one statement so
+-- the stored data_version matches the rows that were summarized.
+CREATE OR REPLACE FUNCTION cal.refresh_dashboard_snapshot(p_company_id INTEGER)
+RETURNS JSONB
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = cal, public
+AS $$
+DECLARE
+  out JSONB;
+BEGIN
+  WITH t AS (
+    SELECT id, next_due_date,
+           COALESCE(calibration_status, 'unknown') AS status_key,
+           CASE
+             WHEN calibration_status = 'overdue' OR next_due_date::date < CURRENT_DATE THEN 'overdue'
+             WHEN next_due_date::date <= CURRENT_DATE + 60 THEN 'upcoming'
+           END AS bucket,
+           jsonb_build_object(
+             'asset_tag', COALESCE(asset_tag, ''), 'tool_type', COALESCE(tool_type, ''),
+             'tool_name', COALESCE(tool_name, ''), 'manufacturer', COALESCE(manufacturer, ''),
+             'next_due_date', next_due_date, 'status', COALESCE(calibration_status, '')
+           ) AS item
+    FROM cal.tools
+    WHERE company_id = p_company_id
+  ),
+  s AS (
+    SELECT
+      COALESCE((SELECT version FROM cal.tenant_data_versions WHERE company_id = p_company_id), 0) AS data_version,
+      jsonb_build_object(
+        'tool_count', (SELECT COUNT(*) FROM t),
+        'calibration_count', (SELECT COUNT(*) FROM cal.calibrations c
+                               JOIN cal.tools tt ON tt.id = c.tool_id
+                               WHERE tt.company_id = p_company_id),
+        'status_summary', COALESCE((SELECT jsonb_object_agg(status_key, n)
+                                    FROM (SELECT status_key, COUNT(*) AS n FROM t GROUP BY status_key) g),
+                                   '{}'::jsonb),
+        'upcoming_expirations', COALESCE((SELECT jsonb_agg(item ORDER BY next_due_date, id)
+                                          FROM t WHERE bucket = 'upcoming'), '[]'::jsonb),
+        'overdue', COALESCE((SELECT jsonb_agg(item ORDER BY next_due_date NULLS LAST, id)
+                             FROM t WHERE bucket = 'overdue'), '[]'::jsonb)
+      ) AS summary
+  )
+  INSERT INTO cal.dashboard_snapshots (company_id, data_version, as_of, summary, refreshed_at)
+  SELECT p_company_id, s.data_version, CURRENT_DATE, s.summary, NOW() FROM s
+  ON CONFLICT (company_id) DO UPDATE
+    SET data_version = EXCLUDED.data_version, as_of = EXCLUDED.as_of,
+        summary = EXCLUDED.summary, refreshed_at = EXCLUDED.refreshed_at
+  RETURNING jsonb_build_object('data_version', data_version, 'as_of', as_of, 'summary', summary)
+  INTO out;
+  RETURN out;
+END;
+$$;
+
+-- Keyed read; falls back to a refresh only when the snapshot is stale.
+CREATE OR REPLACE FUNCTION cal.dashboard_snapshot(p_company_id INTEGER)
+RETURNS JSONB
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = cal, public
+AS $$
+DECLARE
+  snap cal.dashboard_snapshots%ROWTYPE;
+  cur BIGINT;
+BEGIN
+  SELECT * INTO snap FROM cal.dashboard_snapshots WHERE company_id = p_company_id;
+  SELECT version INTO cur FROM cal.tenant_data_versions WHERE company_id = p_company_id;
+  IF snap.company_id IS NULL OR snap.as_of <> CURRENT_DATE OR snap.data_version <> COALESCE(cur, 0) THEN
+    RETURN cal.refresh_dashboard_snapshot(p_company_id);
+  END IF;
+  RETURN jsonb_build_object('data_version', snap.data_version, 'as_of', snap.as_of, 'summary', snap.summary);
+END;
+$$;
+
+GRANT EXECUTE ON FUNCTION cal.refresh_dashboard_snapshot(INTEGER) TO service_role;
+GRANT EXECUTE ON FUNCTION cal.dashboard_snapshot(INTEGER) TO service_role;
+
+COMMIT;
@@ -0,0 +1,206 @@
+-- ============================================================
+-- Migration 019: Server-side analytics functions
+-- Project: ezlmmegowggujpcnzoda (GP3 / zoda)
+-- Run in: SQL Editor → https://supabase.com/dashboard/project/ezlmmegowggujpcnzoda/sql
+--
+-- The five analytics reports used to fetch every active tool id, send
+-- them back as a tool_id=in.(…) filter (which overruns URL limits past a
+-- few thousand tools), pull every calibration row and aggregate in
+-- Python. Each report is now one function doing the join + GROUP BY in
+-- Postgres and returning the final JSON; the Python functions only call
+-- them via cal_rpc().
+-- ============================================================
+
+BEGIN;
+
+CREATE INDEX IF NOT EXISTS idx_tools_company_active ON cal.tools(company_id) WHERE active;
+CREATE INDEX IF NOT EXISTS idx_calibrations_tool_date ON cal.calibrations(tool_id, calibration_date);
+
+-- Failure/OOT rate per tool_type (types with >= 3 records), highest first.
+CREATE OR REPLACE FUNCTION cal.analytics_failure_rates(p_company_id INTEGER)
+RETURNS JSONB
+LANGUAGE sql
+STABLE
+SECURITY DEFINER
+SET search_path = cal, public
+AS $$
+  SELECT COALESCE(jsonb_agg(r ORDER BY r.failure_pct DESC, r.tool_type), '[]'::jsonb)
+  FROM (
+    SELECT tool_type, total, failures, failure_pct, failure_pct > 10 AS flagged
+    FROM (
+      SELECT COALESCE(t.tool_type, 'Unknown') AS tool_type,
+             COUNT(*) AS total,
+             COUNT(*) FILTER (WHERE c.result IN ('fail', 'out_of_tolerance')) AS failures,
+             ROUND(COUNT(*) FILTER (WHERE c.result IN ('fail', 'out_of_tolerance')) * 100.0 / COUNT(*), 1) AS failure_pct
+      FROM cal.calibrations c
+      JOIN cal.tools t ON t.id = c.tool_id
+      WHERE t.company_id = p_company_id AND t.active
+      GROUP BY 1
+      HAVING COUNT(*) >= 3
+    ) g
+  ) r;
+$$;
+
+-- Average actual interval between consecutive calibrations vs planned
+-- cal_interval_days, per tool_type. Planned days per type come from the
+-- lowest tool id in the type (matches the previous Python behaviour).
+CREATE OR REPLACE FUNCTION cal.analytics_interval_variance(p_company_id INTEGER)
+RETURNS JSONB
+LANGUAGE sql
+STABLE
+SECURITY DEFINER
+SET search_path = cal, public
+AS $$
+  WITH diffs AS (
+    SELECT t.id AS tool_id, COALESCE(t.tool_type, 'Unknown') AS tool_type, t.cal_interval_days AS planned,
+           c.calibration_date::date
+             - LAG(c.calibration_date::date) OVER (PARTITION BY c.tool_id ORDER BY c.calibration_date) AS diff
+    FROM cal.calibrations c
+    JOIN cal.tools t ON t.id = c.tool_id
+    WHERE t.company_id = p_company_id AND t.active
+      AND c.calibration_date IS NOT NULL
+      AND COALESCE(t.cal_interval_days, 0) > 0
+  ),
+  by_type AS (
+    SELECT tool_type,
+           (ARRAY_AGG(planned ORDER BY tool_id))[1] AS planned_days,
+           ROUND(AVG(diff))::INTEGER AS avg_actual_days,
+           COUNT(*) AS sample_size
+    FROM diffs
+    WHERE diff > 0
+    GROUP BY tool_type
+  ),
+  r AS (
+    SELECT tool_type, planned_days, avg_actual_days,
+           ROUND(avg_actual_days::NUMERIC / planned_days, 2) AS ratio,
+           sample_size
+    FROM by_type
+  )
+  SELECT COALESCE(jsonb_agg(jsonb_build_object(
+           'tool_type', tool_type, 'planned_days', planned_days, 'avg_actual_days', avg_actual_days,
+           'ratio', ratio, 'sample_size', sample_size,
+           'flag', CASE WHEN ratio < 0.8 THEN 'over-calibrating (cost waste)'
+                        WHEN ratio > 1.2 THEN 'under-calibrating (compliance risk)'
+                        ELSE 'on target' END
+         ) ORDER BY ratio, tool_type), '[]'::jsonb)
+  FROM r;
+$$;
+
+-- Vendor turnaround (received - sent) vs vendor SLA (default 14 days).
+CREATE OR REPLACE FUNCTION cal.analytics_vendor_turnaround(p_company_id INTEGER)
+RETURNS JSONB
+LANGUAGE sql
+STABLE
+SECURITY DEFINER
+SET search_path = cal, public
+AS $$
+  WITH turn AS (
+    SELECT COALESCE(c.performed_by, 'Unknown') AS vendor,
+           c.received_from_vendor_date::date - c.sent_to_vendor_date::date AS days
+    FROM cal.calibrations c
+    JOIN cal.tools t ON t.id = c.tool_id
+    WHERE t.company_id = p_company_id AND t.active
+      AND c.sent_to_vendor_date IS NOT NULL
+      AND c.received_from_vendor_date IS NOT NULL
+  ),
+  agg AS (
+    SELECT vendor, ROUND(AVG(days), 1) AS avg_days, COUNT(*) AS sample_size
+    FROM turn
+    WHERE days >= 0
+    GROUP BY vendor
+  ),
+  r AS (
+    SELECT a.vendor, a.avg_days, a.sample_size,
+           COALESCE((SELECT v.sla_days FROM cal.vendors v
+                     WHERE v.company_id = p_company_id AND lower(v.vendor_name) = lower(a.vendor)
+                     ORDER BY v.id DESC LIMIT 1), 14) AS sla_days
+    FROM agg a
+  )
+  SELECT COALESCE(jsonb_agg(jsonb_build_object(
+           'vendor', vendor, 'avg_turnaround_days', avg_days, 'sla_days', sla_days,
+           'sample_size', sample_size, 'sla_exceeded', avg_days > sla_days
+         ) ORDER BY avg_days DESC, vendor), '[]'::jsonb)
+  FROM r;
+$$;
+
+-- Projected cost of calibrations due in the next p_days, from the
+-- historical average cost per tool_type.
+CREATE OR REPLACE FUNCTION cal.analytics_cost_projection(p_company_id INTEGER, p_days INTEGER DEFAULT 90)
+RETURNS JSONB
+LANGUAGE sql
+STABLE
+SECURITY DEFINER
+SET search_path = cal, public
+AS $$
+  WITH hist AS (
+    SELECT COALESCE(t.tool_type, 'Unknown') AS tool_type,
+           ROUND(AVG(c.cost)::NUMERIC, 2) AS avg_cost, COUNT(*) AS samples
+    FROM cal.calibrations c
+    JOIN cal.tools t ON t.id = c.tool_id
+    WHERE t.company_id = p_company_id AND t.active AND c.cost IS NOT NULL
+    GROUP BY 1
+  ),
+  upcoming AS (
+    SELECT COALESCE(tool_type, 'Unknown') AS tool_type, COUNT(*) AS upcoming_count
+    FROM cal.tools
+    WHERE company_id = p_company_id AND active
+      AND next_due_date::date BETWEEN CURRENT_DATE AND CURRENT_DATE + p_days
+    GROUP BY 1
+  ),
+  r AS (
+    SELECT u.tool_type, u.upcoming_count,
+           COALESCE(h.avg_cost, 0) AS avg_cost,
+           ROUND(COALESCE(h.avg_cost, 0) * u.upcoming_count, 2) AS estimated,
+           CASE WHEN COALESCE(h.samples, 0) >= 5 THEN 'high'
+                WHEN COALESCE(h.samples, 0) >= 2 THEN 'medium'
+                ELSE 'low' END AS confidence
+    FROM upcoming u
+    LEFT JOIN hist h ON h.tool_type = u.tool_type
+  )
+  SELECT jsonb_build_object(
+    'total_estimated', COALESCE((SELECT ROUND(SUM(estimated), 2) FROM r), 0),
+    'by_type', COALESCE((SELECT jsonb_agg(jsonb_build_object(
+                  'tool_type', tool_type, 'upcoming_count', upcoming_count,
+                  'avg_historical_cost', avg_cost, 'estimated', estimated, 'confidence', confidence
+                ) ORDER BY estimated DESC, tool_type) FROM r), '[]'::jsonb),
+    'confidence', CASE
+                    WHEN COALESCE((SELECT bool_and(confidence = 'high') FROM r), true) THEN 'high'
+                    WHEN (SELECT bool_and(confidence = 'low') FROM r) THEN 'low'
+                    ELSE 'medium' END,
+    'days_ahead', p_days
+  );
+$$;
+
+-- Monthly calibration volume over the last 24 months; peaks are months
+-- above 1.5x the average.
+CREATE OR REPLACE FUNCTION cal.analytics_seasonal(p_company_id INTEGER)
+RETURNS JSONB
+LANGUAGE sql
+STABLE
+SECURITY DEFINER
+SET search_path = cal, public
+AS $$
+  WITH monthly AS (
+    SELECT to_char(c.calibration_date, 'YYYY-MM') AS month, COUNT(*) AS cnt
+    FROM cal.calibrations c
+    JOIN cal.tools t ON t.id = c.tool_id
+    WHERE t.company_id = p_company_id AND t.active
+      AND c.calibration_date >= date_trunc('month', CURRENT_DATE)::date - 730
+    GROUP BY 1
+  ),
+  stats AS (SELECT AVG(cnt) AS avg_cnt FROM monthly)
+  SELECT jsonb_build_object(
+    'monthly_counts', COALESCE((SELECT jsonb_object_agg(month, cnt ORDER BY month) FROM monthly), '{}'::jsonb),
+    'peak_months', COALESCE((SELECT jsonb_agg(month ORDER BY month) FROM monthly, stats
+                             WHERE cnt > stats.avg_cnt * 1.5), '[]'::jsonb),
+    'avg_monthly', COALESCE((SELECT ROUND(avg_cnt, 1) FROM stats), 0)
+  );
+$$;
+
+GRANT EXECUTE ON FUNCTION cal.analytics_failure_rates(INTEGER) TO service_role;
+GRANT EXECUTE ON FUNCTION cal.analytics_interval_variance(INTEGER) TO service_role;
+GRANT EXECUTE ON FUNCTION cal.analytics_vendor_turnaround(INTEGER) TO service_role;
+GRANT EXECUTE ON FUNCTION cal.analytics_cost_projection(INTEGER, INTEGER) TO service_role;
+GRANT EXECUTE ON FUNCTION cal.analytics_seasonal(INTEGER) TO service_role;
+
+COMMIT;
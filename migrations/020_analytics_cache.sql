@@ -0,0 +1,68 @@
+-- ============================================================
+-- Migration 020: Shared analytics result cache
+-- Project: ezlmmegowggujpcnzoda (GP3 / zoda)
+-- Run in: SQL Editor → https://supabase.com/dashboard/project/ezlmmegowggujpcnzoda/sql
+--
+-- Analytics reports are cached per (company_id, report, params_key) and
+-- tagged with the tenant data version they were computed at. A row
+-- whose data_version is behind cal.tenant_data_versions is stale: the
+-- backend may still serve it while it recomputes in the background.
+--
+-- Vendor SLA changes feed vendor_turnaround, so vendor writes now bump
+-- the tenant data version too (tools/calibrations already do, 017).
+-- ============================================================
+
+BEGIN;
+
+CREATE TABLE IF NOT EXISTS cal.analytics_cache (
+  company_id INTEGER NOT NULL REFERENCES cal.companies(id) ON DELETE CASCADE,
+  report VARCHAR(100) NOT NULL,
+  params_key VARCHAR(200) NOT NULL DEFAULT '',
+  data_version BIGINT NOT NULL,
+  result JSONB NOT NULL,
+  computed_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+  PRIMARY KEY (company_id, report, params_key)
+);
+
+ALTER TABLE cal.analytics_cache ENABLE ROW LEVEL SECURITY;
+
+DO $$
+BEGIN
+  IF NOT EXISTS (
+    SELECT 1 FROM pg_policies
+    WHERE tablename='analytics_cache' AND schemaname='cal'
+      AND policyname='service_role_analytics_cache'
+  ) THEN
+    CREATE POLICY "service_role_analytics_cache" ON cal.analytics_cache
+      FOR ALL TO service_role USING (true) WITH CHECK (true);
+  END IF;
+END $$;
+
+GRANT ALL ON cal.analytics_cache TO service_role;
+GRANT ALL ON cal.analytics_cache TO authenticator;
+
+CREATE OR REPLACE FUNCTION cal.bump_row_data_version()
+RETURNS trigger
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = cal, public
+AS $$
+BEGIN
+  IF TG_OP = 'UPDATE' AND NEW IS NOT DISTINCT FROM OLD THEN
+    RETURN NULL;
+  END IF;
+  IF TG_OP IN ('UPDATE', 'DELETE') THEN
+    PERFORM cal.bump_data_version(OLD.company_id);
+  END IF;
+  IF TG_OP = 'INSERT' OR (TG_OP = 'UPDATE' AND NEW.company_id IS DISTINCT FROM OLD.company_id) THEN
+    PERFORM cal.bump_data_version(NEW.company_id);
+  END IF;
+  RETURN NULL;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS trg_vendors_data_version ON cal.vendors;
+CREATE TRIGGER trg_vendors_data_version AFTER INSERT OR UPDATE OR DELETE ON cal.vendors
+  FOR EACH ROW EXECUTE FUNCTION cal.bump_row_data_version();
+
+COMMIT;
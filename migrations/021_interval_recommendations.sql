@@ -0,0 +1,52 @@
+-- ============================================================
+-- Migration 021: Reliability-based calibration interval recommendations
+-- Project: ezlmmegowggujpcnzoda (GP3 / zoda)
+-- Run in: SQL Editor → https://supabase.com/dashboard/project/ezlmmegowggujpcnzoda/sql
+--
+-- Written weekly by the interval_optimization job: one row per
+-- (company, tool_type) with the fitted time-to-out-of-tolerance model
+-- (exponential or Weibull) and the interval that meets the tenant's
+-- target in-tolerance probability. Read by
+-- GET /cal/analytics/interval-recommendations.
+-- ============================================================
+
+BEGIN;
+
+CREATE TABLE IF NOT EXISTS cal.interval_recommendations (
+  company_id INTEGER NOT NULL REFERENCES cal.companies(id) ON DELETE CASCADE,
+  tool_type VARCHAR(200) NOT NULL,
+  model VARCHAR(20) NOT NULL,                 -- exponential | weibull
+  shape NUMERIC,
+  scale_days NUMERIC,
+  intervals INTEGER NOT NULL,
+  failures INTEGER NOT NULL,
+  current_interval_days INTEGER,
+  reliability_at_current NUMERIC,
+  target_reliability NUMERIC NOT NULL,
+  recommended_interval_days INTEGER,
+  clamped BOOLEAN NOT NULL DEFAULT FALSE,
+  computed_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+  PRIMARY KEY (company_id, tool_type)
+);
+
+CREATE INDEX IF NOT EXISTS idx_interval_recommendations_computed
+  ON cal.interval_recommendations(computed_at);
+
+ALTER TABLE cal.interval_recommendations ENABLE ROW LEVEL SECURITY;
+
+DO $$
+BEGIN
+  IF NOT EXISTS (
+    SELECT 1 FROM pg_policies
+    WHERE tablename='interval_recommendations' AND schemaname='cal'
+      AND policyname='service_role_interval_recommendations'
+  ) THEN
+    CREATE POLICY "service_role_interval_recommendations" ON cal.interval_recommendations
+      FOR ALL TO service_role USING (true) WITH CHECK (true);
+  END IF;
+END $$;
+
+GRANT ALL ON cal.interval_recommendations TO service_role;
+GRANT ALL ON cal.interval_recommendations TO authenticator;
+
+COMMIT;
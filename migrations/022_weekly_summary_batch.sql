@@ -0,0 +1,60 @@
+-- ============================================================
+-- Migration 022: Cross-tenant weekly summary batch
+-- Project: ezlmmegowggujpcnzoda (GP3 / zoda)
+-- Run in: SQL Editor → https://supabase.com/dashboard/project/ezlmmegowggujpcnzoda/sql
+--
+-- weekly_summary used to cost ~8 round trips per tenant (settings,
+-- branding, tools, three analytics reports with their tool lists)
+-- before sending anything. This returns everything the email needs for
+-- a batch of tenants in one call: active-tool counts by status and by
+-- type plus the failure-rate, vendor-turnaround and 90-day cost reports
+-- (the migration 019 functions, evaluated inside the database).
+-- ============================================================
+
+BEGIN;
+
+CREATE OR REPLACE FUNCTION cal.weekly_summary_batch(p_company_ids INTEGER[])
+RETURNS JSONB
+LANGUAGE sql
+STABLE
+SECURITY DEFINER
+SET search_path = cal, public
+AS $$
+  WITH status_counts AS (
+    SELECT company_id, jsonb_object_agg(status, n) AS counts, SUM(n) AS total
+    FROM (
+      SELECT company_id, COALESCE(NULLIF(calibration_status, ''), 'unknown') AS status, COUNT(*) AS n
+      FROM cal.tools
+      WHERE company_id = ANY(p_company_ids) AND active
+      GROUP BY 1, 2
+    ) s
+    GROUP BY company_id
+  ),
+  type_counts AS (
+    SELECT company_id, jsonb_object_agg(tool_type, n) AS counts
+    FROM (
+      SELECT company_id, COALESCE(NULLIF(tool_type, ''), 'Uncategorized') AS tool_type, COUNT(*) AS n
+      FROM cal.tools
+      WHERE company_id = ANY(p_company_ids) AND active
+      GROUP BY 1, 2
+    ) t
+    GROUP BY company_id
+  )
+  SELECT COALESCE(jsonb_agg(jsonb_build_object(
+    'company_id', c.id,
+    'total', COALESCE(sc.total, 0),
+    'status_counts', COALESCE(sc.counts, '{}'::jsonb),
+    'type_counts', COALESCE(tc.counts, '{}'::jsonb),
+    'failure_rates', cal.analytics_failure_rates(c.id),
+    'vendor_turnaround', cal.analytics_vendor_turnaround(c.id),
+    'cost_projection', cal.analytics_cost_projection(c.id, 90)
+  ) ORDER BY c.id), '[]'::jsonb)
+  FROM cal.companies c
+  LEFT JOIN status_counts sc ON sc.company_id = c.id
+  LEFT JOIN type_counts tc ON tc.company_id = c.id
+  WHERE c.id = ANY(p_company_ids);
+$$;
+
+GRANT EXECUTE ON FUNCTION cal.weekly_summary_batch(INTEGER[]) TO service_role;
+
+COMMIT;
@@ -0,0 +1,90 @@
+-- ============================================================
+-- Migration 023: Outbound email queue
+-- Project: ezlmmegowggujpcnzoda (GP3 / zoda)
+-- Run in: SQL Editor → https://supabase.com/dashboard/project/ezlmmegowggujpcnzoda/sql
+--
+-- Cron jobs and handlers enqueue mail here instead of calling Mailgun
+-- inline. Every backend worker runs an async sender that claims due rows
+-- with FOR UPDATE SKIP LOCKED (so workers never double-send), delivers
+-- them with per-domain rate limits, retries transient failures with
+-- exponential backoff, and writes cal.email_log from the final outcome.
+--
+-- status: queued → sending → sent | dead
+--   (sending rows whose worker died are reclaimed after 10 minutes)
+-- on_delivered: follow-up applied only after a successful send, e.g.
+--   {"mark_alerted": {"level": "overdue", "tool_ids": [1, 2]}}
+-- ============================================================
+
+BEGIN;
+
+CREATE TABLE IF NOT EXISTS cal.email_outbox (
+  id BIGSERIAL PRIMARY KEY,
+  company_id INTEGER REFERENCES cal.companies(id) ON DELETE CASCADE,
+  category VARCHAR(50),                        -- overdue | critical | warning | purchasing | milestone | summary | reply
+  sender TEXT NOT NULL,
+  to_address TEXT NOT NULL,
+  cc_address TEXT,
+  subject TEXT NOT NULL,
+  log_subject TEXT,                            -- subject recorded in email_log (defaults to subject)
+  body TEXT NOT NULL,
+  is_html BOOLEAN NOT NULL DEFAULT TRUE,
+  recipient_variables JSONB,                   -- Mailgun batch send: one copy per To address
+  on_delivered JSONB,
+  status VARCHAR(20) NOT NULL DEFAULT 'queued',
+  attempts INTEGER NOT NULL DEFAULT 0,
+  max_attempts INTEGER NOT NULL DEFAULT 6,
+  next_attempt_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+  locked_by TEXT,
+  locked_at TIMESTAMPTZ,
+  last_error TEXT,
+  provider_message_id TEXT,
+  created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+  sent_at TIMESTAMPTZ
+);
+
+CREATE INDEX IF NOT EXISTS idx_email_outbox_due
+  ON cal.email_outbox(next_attempt_at) WHERE status IN ('queued', 'sending');
+CREATE INDEX IF NOT EXISTS idx_email_outbox_company ON cal.email_outbox(company_id, created_at DESC);
+
+ALTER TABLE cal.email_outbox ENABLE ROW LEVEL SECURITY;
+
+DO $$
+BEGIN
+  IF NOT EXISTS (
+    SELECT 1 FROM pg_policies
+    WHERE tablename='email_outbox' AND schemaname='cal'
+      AND policyname='service_role_email_outbox'
+  ) THEN
+    CREATE POLICY "service_role_email_outbox" ON cal.email_outbox
+      FOR ALL TO service_role USING (true) WITH CHECK (true);
+  END IF;
+END $$;
+
+GRANT ALL ON cal.email_outbox TO service_role;
+GRANT ALL ON cal.email_outbox TO authenticator;
+GRANT USAGE ON SEQUENCE cal.email_outbox_id_seq TO service_role;
+GRANT USAGE ON SEQUENCE cal.email_outbox_id_seq TO authenticator;
+
+-- Claim up to p_limit due messages for one worker.
+CREATE OR REPLACE FUNCTION cal.claim_email_outbox(p_worker TEXT, p_limit INTEGER DEFAULT 20)
+RETURNS SETOF cal.email_outbox
+LANGUAGE sql
+SECURITY DEFINER
+SET search_path = cal, public
+AS $$
+  UPDATE cal.email_outbox o
+  SET status = 'sending', locked_by = p_worker, locked_at = NOW(), attempts = o.attempts + 1
+  WHERE o.id IN (
+    SELECT id FROM cal.email_outbox
+    WHERE (status = 'queued' AND next_attempt_at <= NOW())
+       OR (status = 'sending' AND locked_at < NOW() - INTERVAL '10 minutes')
+    ORDER BY next_attempt_at, id
+    LIMIT p_limit
+    FOR UPDATE SKIP LOCKED
+  )
+  RETURNING o.*;
+$$;
+
+GRANT EXECUTE ON FUNCTION cal.claim_email_outbox(TEXT, INTEGER) TO service_role;
+
+COMMIT;
@@ -0,0 +1,151 @@
+-- ============================================================
+-- Migration 024: Due-date transition index for the daily jobs
+-- Project: ezlmmegowggujpcnzoda (GP3 / zoda)
+-- Run in: SQL Editor → https://supabase.com/dashboard/project/ezlmmegowggujpcnzoda/sql
+--
+-- tools.next_transition_date is the next day refresh_statuses or
+-- enforcement_scan has anything to do for the tool:
+--   * days-until-due hits 30, 14, 7, 3, 1, 0 or -1 (status change or
+--     progressive milestone),
+--   * inside the 30-day window, the alert dedup rule lets it re-alert
+--     (never alerted, level changed, or last alert 7+ days ago),
+--   * its stored calibration_status is out of step with its due date.
+-- A BEFORE trigger keeps it current on every write that can move it;
+-- the jobs read only tools with next_transition_date <= today, and
+-- enforcement_scan calls cal.advance_transition_dates() per tenant once
+-- the day's alerts are queued.
+-- ============================================================
+
+BEGIN;
+
+ALTER TABLE cal.tools ADD COLUMN IF NOT EXISTS next_transition_date DATE;
+
+CREATE INDEX IF NOT EXISTS idx_tools_next_transition
+  ON cal.tools(company_id, next_transition_date)
+  WHERE active AND next_transition_date IS NOT NULL;
+
+-- Mirrors refresh_statuses (status buckets) and _should_alert_tool (dedup).
+CREATE OR REPLACE FUNCTION cal.tool_next_transition(
+  p_next_due_date DATE,
+  p_status TEXT,
+  p_last_alert_at TIMESTAMPTZ,
+  p_last_alert_level TEXT,
+  p_as_of DATE
+)
+RETURNS DATE
+LANGUAGE plpgsql
+IMMUTABLE
+AS $$
+DECLARE
+  v_days INTEGER;
+  v_due_next DATE;
+  v_alert_next DATE;
+  v_level TEXT;
+BEGIN
+  IF p_next_due_date IS NULL THEN
+    RETURN NULL;
+  END IF;
+  v_days := p_next_due_date - p_as_of;
+
+  IF p_status IS DISTINCT FROM CASE
+      WHEN v_days < 0 THEN 'overdue'
+      WHEN v_days <= 7 THEN 'critical'
+      WHEN v_days <= 30 THEN 'expiring_soon'
+      ELSE 'current' END THEN
+    RETURN p_as_of;
+  END IF;
+
+  SELECT MIN(p_next_due_date - t) INTO v_due_next
+  FROM unnest(ARRAY[30, 14, 7, 3, 1, 0, -1]) AS t
+  WHERE p_next_due_date - t >= p_as_of;
+
+  IF v_days <= 30 THEN
+    v_level := CASE WHEN v_days < 0 THEN 'overdue' WHEN v_days <= 7 THEN 'critical' ELSE 'warning' END;
+    IF p_last_alert_at IS NULL OR p_last_alert_level IS DISTINCT FROM v_level THEN
+      v_alert_next := p_as_of;
+    ELSE
+      v_alert_next := GREATEST((p_last_alert_at AT TIME ZONE 'UTC')::date + 7, p_as_of);
+    END IF;
+  END IF;
+
+  RETURN LEAST(v_due_next, v_alert_next);   -- LEAST skips NULLs
+END;
+$$;
+
+CREATE OR REPLACE FUNCTION cal.set_tool_next_transition()
+RETURNS trigger
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = cal, public
+AS $$
+BEGIN
+  NEW.next_transition_date := CASE WHEN COALESCE(NEW.active, TRUE) THEN
+    cal.tool_next_transition(NEW.next_due_date::date, NEW.calibration_status,
+                             NEW.last_alert_sent_at, NEW.last_alert_level, CURRENT_DATE)
+  END;
+  RETURN NEW;
+END;
+$$;
+
+-- Named to sort before trg_tools_data_version (BEFORE triggers fire in
+-- name order), so the version stamp sees the final row.
+DROP TRIGGER IF EXISTS trg_tools_a_next_transition ON cal.tools;
+CREATE TRIGGER trg_tools_a_next_transition
+  BEFORE INSERT OR UPDATE OF next_due_date, calibration_status, last_alert_sent_at, last_alert_level, active
+  ON cal.tools
+  FOR EACH ROW EXECUTE FUNCTION cal.set_tool_next_transition();
+
+-- A transition date moving on its own is bookkeeping, not a data change:
+-- don't bump the tenant version (ETags, delta sync) for it.
+CREATE OR REPLACE FUNCTION cal.stamp_tool_data_version()
+RETURNS trigger
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = cal, public
+AS $$
+BEGIN
+  IF TG_OP = 'UPDATE'
+     AND to_jsonb(NEW) - 'next_transition_date' = to_jsonb(OLD) - 'next_transition_date' THEN
+    RETURN NEW;
+  END IF;
+  IF TG_OP = 'UPDATE' AND NEW.company_id IS DISTINCT FROM OLD.company_id THEN
+    PERFORM cal.bump_data_version(OLD.company_id);
+  END IF;
+  NEW.data_version := cal.bump_data_version(NEW.company_id);
+  RETURN NEW;
+END;
+$$;
+
+-- Called by enforcement_scan after a tenant's alerts are queued: move every
+-- tool whose transition has been handled to its next one as of p_as_of
+-- (normally tomorrow). Returns the number of tools advanced.
+CREATE OR REPLACE FUNCTION cal.advance_transition_dates(p_company_id INTEGER, p_as_of DATE)
+RETURNS INTEGER
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = cal, public
+AS $$
+DECLARE
+  n INTEGER;
+BEGIN
+  UPDATE cal.tools
+  SET next_transition_date = cal.tool_next_transition(
+        next_due_date::date, calibration_status, last_alert_sent_at, last_alert_level, p_as_of)
+  WHERE company_id = p_company_id
+    AND active
+    AND next_transition_date < p_as_of;
+  GET DIAGNOSTICS n = ROW_COUNT;
+  RETURN n;
+END;
+$$;
+
+-- Backfill: every active tool with a due date gets evaluated on the next run.
+UPDATE cal.tools
+SET next_transition_date = cal.tool_next_transition(
+      next_due_date::date, calibration_status, last_alert_sent_at, last_alert_level, CURRENT_DATE)
+WHERE active AND next_due_date IS NOT NULL;
+
+GRANT EXECUTE ON FUNCTION cal.tool_next_transition(DATE, TEXT, TIMESTAMPTZ, TEXT, DATE) TO service_role;
+GRANT EXECUTE ON FUNCTION cal.advance_transition_dates(INTEGER, DATE) TO service_role;
+
+COMMIT;
@@ -0,0 +1,48 @@
+-- ============================================================
+-- Migration 025: Sequence-backed ids for companies, users, settings
+-- Project: ezlmmegowggujpcnzoda (GP3 / zoda)
+-- Run in: SQL Editor → https://supabase.com/dashboard/project/ezlmmegowggujpcnzoda/sql
+--
+-- cal.companies, cal.users and cal.settings had no id DEFAULT, so the API
+-- read MAX(id) and inserted MAX(id)+1: one extra round trip per insert,
+-- and two concurrent signups picked the same id and one of them failed.
+-- Each table now takes its id from a sequence (nextval never blocks and
+-- never hands out the same value twice), so inserts omit id entirely and
+-- multi-row inserts allocate their ids in the same statement.
+--
+-- cal.settings_id_seq already exists (migration 013 used it explicitly);
+-- it is attached to the column here like the other two. Sequences are
+-- OWNED BY their column so cal.sync_id_sequences() (migration 016) finds
+-- them after a restore.
+-- ============================================================
+
+BEGIN;
+
+CREATE SEQUENCE IF NOT EXISTS cal.companies_id_seq;
+CREATE SEQUENCE IF NOT EXISTS cal.users_id_seq;
+CREATE SEQUENCE IF NOT EXISTS cal.settings_id_seq;
+
+ALTER SEQUENCE cal.companies_id_seq OWNED BY cal.companies.id;
+ALTER SEQUENCE cal.users_id_seq OWNED BY cal.users.id;
+ALTER SEQUENCE cal.settings_id_seq OWNED BY cal.settings.id;
+
+-- Start past every id handed out by the old MAX(id)+1 path.
+SELECT setval('cal.companies_id_seq', GREATEST((SELECT COALESCE(MAX(id), 0) FROM cal.companies), 1),
+              (SELECT COUNT(*) > 0 FROM cal.companies));
+SELECT setval('cal.users_id_seq', GREATEST((SELECT COALESCE(MAX(id), 0) FROM cal.users), 1),
+              (SELECT COUNT(*) > 0 FROM cal.users));
+SELECT setval('cal.settings_id_seq', GREATEST((SELECT COALESCE(MAX(id), 0) FROM cal.settings), 1),
+              (SELECT COUNT(*) > 0 FROM cal.settings));
+
+ALTER TABLE cal.companies ALTER COLUMN id SET DEFAULT nextval('cal.companies_id_seq');
+ALTER TABLE cal.users ALTER COLUMN id SET DEFAULT nextval('cal.users_id_seq');
+ALTER TABLE cal.settings ALTER COLUMN id SET DEFAULT nextval('cal.settings_id_seq');
+
+GRANT USAGE ON SEQUENCE cal.companies_id_seq TO service_role;
+GRANT USAGE ON SEQUENCE cal.companies_id_seq TO authenticator;
+GRANT USAGE ON SEQUENCE cal.users_id_seq TO service_role;
+GRANT USAGE ON SEQUENCE cal.users_id_seq TO authenticator;
+GRANT USAGE ON SEQUENCE cal.settings_id_seq TO service_role;
+GRANT USAGE ON SEQUENCE cal.settings_id_seq TO authenticator;
+
+COMMIT;
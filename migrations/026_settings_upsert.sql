@@ -0,0 +1,56 @@
+-- ============================================================
+-- Migration 026: One-statement settings upsert
+-- Project: ezlmmegowggujpcnzoda (GP3 / zoda)
+-- Run in: SQL Editor → https://supabase.com/dashboard/project/ezlmmegowggujpcnzoda/sql
+--
+-- * UNIQUE (company_id, key) on cal.settings — one value per tenant key.
+--   Existing duplicates are collapsed first, keeping the most recently
+--   written row (the one _get_company_settings would have ended up with).
+-- * cal.upsert_company_settings(company_id, jsonb) — writes every key in
+--   the object with a single INSERT ... ON CONFLICT and returns the
+--   tenant's merged settings, so saving the notifications form is one
+--   round trip instead of a select + patch/insert per key.
+-- ============================================================
+
+BEGIN;
+
+DELETE FROM cal.settings s
+USING cal.settings newer
+WHERE newer.company_id = s.company_id
+  AND newer.key = s.key
+  AND (COALESCE(newer.updated_at, '-infinity'), newer.id) > (COALESCE(s.updated_at, '-infinity'), s.id);
+
+DO $$
+BEGIN
+  IF NOT EXISTS (SELECT 1 FROM pg_constraint WHERE conname = 'settings_company_id_key_key'
+                 AND conrelid = 'cal.settings'::regclass) THEN
+    ALTER TABLE cal.settings ADD CONSTRAINT settings_company_id_key_key UNIQUE (company_id, key);
+  END IF;
+END $$;
+
+CREATE OR REPLACE FUNCTION cal.upsert_company_settings(p_company_id INTEGER, p_settings JSONB)
+RETURNS JSONB
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = cal, public
+AS $$
+DECLARE
+  out JSONB;
+BEGIN
+  INSERT INTO cal.settings (company_id, key, value, updated_at)
+  SELECT p_company_id, e.key, e.value, NOW()
+  FROM jsonb_each_text(COALESCE(p_settings, '{}'::jsonb)) AS e
+  ON CONFLICT (company_id, key) DO UPDATE
+    SET value = EXCLUDED.value,
+        updated_at = EXCLUDED.updated_at;
+
+  SELECT COALESCE(jsonb_object_agg(key, value), '{}'::jsonb) INTO out
+  FROM cal.settings
+  WHERE company_id = p_company_id;
+  RETURN out;
+END;
+$$;
+
+GRANT EXECUTE ON FUNCTION cal.upsert_company_settings(INTEGER, JSONB) TO service_role;
+
+COMMIT;
@@ -0,0 +1,32 @@
+-- ============================================================
+-- Migration 027: Active tool counts per tool_type
+-- Project: ezlmmegowggujpcnzoda (GP3 / zoda)
+-- Run in: SQL Editor → https://supabase.com/dashboard/project/ezlmmegowggujpcnzoda/sql
+--
+-- The /cal/question canned intents (count by type, "how many calipers",
+-- resolving a type phrase) read every active tool's tool_type and counted
+-- in Python — truncated at PostgREST max-rows (1000) for large tenants.
+-- One GROUP BY here returns every type with its count.
+-- ============================================================
+
+BEGIN;
+
+CREATE OR REPLACE FUNCTION cal.tool_type_counts(p_company_id INTEGER)
+RETURNS JSONB
+LANGUAGE sql
+STABLE
+SECURITY DEFINER
+SET search_path = cal, public
+AS $$
+  SELECT COALESCE(jsonb_agg(jsonb_build_object('tool_type', tool_type, 'n', n) ORDER BY n DESC, tool_type), '[]'::jsonb)
+  FROM (
+    SELECT tool_type, COUNT(*) AS n
+    FROM cal.tools
+    WHERE company_id = p_company_id AND active
+    GROUP BY tool_type
+  ) g;
+$$;
+
+GRANT EXECUTE ON FUNCTION cal.tool_type_counts(INTEGER) TO service_role;
+
+COMMIT;
@@ -0,0 +1,46 @@
+-- ============================================================
+-- Migration 028: Stop reclaiming outbox rows past max_attempts
+-- Project: ezlmmegowggujpcnzoda (GP3 / zoda)
+-- Run in: SQL Editor → https://supabase.com/dashboard/project/ezlmmegowggujpcnzoda/sql
+--
+-- claim_email_outbox (migration 023) reclaimed 'sending' rows whose worker
+-- died after 10 minutes without looking at attempts, so a message that
+-- crashes the sender was retried forever, every 10 minutes. Stale rows
+-- that have used up max_attempts are now marked dead instead, and only
+-- rows with attempts left are reclaimed.
+-- ============================================================
+
+BEGIN;
+
+CREATE OR REPLACE FUNCTION cal.claim_email_outbox(p_worker TEXT, p_limit INTEGER DEFAULT 20)
+RETURNS SETOF cal.email_outbox
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = cal, public
+AS $$
+BEGIN
+  UPDATE cal.email_outbox
+  SET status = 'dead', locked_by = NULL, locked_at = NULL,
+      last_error = COALESCE(last_error || ' | ', '') || 'sender died mid-send ' || attempts || ' times — giving up'
+  WHERE status = 'sending'
+    AND locked_at < NOW() - INTERVAL '10 minutes'
+    AND attempts >= max_attempts;
+
+  RETURN QUERY
+  UPDATE cal.email_outbox o
+  SET status = 'sending', locked_by = p_worker, locked_at = NOW(), attempts = o.attempts + 1
+  WHERE o.id IN (
+    SELECT id FROM cal.email_outbox
+    WHERE (status = 'queued' AND next_attempt_at <= NOW())
+       OR (status = 'sending' AND locked_at < NOW() - INTERVAL '10 minutes' AND attempts < max_attempts)
+    ORDER BY next_attempt_at, id
+    LIMIT p_limit
+    FOR UPDATE SKIP LOCKED
+  )
+  RETURNING o.*;
+END;
+$$;
+
+GRANT EXECUTE ON FUNCTION cal.claim_email_outbox(TEXT, INTEGER) TO service_role;
+
+COMMIT;
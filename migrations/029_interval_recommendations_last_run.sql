@@ -0,0 +1,28 @@
+-- ============================================================
+-- Migration 029: Last interval_optimization run per tenant
+-- Project: ezlmmegowggujpcnzoda (GP3 / zoda)
+-- Run in: SQL Editor → https://supabase.com/dashboard/project/ezlmmegowggujpcnzoda/sql
+--
+-- interval_optimization orders tenants oldest-recommendations-first. It
+-- used to read every (company_id, computed_at) row of
+-- cal.interval_recommendations to find each tenant's latest run, which
+-- PostgREST truncates at max-rows (1000). One row per tenant here.
+-- ============================================================
+
+BEGIN;
+
+CREATE OR REPLACE FUNCTION cal.interval_recommendations_last_run()
+RETURNS TABLE (company_id INTEGER, computed_at TIMESTAMPTZ)
+LANGUAGE sql
+STABLE
+SECURITY DEFINER
+SET search_path = cal, public
+AS $$
+  SELECT r.company_id, MAX(r.computed_at)
+  FROM cal.interval_recommendations r
+  GROUP BY r.company_id;
+$$;
+
+GRANT EXECUTE ON FUNCTION cal.interval_recommendations_last_run() TO service_role;
+
+COMMIT;
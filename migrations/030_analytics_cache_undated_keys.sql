@@ -0,0 +1,18 @@
+-- ============================================================
+-- Migration 030: Drop dated analytics_cache rows
+-- Project: ezlmmegowggujpcnzoda (GP3 / zoda)
+-- Run in: SQL Editor → https://supabase.com/dashboard/project/ezlmmegowggujpcnzoda/sql
+--
+-- cost_projection and seasonal used to put today's date in params_key,
+-- leaving one row per tenant per report per day that nothing deleted.
+-- The backend now keeps one row per params and treats a result computed
+-- on an earlier day (computed_at) as stale, so the dated rows are dead.
+-- ============================================================
+
+BEGIN;
+
+DELETE FROM cal.analytics_cache
+WHERE report IN ('cost_projection', 'seasonal')
+  AND params_key LIKE '%"as_of":%';
+
+COMMIT;
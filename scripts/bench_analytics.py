@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""Benchmark the NumPy analytics core against the former pure-Python loops.
+
+Generates a synthetic calibration history (default 120k records over 6k tools),
+runs interval variance and failure rates both ways, checks the outputs agree,
+and prints timings.
+
+    python scripts/bench_analytics.py [--records 120000] [--tools 6000] [--repeat 3]
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "backend"))
+
+from analytics_core import CalibrationHistory, interval_variance, failure_rates  # noqa: E402
+
+TOOL_TYPES = ["Micrometer", "Caliper", "Snap Gage", "Gaussmeter", "Height Gage", "Pin Gage",
+              "Torque Wrench", "Thread Gage", "Indicator", "Scale"]
+
+
+def synth(n_records: int, n_tools: int, seed: int = 7):
+    rnd = random.Random(seed)
+    tools = [
+        {"id": i + 1, "tool_type": rnd.choice(TOOL_TYPES), "cal_interval_days": rnd.choice([90, 180, 365, None])}
+        for i in range(n_tools)
+    ]
+    start = date(2015, 1, 1)
+    cals = []
+    for _ in range(n_records):
+        t = rnd.randrange(n_tools) + 1
+        d = start + timedelta(days=rnd.randrange(3650))
+        cals.append({
+            "tool_id": t,
+            "calibration_date": d.isoformat() + "T00:00:00+00:00",
+            "result": rnd.choices(["pass", "fail", "out_of_tolerance", "conditional"], [90, 4, 4, 2])[0],
+        })
+    cals.sort(key=lambda c: (c["tool_id"], c["calibration_date"]))
+    return tools, cals
+
+
+# ── former main.py loops (before the SQL RPCs), minus the DB fetches ─────────
+
+def legacy_failure_rates(tools, cals):
+    tool_map = {t["id"]: t.get("tool_type", "Unknown") for t in tools}
+    by_type: dict = {}
+    for c in cals:
+        tt = tool_map.get(c["tool_id"], "Unknown")
+        by_type.setdefault(tt, {"total": 0, "failures": 0})
+        by_type[tt]["total"] += 1
+        if c.get("result") in ("fail", "out_of_tolerance"):
+            by_type[tt]["failures"] += 1
+    result = []
+    for tt, counts in by_type.items():
+        if counts["total"] < 3:
+            continue
+        pct = round(counts["failures"] * 100.0 / counts["total"], 1)
+        result.append({"tool_type": tt, "total": counts["total"],
+                       "failures": counts["failures"], "failure_pct": pct, "flagged": pct > 10})
+    return sorted(result, key=lambda x: (-x["failure_pct"], x["tool_type"]))
+
+
+def legacy_interval_variance(tools, cals):
+    tool_map = {t["id"]: t for t in tools}
+    by_tool: dict = {}
+    for c in cals:
+        tid = c["tool_id"]
+        if not c.get("calibration_date"):
+            continue
+        by_tool.setdefault(tid, []).append(c["calibration_date"][:10])
+    type_intervals: dict = {}
+    for tid, dates in by_tool.items():
+        if len(dates) < 2:
+            continue
+        tool = tool_map.get(tid, {})
+        tt = tool.get("tool_type", "Unknown")
+        planned = tool.get("cal_interval_days")
+        if not planned:
+            continue
+        for i in range(1, len(dates)):
+            try:
+                diff = (date.fromisoformat(dates[i]) - date.fromisoformat(dates[i-1])).days
+                if diff > 0:
+                    type_intervals.setdefault(tt, {"diffs": [], "planned": planned})["diffs"].append(diff)
+            except Exception:
+                pass
+    result = []
+    for tt, data in type_intervals.items():
+        if not data["diffs"]:
+            continue
+        avg_actual = round(sum(data["diffs"]) / len(data["diffs"]))
+        planned = data["planned"]
+        ratio = avg_actual / planned if planned else 1
+        flag = "over-calibrating (cost waste)" if ratio < 0.8 else \
+               "under-calibrating (compliance risk)" if ratio > 1.2 else "on target"
+        result.append({
+            "tool_type": tt, "planned_days": planned, "avg_actual_days": avg_actual,
+            "ratio": round(ratio, 2), "sample_size": len(data["diffs"]), "flag": flag,
+        })
+    return sorted(result, key=lambda x: (x["ratio"], x["tool_type"]))
+
+
+def best_of(fn, repeat):
+    best, out = float("inf"), None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        out = fn()
+        best = min(best, time.perf_counter() - t0)
+    return best, out
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--records", type=int, default=120_000)
+    ap.add_argument("--tools", type=int, default=6_000)
+    ap.add_argument("--repeat", type=int, default=3)
+    args = ap.parse_args()
+
+    tools, cals = synth(args.records, args.tools)
+    print(f"{len(cals):,} calibration records over {len(tools):,} tools (best of {args.repeat})\n")
+
+    t_load, hist = best_of(lambda: CalibrationHistory.from_rows(cals, tools), args.repeat)
+    rows = [
+        ("failure rates", lambda: legacy_failure_rates(tools, cals), lambda: failure_rates(hist)),
+        ("interval variance", lambda: legacy_interval_variance(tools, cals), lambda: interval_variance(hist)),
+    ]
+    print(f"{'report':<20}{'python':>12}{'numpy':>12}{'speedup':>10}   match")
+    for name, legacy, vectorized in rows:
+        t_py, out_py = best_of(legacy, args.repeat)
+        t_np, out_np = best_of(vectorized, args.repeat)
+        print(f"{name:<20}{t_py * 1000:>10.1f}ms{t_np * 1000:>10.1f}ms{t_py / t_np:>9.1f}x   {out_py == out_np}")
+    print(f"\ncolumnar load (rows -> arrays, once per history): {t_load * 1000:.1f}ms")
+
+
+if __name__ == "__main__":
+    main()
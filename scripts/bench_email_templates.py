@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+"""Benchmark email_templates.py against the former inline rendering in main.py.
+
+Renders the overdue enforcement email for a synthetic tool list (default
+1,000 tools) both ways — `+=` row concatenation plus f-string body and
+signature, versus render_tool_table + overdue_body with the cached
+signature — checks the HTML is identical, and prints timings for every case. Also times the per-email branding/signature
+cost: re-reading and regex-parsing the tenant kernel versus the cached path
+(two os.stat calls + reuse). The `companies` round trip the cache also
+skips is not included.
+
+    python scripts/bench_email_templates.py [--tools 1000] [--tenants 50] [--repeat 5]
+"""
+
+import argparse
+import os
+import random
+import re
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "backend"))
+
+from email_templates import overdue_body, render_signature, render_tool_table  # noqa: E402
+
+TOOL_TYPES = ["Micrometer", "Caliper", "Snap Gage", "Gaussmeter", "Height Gage", "Pin Gage"]
+VENDORS = ["Internal", "Transcat", "Tektronix Service", "Mitutoyo America", ""]
+
+BRANDING = {
+    "company_name": "Acme Precision", "slug": "acme", "primary_color": "#003366",
+    "accent_color": "#CC0000", "font": "Helvetica",
+    "address_lines": ["100 Industrial Pkwy", "Dayton, OH 45402"],
+    "phone": "937-555-0100", "web": "acme-precision.example",
+}
+
+
+def synth(n_tools: int, seed: int = 11):
+    rnd = random.Random(seed)
+    today = date(2026, 1, 15)
+    return [{
+        "id": i + 1,
+        "asset_tag": f"GP-{i + 1:05d}",
+        "tool_name": f"{rnd.choice(TOOL_TYPES)} {rnd.randrange(1, 50)}in",
+        "tool_type": rnd.choice(TOOL_TYPES),
+        "calibrating_entity": rnd.choice(VENDORS),
+        "next_due_date": (today - timedelta(days=rnd.randrange(1, 400))).isoformat() + "T00:00:00+00:00",
+    } for i in range(n_tools)]
+
+
+# ── former main.py rendering ────────────────────────────────────────────────
+
+def legacy_tool_table(tools):
+    rows = ""
+    for t in tools:
+        ndd = t.get("next_due_date") or t.get("next_calibration_date") or "N/A"
+        if isinstance(ndd, str) and len(ndd) > 10:
+            ndd = ndd[:10]
+        rows += f"<tr><td>{t.get('asset_tag','')}</td><td>{t.get('tool_name','')}</td><td>{t.get('tool_type','')}</td><td>{t.get('calibrating_entity','')}</td><td>{ndd}</td></tr>\n"
+    return f"""<table border="1" cellpadding="6" cellspacing="0" style="border-collapse:collapse;font-family:Helvetica,sans-serif;font-size:13px;">
+<tr style="background:#003366;color:white;"><th>Asset Tag</th><th>Tool Name</th><th>Type</th><th>Calibrating Entity</th><th>Due Date</th></tr>
+{rows}</table>"""
+
+
+def legacy_signature(branding):
+    co_name = branding.get("company_name", "Calibration Agent")
+    primary = branding.get("primary_color", "#003366")
+    accent = branding.get("accent_color", "#CC0000")
+    font = branding.get("font", "Helvetica")
+    phone = branding.get("phone", "")
+    web = branding.get("web", "")
+    address_lines = branding.get("address_lines", [])
+
+    address_html = "<br>".join(address_lines) if address_lines else ""
+    phone_html = f'<br>Phone: <a href="tel:{phone}" style="color:{primary};text-decoration:none;">{phone}</a>' if phone else ""
+    web_html = f'<br><a href="https://{web}" style="color:{primary};text-decoration:none;">{web}</a>' if web else ""
+
+    return f"""
+<div style="margin-top:32px;padding-top:16px;border-top:2px solid {primary};font-family:{font},Arial,sans-serif;">
+  <table cellpadding="0" cellspacing="0" border="0" style="font-size:13px;color:#333;">
+    <tr>
+      <td style="padding-right:16px;border-right:3px solid {accent};">
+        <strong style="font-size:15px;color:{primary};">Cal</strong>
+        <br><span style="font-size:11px;color:#666;">AI Calibration Agent</span>
+      </td>
+      <td style="padding-left:16px;">
+        <strong style="color:{primary};">{co_name}</strong>
+        <br><span style="font-size:12px;color:#555;">{address_html}</span>
+        {phone_html}
+        {web_html}
+      </td>
+    </tr>
+  </table>
+  <p style="font-size:10px;color:#999;margin-top:12px;line-height:1.4;">
+    This message was generated by Cal, an AI-powered calibration management agent
+    operated by {co_name} Quality Department.
+    For questions or corrections, contact your Quality Manager directly.
+  </p>
+  <p style="font-size:9px;color:#b0b0b0;margin-top:8px;line-height:1.3;font-style:italic;">
+    Cal is currently in supervised evaluation. Information provided is generated from
+    calibration records and should be independently verified against your quality
+    management system prior to taking action. {co_name} Quality Department maintains
+    full authority over all calibration decisions and compliance determinations.
+  </p>
+</div>
+"""
+
+
+def legacy_overdue(tools, branding):
+    table_html = legacy_tool_table(tools)
+    signature = legacy_signature(branding)
+    return f"""<div style="font-family:Helvetica,sans-serif;">
+<h2 style="color:#CC0000;">[ACTION REQUIRED] {len(tools)} Overdue Calibrations</h2>
+<p>The following tools have <strong>expired calibrations</strong> and must be <strong>removed from service immediately</strong> per ISO 9001 and company policy.</p>
+{table_html}
+<p style="margin-top:16px;"><strong>Required actions:</strong></p>
+<ul>
+<li>Remove all listed tools from service NOW</li>
+<li>Tag with red "OUT OF CALIBRATION" labels</li>
+<li>Schedule calibration with approved vendor immediately</li>
+<li>Document removal in quality records</li>
+</ul>
+{signature}
+</div>"""
+
+
+def templated_overdue(tools, signature):
+    return overdue_body(len(tools), render_tool_table(tools), signature)
+
+
+KERNEL = """# Tenant kernel
+
+### 品牌标识
+
+```
+primary_color := "#003366"
+accent_color := "#CC0000"
+font := "Helvetica"
+line1 := "100 Industrial Pkwy"
+line2 := "Dayton, OH 45402"
+phone := "937-555-0100"
+web := "acme-precision.example"
+```
+""" + "\n".join(f"- procedure {i}: lorem ipsum dolor sit amet" for i in range(400))
+
+
+def legacy_branding_signature(kernel_path):
+    """Former per-email path: read kernel, regex the branding block, render."""
+    branding = {"company_name": "Acme Precision", "slug": "acme", "primary_color": "#003366",
+                "accent_color": "#CC0000", "font": "Helvetica", "address_lines": [], "phone": "", "web": ""}
+    block = re.search(r'### 品牌[标標][识識].*?```(.*?)```', open(kernel_path, encoding="utf-8").read(), re.DOTALL).group(1)
+    for line in block.strip().split("\n"):
+        key, val = line.split(":=", 1)
+        key, val = key.strip(), val.strip().strip('"')
+        if key in ("line1", "line2", "line3"):
+            branding["address_lines"].append(val)
+        elif key in ("primary_color", "accent_color", "font", "phone", "web"):
+            branding[key] = val
+    return legacy_signature(branding)
+
+
+def cached_branding_signature(kernel_path, upload_dir, entry):
+    """Cached path: validate the stamp, reuse the rendered signature."""
+    stamp = (os.stat(kernel_path).st_mtime_ns, os.stat(upload_dir).st_mtime_ns)
+    if entry["stamp"] != stamp:
+        raise RuntimeError("stamp changed")
+    return entry["signature"]
+
+
+def best_of(fn, repeat):
+    best, out = float("inf"), None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        out = fn()
+        best = min(best, time.perf_counter() - t0)
+    return best, out
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--tools", type=int, default=1_000)
+    ap.add_argument("--tenants", type=int, default=50, help="emails per run for the signature-reuse case")
+    ap.add_argument("--repeat", type=int, default=5)
+    args = ap.parse_args()
+
+    tools = synth(args.tools)
+    print(f"overdue email with {len(tools):,} tools (best of {args.repeat})\n")
+
+    signature = render_signature(BRANDING)
+    cases = [
+        ("tool table", lambda: legacy_tool_table(tools), lambda: render_tool_table(tools)),
+        ("signature", lambda: legacy_signature(BRANDING), lambda: render_signature(BRANDING)),
+        ("overdue body", lambda: legacy_overdue(tools, BRANDING), lambda: templated_overdue(tools, signature)),
+        (f"{args.tenants} small emails",
+         lambda: [legacy_overdue(tools[:5], BRANDING) for _ in range(args.tenants)],
+         lambda: [templated_overdue(tools[:5], signature) for _ in range(args.tenants)]),
+    ]
+    tmp = tempfile.mkdtemp()
+    kernel_path = os.path.join(tmp, "acme.ttc.md")
+    with open(kernel_path, "w", encoding="utf-8") as f:
+        f.write(KERNEL)
+    entry = {"stamp": (os.stat(kernel_path).st_mtime_ns, os.stat(tmp).st_mtime_ns),
+             "signature": legacy_branding_signature(kernel_path)}
+    cases.append((f"{args.tenants}x branding+sig",
+                  lambda: [legacy_branding_signature(kernel_path) for _ in range(args.tenants)],
+                  lambda: [cached_branding_signature(kernel_path, tmp, entry) for _ in range(args.tenants)]))
+
+    print(f"{'render':<20}{'inline':>12}{'module':>12}{'speedup':>10}   match")
+    for name, legacy, templated in cases:
+        t_old, out_old = best_of(legacy, args.repeat)
+        t_new, out_new = best_of(templated, args.repeat)
+        print(f"{name:<20}{t_old * 1000:>10.3f}ms{t_new * 1000:>10.3f}ms{t_old / t_new:>9.1f}x   {out_old == out_new}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""Compare conversation-memory prompt size: top-20 by used_count vs BM25 retrieval.
+
+Builds a synthetic tenant memory (default 2,000 past Q&As over a thousand
+tools), then for a set of fresh questions prints the estimated prompt tokens
+each strategy injects, the share of injected memories that mention the
+question's subject (asset tag or tool type), and the per-question
+retrieval time. Also times
+incremental upserts against a full rebuild.
+
+    python scripts/bench_memory_index.py [--memories 2000] [--questions 200]
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "backend"))
+
+from memory_index import MemoryIndex, estimate_tokens  # noqa: E402
+
+TOOL_TYPES = ["Micrometer", "Caliper", "Snap Gage", "Gaussmeter", "Height Gage", "Pin Gage", "Torque Wrench"]
+VENDORS = ["Transcat", "Tektronix Service", "Mitutoyo America", "In-House"]
+TEMPLATES = [
+    ("When is {tag} due for calibration?", "{tag} ({type}) is due on 2026-{m:02d}-{d:02d}."),
+    ("Who calibrates {tag}?", "{tag} is calibrated by {vendor}."),
+    ("How many {type}s are overdue?", "You have {n} overdue {type}s."),
+    ("What was the last calibration result for {tag}?", "{tag} passed on 2025-{m:02d}-{d:02d}, cert C-{n}{d}."),
+    ("List {type}s due this month", "{n} {type}s are due this month, including {tag}."),
+]
+
+
+def synth(n_memories: int, n_tools: int = 1_000, seed: int = 5):
+    rnd = random.Random(seed)
+    tools = [(f"GP-{i:05d}", rnd.choice(TOOL_TYPES)) for i in range(1, n_tools + 1)]
+    rows = {}
+    while len(rows) < n_memories:
+        tag, ttype = rnd.choice(tools)
+        q, a = rnd.choice(TEMPLATES)
+        kw = dict(tag=tag, type=ttype, vendor=rnd.choice(VENDORS), n=rnd.randrange(1, 40),
+                  m=rnd.randrange(1, 13), d=rnd.randrange(1, 29))
+        rows[q.format(**kw).lower()] = {"question": q.format(**kw), "answer": a.format(**kw),
+                                         "feedback": None, "used_count": rnd.randrange(1, 30)}
+    return tools, list(rows.values())
+
+
+def render(m):
+    return f"Previous Q: {m['question']}\nA: {m['answer']}"
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--memories", type=int, default=2_000)
+    ap.add_argument("--questions", type=int, default=200)
+    args = ap.parse_args()
+
+    tools, rows = synth(args.memories)
+    rnd = random.Random(99)
+    questions = []
+    for _ in range(args.questions):
+        tag, ttype = rnd.choice(tools)
+        q, _ = rnd.choice(TEMPLATES)
+        subject = tag if "{tag}" in q else ttype
+        questions.append((q.format(tag=tag, type=ttype, vendor="", n=0, m=1, d=1), subject.lower()))
+
+    t0 = time.perf_counter()
+    index = MemoryIndex()
+    for r in rows:
+        index.upsert(r["question"], r["answer"], r["feedback"], r["used_count"])
+    build = time.perf_counter() - t0
+
+    top20 = sorted(rows, key=lambda r: -r["used_count"])[:20]
+    legacy_ctx = "\n".join(render(m) for m in top20)
+    legacy_tokens = estimate_tokens(legacy_ctx)
+    legacy_rel = sum(sum(tag in render(m).lower() for m in top20) / 20 for _, tag in questions) / len(questions)
+
+    tokens, rel, t_search = 0, 0.0, 0.0
+    for q, tag in questions:
+        t0 = time.perf_counter()
+        hits = index.search(q)
+        t_search += time.perf_counter() - t0
+        ctx = "\n".join(m.render() for m in hits)
+        tokens += estimate_tokens(ctx) if ctx else 0
+        rel += (sum(tag in m.render().lower() for m in hits) / len(hits)) if hits else 0
+    n = len(questions)
+
+    t0 = time.perf_counter()
+    for r in rows[:100]:
+        index.upsert(r["question"], r["answer"] + " (updated)", None, r["used_count"] + 1)
+    upsert = (time.perf_counter() - t0) / 100
+
+    print(f"{len(rows):,} memories, {n} questions\n")
+    print(f"{'strategy':<22}{'tokens/q':>10}{'relevant':>10}")
+    print(f"{'top-20 by used_count':<22}{legacy_tokens:>10}{legacy_rel:>9.0%}")
+    print(f"{'BM25 top-6 / 1200':<22}{tokens / n:>10.0f}{rel / n:>9.0%}")
+    print(f"\nfull build {build * 1000:.1f}ms, incremental upsert {upsert * 1e6:.0f}us, search {t_search / n * 1e6:.0f}us/q")
+
+
+if __name__ == "__main__":
+    main()